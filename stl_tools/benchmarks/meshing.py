@@ -0,0 +1,216 @@
+"""
+mesh generation benchmark: python -m stl_tools.benchmarks.meshing
+
+synthetic height maps of several patterns and sizes go through every engine of both pipelines,
+each run in a fresh process; triangles per second, peak rss and bytes written are appended to a
+json history, and every engine's facets are compared to the first engine of its pipeline. The
+memory meshing adds to the process is compared too: the indexed engines must stay below the
+vectorized engine of their pipeline on images of at least MEMORY_CHECK_MIN_SIZE pixels
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    # not available on windows, peak rss is not recorded there
+    resource = None
+
+PATTERNS = ('noise', 'checkerboard', 'gradient', 'logo')
+SIZES = (256, 512, 1024, 2048, 4096, 8192)
+
+# (engine, engine it must use less memory than); below the minimum size the interpreter dominates the rss
+LEANER_THAN = (('indexed', 'vectorized'),)
+MEMORY_CHECK_MIN_SIZE = 1024
+
+# (method, keyword arguments) per engine, the first engine of a pipeline is the one the others must match
+ENGINES = {
+    'square': {
+        'vectorized': ('make_stl', {}),
+        'reference': ('make_stl_reference', {}),
+        'streaming': ('make_stl_streaming', {}),
+        'indexed': ('make_stl_indexed', {}),
+        'parallel': ('make_stl', {'workers': os.cpu_count()}),
+    },
+    'round': {
+        'vectorized': ('make_stl', {}),
+        'reference': ('make_stl_reference', {}),
+        'streaming': ('make_stl_streaming', {}),
+        'indexed': ('make_stl_indexed', {}),
+        'parallel': ('make_stl', {'workers': os.cpu_count()}),
+    },
+}
+
+
+def height_map(pattern, size, seed=0):
+    """synthetic (size, size) uint8 height map"""
+    y, x = np.mgrid[0:size, 0:size]
+    if pattern == 'noise':
+        return np.random.default_rng(seed).integers(0, 256, (size, size), dtype=np.uint8)
+    if pattern == 'checkerboard':
+        square = max(1, size // 16)
+        return np.where((x // square + y // square) % 2 == 0, 255, 0).astype(np.uint8)
+    if pattern == 'gradient':
+        return ((x + y) * 255 // (2 * size - 2)).astype(np.uint8)
+    if pattern == 'logo':
+        # disc with a ring and a bar, flat everywhere else
+        rad = np.hypot(x - size / 2.0, y - size / 2.0) / size
+        logo = np.zeros((size, size), dtype=np.uint8)
+        logo[rad < 0.45] = 80
+        logo[(rad > 0.3) & (rad < 0.38)] = 255
+        logo[(rad < 0.3) & (np.abs(y - size / 2.0) < size * 0.05)] = 180
+        return logo
+    raise ValueError('unknown pattern {!r}, expected one of {}'.format(pattern, ', '.join(PATTERNS)))
+
+
+def peak_rss_bytes():
+    """peak resident set size of this process and its finished children"""
+    if resource is None:
+        return None
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return scale * max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                       resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def facet_digest(stl_path, chunk_size=1 << 20):
+    """triangle count and sha256 of the facet vertices of a binary stl (header and normals ignored)"""
+    from stl_tools import stl_io
+
+    data = stl_io.read_facets(stl_path)
+    digest = hashlib.sha256()
+    for start in range(0, len(data), chunk_size):
+        digest.update(np.ascontiguousarray(data['vectors'][start:start + chunk_size]).tobytes())
+    return len(data), digest.hexdigest()
+
+
+def run_engine(shape, img_path, method, kwargs, width_mm, depth_mm):
+    """worker: one engine on one image, in a process of its own so peak rss is its own"""
+    from stl_tools import stl_tools, stl_tools_2
+
+    start = time.perf_counter()
+    if shape == 'round':
+        group = stl_tools_2.PixelGroup(img_path, width_mm, depth_mm)
+    else:
+        group = stl_tools.PixelGroup(img_path, emboss_width_mm=width_mm, emboss_depth_mm=depth_mm)
+    loaded_rss = peak_rss_bytes()
+    getattr(group, method)(**kwargs)
+    seconds = time.perf_counter() - start
+    peak_rss = peak_rss_bytes()
+
+    triangles, digest = facet_digest(group.output_stl_path)
+    return {
+        'seconds': seconds,
+        'triangles': triangles,
+        'triangles_per_second': triangles / seconds if seconds else None,
+        'peak_rss_bytes': peak_rss,
+        # what meshing and saving add on top of the loaded image
+        'mesh_rss_bytes': None if peak_rss is None else peak_rss - loaded_rss,
+        'bytes_written': os.path.getsize(group.output_stl_path),
+        'digest': digest,
+    }
+
+
+def run(patterns, sizes, shapes, engines, reference_max_size=256, width_mm=100.0, depth_mm=5.0):
+    """list of result records, one per pattern, size, shape and engine"""
+    context = multiprocessing.get_context('spawn')
+    records = []
+    with tempfile.TemporaryDirectory() as directory:
+        for pattern in patterns:
+            for size in sizes:
+                img_path = os.path.join(directory, '{}_{}.png'.format(pattern, size))
+                Image.fromarray(height_map(pattern, size)).save(img_path)
+
+                for shape in shapes:
+                    expected, by_engine = None, {}
+                    for engine, (method, kwargs) in ENGINES[shape].items():
+                        if engine not in engines or (engine == 'reference' and size > reference_max_size):
+                            continue
+                        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                            result = executor.submit(run_engine, shape, img_path, method, kwargs,
+                                                     width_mm, depth_mm).result()
+
+                        digest = result.pop('digest')
+                        if expected is None:
+                            expected = digest
+                        record = dict(result, pattern=pattern, size=size, shape=shape, engine=engine,
+                                      equivalent=digest == expected, lean=True)
+                        records.append(record)
+                        by_engine[engine] = record
+                        print('{pattern} {size} {shape} {engine}: {triangles} triangles in {seconds:.2f} s, '
+                              '{triangles_per_second:.0f} triangles/s, peak rss {rss} ({mesh_rss} meshing), '
+                              '{bytes_written} bytes{flag}'
+                              .format(rss=_megabytes(record['peak_rss_bytes']),
+                                      mesh_rss=_megabytes(record['mesh_rss_bytes']),
+                                      flag='' if record['equivalent'] else ', OUTPUT DIFFERS', **record))
+
+                    if size >= MEMORY_CHECK_MIN_SIZE:
+                        check_memory(by_engine)
+    return records
+
+
+def check_memory(by_engine):
+    """clear the lean flag of engines that use more meshing memory than the engine they must beat"""
+    for engine, other in LEANER_THAN:
+        record, other_record = by_engine.get(engine), by_engine.get(other)
+        if record is None or other_record is None or record['mesh_rss_bytes'] is None:
+            continue
+        if record['mesh_rss_bytes'] >= other_record['mesh_rss_bytes']:
+            record['lean'] = False
+            print('{pattern} {size} {shape} {engine}: meshing takes {rss}, not less than the {other} engine\'s {other_rss}'
+                  .format(rss=_megabytes(record['mesh_rss_bytes']), other=other,
+                          other_rss=_megabytes(other_record['mesh_rss_bytes']), **record))
+
+
+def _megabytes(n_bytes):
+    return 'n/a' if n_bytes is None else '{:.0f} MB'.format(n_bytes / 1e6)
+
+
+def append_history(history_path, records):
+    """add a timestamped run to the json history file"""
+    history = []
+    if os.path.exists(history_path):
+        with open(history_path) as fh:
+            history = json.load(fh)
+    history.append({'timestamp': datetime.datetime.now().isoformat(timespec='seconds'), 'results': records})
+    with open(history_path, 'w') as fh:
+        json.dump(history, fh, indent=1)
+
+
+def main(argv=None):
+    all_engines = sorted(set(engine for engines in ENGINES.values() for engine in engines))
+    parser = argparse.ArgumentParser(prog='python -m stl_tools.benchmarks.meshing', description=__doc__)
+    parser.add_argument('--patterns', nargs='+', choices=PATTERNS, default=list(PATTERNS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[256, 1024],
+                        help='image sizes in pixels, up to {} (default: %(default)s)'.format(SIZES[-1]))
+    parser.add_argument('--shapes', nargs='+', choices=sorted(ENGINES), default=sorted(ENGINES))
+    parser.add_argument('--engines', nargs='+', choices=all_engines, default=all_engines)
+    parser.add_argument('--reference-max-size', type=int, default=256,
+                        help='largest size for the slow reference engines (default: %(default)s)')
+    parser.add_argument('--history', default='benchmark_history.json', help='json history file (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    records = run(args.patterns, args.sizes, args.shapes, args.engines, args.reference_max_size)
+    append_history(args.history, records)
+
+    differing = [record for record in records if not record['equivalent']]
+    for record in differing:
+        print('output differs: {pattern} {size} {shape} {engine}'.format(**record))
+    heavy = [record for record in records if not record['lean']]
+    for record in heavy:
+        print('memory regression: {pattern} {size} {shape} {engine}'.format(**record))
+    return 1 if differing or heavy else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
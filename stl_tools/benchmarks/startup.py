@@ -0,0 +1,122 @@
+"""
+import-time / startup benchmark: python -m stl_tools.benchmarks.startup
+
+every module is imported in a fresh interpreter, which then builds one PixelGroup; the run fails
+(exit code 1) when an optional heavy module gets imported, the image viewer is opened, or a
+median time (import, PixelGroup startup, whole process) regresses past the baseline
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MODULES = ('stl_tools.stl_tools', 'stl_tools.stl_tools_2', 'stl_tools.cli')
+
+# only needed for show_render or the examples, must never be imported on the conversion path
+FORBIDDEN_MODULES = ('matplotlib', 'mpl_toolkits', 'pandas')
+
+# timings compared against the baseline, and the slowdown below which any ratio counts as timer noise
+COMPARED_TIMINGS = ('import_seconds', 'startup_seconds', 'process_seconds')
+NOISE_SECONDS = 0.005
+
+SAMPLE_IMAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pics', 'mg_logo.gif')
+
+CHILD_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import {module} as module
+import_seconds = time.perf_counter() - start
+
+from PIL import Image
+previews = []
+Image.Image.show = lambda self, *args, **kwargs: previews.append(1)
+
+start = time.perf_counter()
+if hasattr(module, 'PixelGroup'):
+    if module.__name__.endswith('_2'):
+        module.PixelGroup({image!r}, 100, 5)
+    else:
+        module.PixelGroup({image!r})
+startup_seconds = time.perf_counter() - start
+
+print(json.dumps({{
+    'import_seconds': import_seconds,
+    'startup_seconds': startup_seconds,
+    'previews': len(previews),
+    'forbidden': sorted(name for name in {forbidden!r} if name in sys.modules),
+}}))
+'''
+
+
+def measure(module, repeat=5, image=SAMPLE_IMAGE):
+    """median timings of repeat fresh interpreters importing module, see CHILD_SCRIPT"""
+    runs = []
+    for _ in range(repeat):
+        script = CHILD_SCRIPT.format(module=module, image=image, forbidden=FORBIDDEN_MODULES)
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', script], check=True, capture_output=True, text=True)
+        run = json.loads(result.stdout.strip().splitlines()[-1])
+        run['process_seconds'] = time.perf_counter() - start
+        runs.append(run)
+
+    return {
+        'import_seconds': statistics.median(run['import_seconds'] for run in runs),
+        'startup_seconds': statistics.median(run['startup_seconds'] for run in runs),
+        'process_seconds': statistics.median(run['process_seconds'] for run in runs),
+        'previews': max(run['previews'] for run in runs),
+        'forbidden': sorted(set(name for run in runs for name in run['forbidden'])),
+    }
+
+
+def problems(module, result, baseline=None, tolerance=0.25):
+    """
+    list of regressions of one module's result, a timing regresses when it exceeds the baseline
+    by more than the tolerance (a ratio) and by more than NOISE_SECONDS
+    """
+    found = []
+    if result['forbidden']:
+        found.append('{} imports {}'.format(module, ', '.join(result['forbidden'])))
+    if result['previews']:
+        found.append('{} opens an image preview by default'.format(module))
+    if baseline is not None and module in baseline:
+        for name in COMPARED_TIMINGS:
+            limit = max(baseline[module][name] * (1 + tolerance), baseline[module][name] + NOISE_SECONDS)
+            if result[name] > limit:
+                found.append('{} {} {:.3f} s > {:.3f} s'.format(module, name, result[name], limit))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m stl_tools.benchmarks.startup', description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5, help='interpreters per module (default: %(default)s)')
+    parser.add_argument('--baseline', help='json file with earlier results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown (default: %(default)s)')
+    parser.add_argument('--update', action='store_true', help='write the results to the baseline file')
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline is not None and os.path.exists(args.baseline) and not args.update:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+
+    results, found = {}, []
+    for module in MODULES:
+        results[module] = result = measure(module, args.repeat)
+        print('{}: import {:.3f} s, startup {:.3f} s, process {:.3f} s'.format(
+            module, result['import_seconds'], result['startup_seconds'], result['process_seconds']))
+        found.extend(problems(module, result, baseline, args.tolerance))
+
+    if args.update and args.baseline is not None:
+        with open(args.baseline, 'w') as fh:
+            json.dump(results, fh, indent=1, sort_keys=True)
+
+    for problem in found:
+        print('regression: ' + problem)
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
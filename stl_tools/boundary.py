@@ -0,0 +1,97 @@
+"""boundary (open edge) extraction for meshes built on a grid of cells"""
+import numpy as np
+
+# directed edge directions on the vertex grid: +x, +y, -x, -y (image coordinates, y down)
+DIRECTION_STEPS = np.array([(1, 0), (0, 1), (-1, 0), (0, -1)])
+
+
+def boundary_edges(cell_mask):
+    """
+    directed open edges of the cells in cell_mask [y, x], as arrays start_x, start_y, direction
+
+    cell (x, y) spans the grid vertices x..x+1, y..y+1, and every open edge is oriented so that
+    its cell lies on the left, which makes the edges of one boundary loop head-to-tail
+    """
+    mask = np.pad(np.asarray(cell_mask, dtype=bool), 1)
+    inside = mask[1:-1, 1:-1]
+
+    # (neighbor outside, start corner offset, direction) per side of a cell
+    sides = [
+        (~mask[:-2, 1:-1], (1, 0), 2),   # top: (x+1, y) -> (x, y)
+        (~mask[1:-1, :-2], (0, 0), 1),   # left: (x, y) -> (x, y+1)
+        (~mask[2:, 1:-1], (0, 1), 0),    # bottom: (x, y+1) -> (x+1, y+1)
+        (~mask[1:-1, 2:], (1, 1), 3),    # right: (x+1, y+1) -> (x+1, y)
+    ]
+
+    start_x, start_y, direction = [], [], []
+    for neighbor_outside, (offset_x, offset_y), side_direction in sides:
+        y, x = np.nonzero(inside & neighbor_outside)
+        start_x.append(x + offset_x)
+        start_y.append(y + offset_y)
+        direction.append(np.full(len(x), side_direction))
+
+    return np.concatenate(start_x), np.concatenate(start_y), np.concatenate(direction)
+
+
+def boundary_rings(cell_mask):
+    """
+    all boundary loops of cell_mask, each an ordered (n, 2) array of (x, y) grid vertices
+
+    edges are chained through a sorted (start vertex, direction) key table; where two loops
+    touch at a single vertex the left turn is taken, so every returned loop is simple
+    """
+    height, width = np.shape(cell_mask)
+    start_x, start_y, direction = boundary_edges(cell_mask)
+    if len(direction) == 0:
+        return []
+
+    keys = (start_y * (width + 1) + start_x) * 4 + direction
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+
+    end_x = start_x + DIRECTION_STEPS[direction, 0]
+    end_y = start_y + DIRECTION_STEPS[direction, 1]
+    end_vertex = end_y * (width + 1) + end_x
+
+    # next edge: prefer a left turn, then straight on, then a right turn
+    next_edge = np.full(len(keys), -1)
+    for turn in (-1, 0, 1):
+        candidate = end_vertex * 4 + (direction + turn) % 4
+        position = np.minimum(np.searchsorted(sorted_keys, candidate), len(keys) - 1)
+        found = (sorted_keys[position] == candidate) & (next_edge < 0)
+        next_edge[found] = order[position[found]]
+
+    # walk the loops, each starting at its lowest key so the result is deterministic
+    rings = []
+    visited = np.zeros(len(keys), dtype=bool)
+    for first in order:
+        if visited[first]:
+            continue
+        loop = []
+        edge = first
+        while not visited[edge]:
+            visited[edge] = True
+            loop.append(edge)
+            edge = next_edge[edge]
+        loop = np.array(loop)
+        rings.append(np.stack([start_x[loop], start_y[loop]], axis=1))
+
+    return rings
+
+
+def boundary_ring(cell_mask):
+    """longest boundary loop of cell_mask as an ordered (n, 2) array of (x, y) grid vertices"""
+    rings = boundary_rings(cell_mask)
+    if not rings:
+        return np.zeros((0, 2), dtype=int)
+    return max(rings, key=len)
+
+
+def ring_edge_cells(ring):
+    """(x, y) of the cell on the inner side of each ring edge ring[i] -> ring[i + 1]"""
+    step = np.roll(ring, -1, axis=0) - ring
+    direction = np.argmax((step[:, None, :] == DIRECTION_STEPS[None, :, :]).all(axis=2), axis=1)
+
+    # cell offset from the edge start, per direction (see boundary_edges)
+    cell_offsets = np.array([(0, -1), (0, 0), (-1, 0), (-1, -1)])
+    return ring + cell_offsets[direction]
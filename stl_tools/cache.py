@@ -0,0 +1,164 @@
+"""content-addressed on-disk cache of generated meshes, with least-recently-used eviction"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from stl_tools import export, indexed_mesh
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'stl_tools')
+DEFAULT_MAX_BYTES = 2 << 30
+# part of every key, bump it when the generated meshes or the stored arrays change so old entries miss
+FORMAT_VERSION = 3
+
+
+class ResultCache:
+    """
+    files keyed by a hash of the pixel array and the generation parameters
+
+    entries are files named after their key in directory, the modification time of an entry is
+    its last use, and the least recently used entries are removed once the cache grows past max_bytes
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or os.environ.get('STL_TOOLS_CACHE', DEFAULT_DIRECTORY)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(arr, **params):
+        """hex digest of the array (dtype, shape and data) and the parameters"""
+        arr = np.ascontiguousarray(arr)
+        digest = hashlib.sha256()
+        digest.update(json.dumps([arr.dtype.str, arr.shape, params], sort_keys=True).encode('utf-8'))
+        digest.update(memoryview(arr).cast('B'))
+        return digest.hexdigest()
+
+    def path(self, key, suffix):
+        return os.path.join(self.directory, key + suffix)
+
+    def lookup(self, key, suffix):
+        """
+        path of an entry, or None; a hit marks the entry as recently used
+
+        another process may still evict the entry before it is read, readers treat a
+        FileNotFoundError as a miss
+        """
+        path = self.path(key, suffix)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def _store(self, key, suffix, write):
+        """write an entry through a temporary file, so readers never see a partial entry"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, self.path(key, suffix))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+
+    def store_file(self, key, suffix, src_path):
+        self._store(key, suffix, lambda tmp_path: shutil.copyfile(src_path, tmp_path))
+
+    def load_indexed(self, key, scale=None):
+        """cached IndexedMesh, or None; with a scale (dx, dy, dz) it is rescaled to it (see IndexedMesh.rescale)"""
+        path = self.lookup(key, '.npz')
+        if path is None:
+            return None
+        try:
+            with np.load(path) as arrays:
+                heights = arrays['heights'] if 'heights' in arrays else None
+                stored_scale = tuple(float(value) for value in arrays['scale']) if 'scale' in arrays else None
+                indexed = indexed_mesh.IndexedMesh(arrays['vertices'], arrays['faces'], heights, stored_scale)
+        except FileNotFoundError:
+            # evicted since the lookup
+            return None
+        if scale is not None:
+            indexed.rescale(scale)
+        return indexed
+
+    def store_indexed(self, key, indexed):
+        def write(tmp_path):
+            extra = {}
+            if indexed.heights is not None:
+                extra['heights'] = indexed.heights
+            if indexed.scale is not None:
+                extra['scale'] = np.asarray(indexed.scale, dtype=np.float64)
+            with open(tmp_path, 'wb') as fh:
+                np.savez(fh, vertices=indexed.vertices, faces=indexed.faces, **extra)
+        self._store(key, '.npz', write)
+
+    def evict(self):
+        """remove least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def save_output(self, group, path):
+        """
+        save the mesh of a PixelGroup to path (format by extension), returns a summary dict
+
+        the finished file is cached under all parameters, the relief mesh under the ones its faces
+        depend on, so a change of output format or base only re-does the cheap closing and writing
+        steps, and a change of the emboss size only rescales the cached relief (see PixelGroup.rescale)
+        """
+        relief_params = {
+            'format': FORMAT_VERSION,
+            'generator': type(group).__module__,
+            'oriented': group.solid,
+        }
+        suffix = os.path.splitext(path)[1].lower()
+        output_params = dict(relief_params, dx=group.dx, dy=group.dy, dz=group.dz, solid=group.solid,
+                             base_mm=group.base_mm if group.solid else None, suffix=suffix)
+
+        output_key = self.key(group.img_arr, **output_params)
+        cached_path, summary_path = self.lookup(output_key, suffix), self.lookup(output_key, '.json')
+        if cached_path is not None and summary_path is not None:
+            try:
+                with open(summary_path) as fh:
+                    summary = json.load(fh)
+                shutil.copyfile(cached_path, path)
+                return dict(summary, cache_hit=True)
+            except FileNotFoundError:
+                # evicted since the lookup, build it again
+                pass
+
+        relief_key = self.key(group.img_arr, **relief_params)
+        relief = self.load_indexed(relief_key, scale=(group.dx, group.dy, group.dz))
+        if relief is None:
+            relief = group.make_relief_indexed()
+            self.store_indexed(relief_key, relief)
+
+        indexed = group.make_indexed_mesh(relief)
+        summary = {'triangles': indexed.triangle_count, 'bytes': export.save(indexed, path)}
+        self.store_file(output_key, suffix, path)
+        self._store(output_key, '.json', lambda tmp_path: _write_json(tmp_path, summary))
+        return dict(summary, cache_hit=False)
+
+
+def _write_json(path, obj):
+    with open(path, 'w') as fh:
+        json.dump(obj, fh)
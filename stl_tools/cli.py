@@ -0,0 +1,201 @@
+"""batch conversion of images to meshes, run with python -m stl_tools"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import glob
+import hashlib
+import json
+import os
+import time
+
+from stl_tools import cache, export, ingest, resample
+
+IMAGE_EXTENSIONS = ('.bmp', '.gif', '.jpeg', '.jpg', '.npy', '.png', '.pgm', '.tif', '.tiff') + ingest.RAW_GRID_EXTENSIONS
+
+# one record per output file: {output file name: job key}, kept in every output directory
+MANIFEST_NAME = '.stl_tools_manifest.json'
+
+
+def find_images(inputs):
+    """image paths for a list of files, directories and glob patterns, sorted and without duplicates"""
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = [os.path.join(item, name) for name in os.listdir(item)]
+        else:
+            candidates = glob.glob(item)
+        paths.update(path for path in candidates
+                     if os.path.isfile(path) and os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS)
+    return sorted(paths)
+
+
+def output_path(img_path, output_dir, output_format):
+    """output file next to the image (or in output_dir), named like PixelGroup.output_path"""
+    head, tail = os.path.split(img_path)
+    filename, ext = os.path.splitext(tail)
+    return os.path.join(head if output_dir is None else output_dir, '{}.{}'.format(filename, output_format))
+
+
+def clashing_outputs(img_paths, output_dir, output_format):
+    """{output path: images} of outputs that more than one image maps to, e.g. a.png and a.jpg both make a.stl"""
+    sources = {}
+    for img_path in img_paths:
+        sources.setdefault(os.path.abspath(output_path(img_path, output_dir, output_format)), []).append(img_path)
+    return {out_path: paths for out_path, paths in sources.items() if len(paths) > 1}
+
+
+def grid_shape(text):
+    """shape (rows, columns) of a raw grid from ROWSxCOLUMNS, e.g. 480x640"""
+    rows, columns = (int(part) for part in text.lower().split('x'))
+    if rows < 1 or columns < 1:
+        raise ValueError('a grid needs at least one row and column: {!r}'.format(text))
+    return rows, columns
+
+
+def job_key(img_path, params):
+    """content hash of the image file and every parameter that changes the output"""
+    digest = hashlib.sha256()
+    with open(img_path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(block)
+    digest.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def load_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME)) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as fh:
+        json.dump(manifest, fh, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def convert(img_path, out_path, params):
+    """worker: build the mesh of one image and save it, returns a summary of the job"""
+    # imported here so the parent process stays light
+    from stl_tools import stl_tools, stl_tools_2
+
+    start = time.perf_counter()
+    if params['shape'] == 'round':
+        group = stl_tools_2.PixelGroup(img_path, params['width'], params['depth'], solid=params['solid'],
+                                       base_mm=params['base'], preview=False, z_min=params['z_min'],
+                                       grid_shape=params['grid_shape'], grid_dtype=params['grid_dtype'], cell_mm=params['cell_mm'],
+                                       max_triangles=params['max_triangles'], pooling=params['pooling'],
+                                       spill_dir=params['spill_dir'])
+    else:
+        group = stl_tools.PixelGroup(img_path, solid=params['solid'], base_mm=params['base'],
+                                     emboss_width_mm=params['width'], emboss_depth_mm=params['depth'], preview=False,
+                                     z_min=params['z_min'], grid_shape=params['grid_shape'],
+                                     grid_dtype=params['grid_dtype'], cell_mm=params['cell_mm'],
+                                     max_triangles=params['max_triangles'], pooling=params['pooling'],
+                                     spill_dir=params['spill_dir'])
+    if params['cache_dir'] is not None:
+        summary = cache.ResultCache(params['cache_dir'], params['cache_size']).save_output(group, out_path)
+    else:
+        indexed = group.make_indexed_mesh()
+        summary = {'triangles': indexed.triangle_count, 'bytes': export.save(indexed, out_path), 'cache_hit': False}
+
+    if params['preview']:
+        group.make_preview(os.path.splitext(out_path)[0] + '_preview.png', params['preview_size'])
+
+    return dict(summary, image=img_path, output=out_path, seconds=time.perf_counter() - start,
+                cell_mm=group.resolution['cell_mm'])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m stl_tools', description=__doc__)
+    parser.add_argument('inputs', nargs='+', help='image files, directories or glob patterns')
+    parser.add_argument('--width', type=float, default=100.0, help='emboss width in mm (default: %(default)s)')
+    parser.add_argument('--depth', type=float, default=5.0, help='emboss depth in mm (default: %(default)s)')
+    parser.add_argument('--shape', choices=('square', 'round'), default='square',
+                        help='square step relief (stl_tools) or round smooth relief (stl_tools_2)')
+    parser.add_argument('--format', choices=sorted(ext.lstrip('.') for ext in export.WRITERS), default='stl',
+                        help='output format (default: %(default)s)')
+    parser.add_argument('--solid', action='store_true', help='close the relief with side walls and a base')
+    parser.add_argument('--base', type=float, default=1.0, help='base thickness in mm for --solid')
+    parser.add_argument('--cell-mm', type=float, help='downsample to cells of at least this size, e.g. the nozzle width')
+    parser.add_argument('--max-triangles', type=int, help='downsample until the relief has at most this many triangles')
+    parser.add_argument('--pooling', choices=resample.POOLING, default='mean',
+                        help='how downsampled cells combine their pixels (default: %(default)s)')
+    parser.add_argument('--z-min', type=float,
+                        help='height mapped to the bottom of the relief (default: 0 for images, the minimum for grids)')
+    parser.add_argument('--grid-shape', type=grid_shape, metavar='ROWSxCOLUMNS',
+                        help='shape of raw grids ({}) (default: square)'.format(', '.join(ingest.RAW_GRID_EXTENSIONS)))
+    parser.add_argument('--grid-dtype', default='<f4', help='numpy dtype of raw grids (default: %(default)s)')
+    parser.add_argument('--preview', action='store_true', help='also write a hill-shaded png thumbnail per output')
+    parser.add_argument('--preview-size', type=int, default=512, help='thumbnail size in pixels (default: %(default)s)')
+    parser.add_argument('--spill-dir', help='keep large height arrays in temporary files here instead of memory')
+    parser.add_argument('--output-dir', help='write all outputs here instead of next to the images')
+    parser.add_argument('--cache-dir', help='reuse meshes from (and add them to) this result cache')
+    parser.add_argument('--cache-size', type=float, default=cache.DEFAULT_MAX_BYTES / 2 ** 30,
+                        help='result cache size limit in GiB (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--force', action='store_true', help='convert even if the output is up to date')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    params = {'shape': args.shape, 'format': args.format, 'width': args.width, 'depth': args.depth,
+              'solid': args.solid, 'base': args.base, 'z_min': args.z_min,
+              'grid_shape': args.grid_shape, 'grid_dtype': args.grid_dtype,
+              'cell_mm': args.cell_mm, 'max_triangles': args.max_triangles, 'pooling': args.pooling}
+    worker_params = dict(params, cache_dir=args.cache_dir, cache_size=int(args.cache_size * 2 ** 30),
+                         preview=args.preview, preview_size=args.preview_size, spill_dir=args.spill_dir)
+
+    images = find_images(args.inputs)
+    if not images:
+        print('no images found')
+        return 1
+
+    # one output file per image, never let two images overwrite each other's output
+    clashes = clashing_outputs(images, args.output_dir, args.format)
+    for out_path, img_paths in sorted(clashes.items()):
+        print('{}: made from each of {}, rename all but one'.format(out_path, ', '.join(img_paths)))
+    if clashes:
+        return 1
+
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    # up to date: the output exists and was made from the same image content and parameters
+    manifests, jobs = {}, []
+    for img_path in images:
+        out_path = output_path(img_path, args.output_dir, args.format)
+        directory, name = os.path.split(os.path.abspath(out_path))
+        manifest = manifests.setdefault(directory, load_manifest(directory))
+        key = job_key(img_path, params)
+        if not args.force and os.path.exists(out_path) and manifest.get(name) == key:
+            print('{}: up to date'.format(out_path))
+            continue
+        jobs.append((img_path, out_path, directory, name, key))
+
+    start = time.perf_counter()
+    triangles = failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {executor.submit(convert, img_path, out_path, worker_params): (directory, name, key)
+                   for img_path, out_path, directory, name, key in jobs}
+        for future in as_completed(futures):
+            directory, name, key = futures[future]
+            try:
+                summary = future.result()
+            except Exception as error:
+                failed += 1
+                print('{}: failed ({})'.format(os.path.join(directory, name), error))
+                continue
+
+            triangles += summary['triangles']
+            print('{output}: {triangles} triangles, {cell_mm:.3f} mm cells, {bytes} bytes in {seconds:.2f} s{}'.format(
+                ' (cached)' if summary['cache_hit'] else '', **summary))
+            manifests[directory][name] = key
+            save_manifest(directory, manifests[directory])
+
+    print('{} converted, {} up to date, {} failed: {} triangles in {:.2f} s'.format(
+        len(jobs) - failed, len(images) - len(jobs), failed, triangles, time.perf_counter() - start))
+    return 1 if failed else 0
@@ -0,0 +1,165 @@
+"""adaptive triangulation: merge flat (or nearly flat) blocks of cells into large quads"""
+import numpy as np
+from stl_tools import fast_mesh
+
+
+def quadtree_leaves(cell_min, cell_max, cell_mask, max_deviation=0.0):
+    """
+    leaves of a quadtree over a grid of cells, as arrays x0, y0, size (in cells)
+
+    a block of 2**k x 2**k cells becomes one leaf when all its cells are in cell_mask and the
+    heights it touches (cell_min .. cell_max) differ by at most max_deviation; cells that are not
+    covered by any such block become leaves of size 1
+    """
+    level_min, level_max = cell_min, cell_max
+    accepted = [np.asarray(cell_mask, dtype=bool)]
+
+    # min / max pooling pyramid, odd leftover rows and columns can not form a full block
+    while min(accepted[-1].shape) >= 2:
+        height, width = accepted[-1].shape
+        h2, w2 = height // 2, width // 2
+
+        def pool(arr):
+            return arr[:2 * h2, :2 * w2].reshape(h2, 2, w2, 2)
+
+        level_min = pool(level_min).min(axis=(1, 3))
+        level_max = pool(level_max).max(axis=(1, 3))
+        ok = pool(accepted[-1]).all(axis=(1, 3)) & (level_max - level_min <= max_deviation)
+        if not ok.any():
+            break
+        accepted.append(ok)
+
+    x0, y0, size = [], [], []
+    for level, ok in enumerate(accepted):
+        leaf = ok.copy()
+        if level + 1 < len(accepted):
+            parent = accepted[level + 1]
+            h2, w2 = parent.shape
+            leaf[:2 * h2, :2 * w2] &= ~np.repeat(np.repeat(parent, 2, axis=0), 2, axis=1)
+
+        y, x = np.nonzero(leaf)
+        x0.append(x << level)
+        y0.append(y << level)
+        size.append(np.full(len(x), 1 << level))
+
+    return np.concatenate(x0), np.concatenate(y0), np.concatenate(size)
+
+
+def used_vertices(x0, y0, size, vertex_shape):
+    """boolean [y, x] vertex grid marking the corners of all leaves"""
+    used = np.zeros(vertex_shape, dtype=bool)
+    for offset_x, offset_y in ((0, 0), (1, 0), (0, 1), (1, 1)):
+        used[y0 + offset_y * size, x0 + offset_x * size] = True
+    return used
+
+
+def _perimeter_offsets(size):
+    """clockwise (on screen, y down) perimeter of a size x size block, starting at its NW corner"""
+    steps = np.arange(size)
+    offset_x = np.concatenate([steps, np.full(size, size), size - steps, np.zeros(size, dtype=int)])
+    offset_y = np.concatenate([np.zeros(size, dtype=int), steps, np.full(size, size), size - steps])
+    return offset_x, offset_y
+
+
+def _quad_triangles(nw, ne, se, sw, vertex_z):
+    """two triangles per quad, split along the diagonal with the smaller z step (see SuperPixel.triangles)"""
+    corners = np.stack([nw, ne, se, sw], axis=1)
+    if vertex_z is None:
+        nw_se = np.zeros(len(corners), dtype=bool)
+    else:
+        z = vertex_z[corners[..., 1], corners[..., 0]]
+        nw_se = fast_mesh.nw_se_diagonal(z[:, 0], z[:, 1], z[:, 2], z[:, 3])
+
+    pattern = np.where(nw_se[:, None, None], [[0, 1, 2], [0, 2, 3]], [[1, 2, 3], [1, 3, 0]])
+    return corners[np.arange(len(corners))[:, None, None], pattern].reshape(-1, 3, 2)
+
+
+def leaf_triangles(x0, y0, size, used, vertex_z=None):
+    """
+    triangulate quadtree leaves, returns grid corners (n, 3, 2) as (x, y) and the leaf of each triangle
+
+    a leaf with vertices in use along its sides (corners of smaller neighbors, walls) is fanned out
+    from its center through all of them, so neighbors share every edge and no T-junctions appear.
+    Triangles are counter-clockwise on screen (y down), which faces up once the y-axis is flipped
+    """
+    # empty arrays to start from, a cell mask without any cell has no leaves
+    corners, leaves = [np.empty((0, 3, 2), dtype=np.intp)], [np.empty(0, dtype=np.intp)]
+    for block_size in np.unique(size):
+        leaf = np.nonzero(size == block_size)[0]
+        bx, by = x0[leaf], y0[leaf]
+
+        offset_x, offset_y = _perimeter_offsets(block_size)
+        perimeter_x = bx[:, None] + offset_x
+        perimeter_y = by[:, None] + offset_y
+        perimeter_used = used[perimeter_y, perimeter_x]
+        plain = perimeter_used.sum(axis=1) == 4
+
+        # blocks with nothing attached between their corners: two triangles
+        nw, ne = np.stack([bx, by], axis=1), np.stack([bx + block_size, by], axis=1)
+        se, sw = np.stack([bx + block_size, by + block_size], axis=1), np.stack([bx, by + block_size], axis=1)
+        corners.append(_quad_triangles(nw[plain], ne[plain], se[plain], sw[plain], vertex_z))
+        leaves.append(np.repeat(leaf[plain], 2))
+
+        # the rest: fan from the center through every used perimeter vertex
+        fan = np.nonzero(~plain)[0]
+        if len(fan) == 0:
+            continue
+        row, position = np.nonzero(perimeter_used[fan])
+        row_start = np.searchsorted(row, row)
+        row_stop = np.searchsorted(row, row, side='right')
+        following = np.arange(len(row)) + 1
+        following[following == row_stop] = row_start[following == row_stop]
+
+        center = np.stack([bx[fan] + block_size // 2, by[fan] + block_size // 2], axis=1)[row]
+        here = np.stack([perimeter_x[fan][row, position], perimeter_y[fan][row, position]], axis=1)
+        corners.append(np.stack([center, here, here[following]], axis=1))
+        leaves.append(leaf[fan][row])
+
+    # both patterns above run clockwise on screen, flip them
+    return np.concatenate(corners)[:, [0, 2, 1]], np.concatenate(leaves)
+
+
+def heightfield_triangles(vertex_z, cell_mask, max_deviation=0.0, extra_used=None):
+    """
+    adaptive triangles (n, 3, 3) in grid coordinates (x, y, z) for a height field with one vertex
+    per pixel, the surface never deviates more than max_deviation from the original one
+    """
+    corner_z = (vertex_z[:-1, :-1], vertex_z[:-1, 1:], vertex_z[1:, :-1], vertex_z[1:, 1:])
+    x0, y0, size = quadtree_leaves(np.minimum.reduce(corner_z), np.maximum.reduce(corner_z), cell_mask,
+                                   max_deviation)
+
+    used = used_vertices(x0, y0, size, vertex_z.shape)
+    if extra_used is not None:
+        used |= extra_used
+
+    corners, leaves = leaf_triangles(x0, y0, size, used, vertex_z)
+    z = vertex_z[corners[..., 1], corners[..., 0]]
+    return np.concatenate([corners, z[..., None]], axis=2).astype(np.float64)
+
+
+def step_relief_top_triangles(cell_z, extra_used=None, cell_mask=None):
+    """
+    adaptive top faces (n, 3, 3) in grid coordinates (x, y, z) for a step relief, one flat cell per
+    pixel; only of the pixels in cell_mask if given
+    """
+    height, width = cell_z.shape
+    if cell_mask is None:
+        cell_mask = np.ones(cell_z.shape, dtype=bool)
+    x0, y0, size = quadtree_leaves(cell_z, cell_z, cell_mask)
+
+    used = used_vertices(x0, y0, size, (height + 1, width + 1))
+    if extra_used is not None:
+        used |= extra_used
+
+    corners, leaves = leaf_triangles(x0, y0, size, used)
+    z = np.repeat(cell_z[y0[leaves], x0[leaves]][:, None], 3, axis=1)
+    return np.concatenate([corners, z[..., None]], axis=2).astype(np.float64)
+
+
+def reduction_report(full_triangle_count, triangle_count):
+    """summary of what the adaptive triangulation achieved"""
+    return {
+        'full_triangles': int(full_triangle_count),
+        'triangles': int(triangle_count),
+        'reduction': 1.0 - float(triangle_count) / full_triangle_count if full_triangle_count else 0.0,
+    }
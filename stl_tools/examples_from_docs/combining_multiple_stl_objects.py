@@ -1,29 +1,13 @@
 import math
-import stl
 from stl import mesh
 import numpy
+from stl_tools import plate, stl_io, validate
 
 
 # find the max dimensions, so we can know the bounding box, getting the height,
 # width, length (because these are the step size)...
 def find_mins_maxs(obj):
-    minx = maxx = miny = maxy = minz = maxz = None
-    for p in obj.points:
-        # p contains (x, y, z)
-        if minx is None:
-            minx = p[stl.Dimension.X]
-            maxx = p[stl.Dimension.X]
-            miny = p[stl.Dimension.Y]
-            maxy = p[stl.Dimension.Y]
-            minz = p[stl.Dimension.Z]
-            maxz = p[stl.Dimension.Z]
-        else:
-            maxx = max(p[stl.Dimension.X], maxx)
-            minx = min(p[stl.Dimension.X], minx)
-            maxy = max(p[stl.Dimension.Y], maxy)
-            miny = min(p[stl.Dimension.Y], miny)
-            maxz = max(p[stl.Dimension.Z], maxz)
-            minz = min(p[stl.Dimension.Z], minz)
+    (minx, miny, minz), (maxx, maxy, maxz) = plate.bounding_box(obj.vectors)
     return minx, maxx, miny, maxy, minz, maxz
 
 
@@ -42,28 +26,19 @@ def translate(_solid, step, padding, multiplier, axis):
 
 
 def copy_obj(obj, dims, num_rows, num_cols, num_layers):
+    # all copies in one buffer, see plate.transform_into
     w, l, h = dims
-    copies = []
-    for layer in range(num_layers):
-        for row in range(num_rows):
-            for col in range(num_cols):
-                # skip the position where original being copied is
-                if row == 0 and col == 0 and layer == 0:
-                    continue
-                _copy = mesh.Mesh(obj.data.copy())
-                # pad the space between objects by 10% of the dimension being
-                # translated
-                if col != 0:
-                    translate(_copy, w, w / 10., col, 'x')
-                if row != 0:
-                    translate(_copy, l, l / 10., row, 'y')
-                if layer != 0:
-                    translate(_copy, h, h / 10., layer, 'z')
-                copies.append(_copy)
-    return copies
+    layer, row, col = numpy.mgrid[0:num_layers, 0:num_rows, 0:num_cols].reshape(3, -1)[:, 1:]
 
-# Using an existing stl file:
-main_body = mesh.Mesh.from_file(r'C:\Users\James\PycharmProjects\3D_printing\stl_tools\examples_from_docs\HalfDonut.stl')
+    # pad the space between objects by 10% of the dimension being translated
+    translations = numpy.stack([col * w * 1.1, row * l * 1.1, layer * h * 1.1], axis=1)
+    data = numpy.zeros(len(translations) * len(obj.data), dtype=mesh.Mesh.dtype)
+    plate.transform_into(obj.vectors, translations, data)
+    return [mesh.Mesh(data)]
+
+# Using an existing stl file, memory mapped copy-on-write (rotating it leaves the file alone):
+main_body = mesh.Mesh(stl_io.read_facets(r'C:\Users\James\PycharmProjects\3D_printing\stl_tools\examples_from_docs\HalfDonut.stl',
+                                         mode='c'))
 
 # rotate along Y
 main_body.rotate([0.0, 0.5, 0.0], math.radians(90))
@@ -75,15 +50,24 @@ h1 = maxz - minz
 copies = copy_obj(main_body, (w1, l1, h1), 2, 2, 1)
 
 # I wanted to add another related STL to the final STL
-twist_lock = mesh.Mesh.from_file(r'C:\Users\James\PycharmProjects\3D_printing\stl_tools\examples_from_docs\HalfDonut.stl')
+twist_lock = mesh.Mesh(stl_io.read_facets(r'C:\Users\James\PycharmProjects\3D_printing\stl_tools\examples_from_docs\HalfDonut.stl',
+                                          mode='c'))
 minx, maxx, miny, maxy, minz, maxz = find_mins_maxs(twist_lock)
 w2 = maxx - minx
 l2 = maxy - miny
 h2 = maxz - minz
 translate(twist_lock, w1, w1 / 10., 3, 'x')
 copies2 = copy_obj(twist_lock, (w2, l2, h2), 2, 2, 1)
-combined = mesh.Mesh(numpy.concatenate([main_body.data, twist_lock.data] +
-                                    [copy.data for copy in copies] +
-                                    [copy.data for copy in copies2]))
+# stream the parts into one binary stl, no concatenated copy (a quarter of the size of ascii)
+with stl_io.StlStreamWriter('combined.stl', 'combined') as writer:
+    for part in [main_body, twist_lock] + copies + copies2:
+        writer.write_records(part.data)
+
+# or: 50 main bodies and 50 twist locks packed onto 250 x 210 mm build plates in one buffer
+plate_data, placements = plate.layout([main_body.vectors, twist_lock.vectors], [50, 50], (250, 210))
+mesh.Mesh(plate_data).save('plates.stl')
 
-combined.save('combined.stl', mode=stl.Mode.ASCII)  # save as ASCII
+# merge stl files through memory maps (the header count is set from the facets written) and check the result:
+# bounding box, degenerate facets, edges not shared by exactly two facets
+stl_io.merge_stl(['combined.stl', 'plates.stl'], 'merged.stl')
+print(validate.check_stl('merged.stl'))
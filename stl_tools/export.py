@@ -0,0 +1,94 @@
+"""writers for indexed meshes: binary stl, binary ply and 3mf, chosen by file extension"""
+import os
+import zipfile
+
+import numpy as np
+
+PLY_FACE_DTYPE = np.dtype([('count', 'u1'), ('vertex_indices', '<u4', (3,))])
+
+THREE_MF_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">\n'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>\n'
+    '<Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>\n'
+    '</Types>\n'
+)
+THREE_MF_RELS = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">\n'
+    '<Relationship Target="/3D/3dmodel.model" Id="rel0" '
+    'Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>\n'
+    '</Relationships>\n'
+)
+
+
+def write_stl(indexed, path, chunk_size=1 << 20):
+    """binary stl, facets expanded chunk by chunk"""
+    return indexed.save_stl(path, chunk_size)
+
+
+def write_ply(indexed, path, chunk_size=1 << 20):
+    """binary little-endian ply with shared vertices, returns the number of bytes written"""
+    header = '\n'.join([
+        'ply',
+        'format binary_little_endian 1.0',
+        'comment stl_tools height map',
+        'element vertex {}'.format(len(indexed.vertices)),
+        'property float x',
+        'property float y',
+        'property float z',
+        'element face {}'.format(indexed.triangle_count),
+        'property list uchar uint vertex_indices',
+        'end_header',
+    ]) + '\n'
+
+    with open(path, 'wb') as fh:
+        fh.write(header.encode('ascii'))
+        fh.write(indexed.vertices.astype('<f4').tobytes())
+        for start in range(0, indexed.triangle_count, chunk_size):
+            faces = indexed.faces[start:start + chunk_size]
+            records = np.empty(len(faces), dtype=PLY_FACE_DTYPE)
+            records['count'] = 3
+            records['vertex_indices'] = faces
+            fh.write(records.tobytes())
+
+    return os.path.getsize(path)
+
+
+def write_3mf(indexed, path, chunk_size=1 << 16):
+    """zipped 3mf package (millimeter units), the model xml is streamed into the archive"""
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', THREE_MF_CONTENT_TYPES)
+        archive.writestr('_rels/.rels', THREE_MF_RELS)
+
+        with archive.open('3D/3dmodel.model', 'w') as fh:
+            fh.write(b'<?xml version="1.0" encoding="UTF-8"?>\n'
+                     b'<model unit="millimeter" xml:lang="en-US" '
+                     b'xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">\n'
+                     b'<resources>\n<object id="1" type="model">\n<mesh>\n<vertices>\n')
+            for start in range(0, len(indexed.vertices), chunk_size):
+                chunk = indexed.vertices[start:start + chunk_size].tolist()
+                fh.write(''.join('<vertex x="%.9g" y="%.9g" z="%.9g"/>\n' % tuple(v) for v in chunk).encode('ascii'))
+            fh.write(b'</vertices>\n<triangles>\n')
+            for start in range(0, indexed.triangle_count, chunk_size):
+                chunk = indexed.faces[start:start + chunk_size].tolist()
+                fh.write(''.join('<triangle v1="%d" v2="%d" v3="%d"/>\n' % tuple(f) for f in chunk).encode('ascii'))
+            fh.write(b'</triangles>\n</mesh>\n</object>\n</resources>\n'
+                     b'<build>\n<item objectid="1"/>\n</build>\n</model>\n')
+
+    return os.path.getsize(path)
+
+
+WRITERS = {
+    '.stl': write_stl,
+    '.ply': write_ply,
+    '.3mf': write_3mf,
+}
+
+
+def save(indexed, path):
+    """write an indexed mesh in the format given by the file extension"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in WRITERS:
+        raise ValueError('unknown mesh format {!r}, expected one of {}'.format(ext, ', '.join(sorted(WRITERS))))
+    return WRITERS[ext](indexed, path)
@@ -0,0 +1,310 @@
+"""vectorized mesh generation for height-map images"""
+from stl import mesh
+import numpy as np
+
+
+def step_relief_changes(img_arr):
+    """boolean arrays marking an elevation change to the right / bottom neighbor of each pixel"""
+    height, width = img_arr.shape
+
+    # edge pixels have no neighbor, so they never get a side wall
+    change_right = np.zeros((height, width), dtype=bool)
+    change_right[:, :-1] = img_arr[:, :-1] != img_arr[:, 1:]
+
+    change_bottom = np.zeros((height, width), dtype=bool)
+    change_bottom[:-1, :] = img_arr[:-1, :] != img_arr[1:, :]
+
+    return change_right, change_bottom
+
+
+def _put_triangles(vectors, rows, selection, corners):
+    """write one triangle per selected pixel, corners are (x, y, z) arrays of shape (width, height)"""
+    for j, (x, y, z) in enumerate(corners):
+        vectors[rows, j, 0] = x[selection]
+        vectors[rows, j, 1] = y[selection]
+        vectors[rows, j, 2] = z[selection]
+
+
+def step_relief_triangle_count(img_arr):
+    """number of step-relief triangles: 2 per pixel plus 2 per height change between neighbors"""
+    # a diff is zero exactly when neighbors are equal (also for wrapped unsigned ints)
+    changes_right = np.count_nonzero(np.diff(img_arr, axis=1))
+    changes_bottom = np.count_nonzero(np.diff(img_arr, axis=0))
+    return 2 * img_arr.size + 2 * int(changes_right) + 2 * int(changes_bottom)
+
+
+def step_relief_column_triangle_counts(img_arr):
+    """number of step-relief triangles generated for each pixel column"""
+    change_right, change_bottom = step_relief_changes(img_arr)
+    return 2 * img_arr.shape[0] + 2 * change_right.sum(axis=0) + 2 * change_bottom.sum(axis=0)
+
+
+def step_relief_vectors(img_arr, dx, dy, dz, x_start=0, x_stop=None, vectors=None, oriented=False, tops=True,
+                        column_offset=0):
+    """
+    triangles of the step-relief surface for the pixel columns [x_start, x_stop), same layout as
+    stl_tools.Pixel.triangles; img_arr may be a tile holding the image columns from column_offset on
+
+    triangles are ordered exactly like the per-pixel generator (x-major, then top, right, bottom),
+    so the result is identical to the reference implementation. With oriented=True the first
+    triangle of every top face and wall is wound the other way round, so all normals point out
+    of the solid. With tops=False only the walls are generated
+    """
+    height, width = img_arr.shape
+    if x_stop is None:
+        x_stop = column_offset + width
+
+    # keep one extra column for the right-neighbor lookups of the last column
+    band = img_arr[:, x_start - column_offset:min(x_stop + 1 - column_offset, width)]
+    change_right, change_bottom = step_relief_changes(band)
+
+    # switch to generator order: index [x, y], dropping the extra column
+    band_width = x_stop - x_start
+    change_right, change_bottom = change_right.T[:band_width], change_bottom.T[:band_width]
+    z = band.T.astype(np.float64)
+
+    counts = 2 * tops + 2 * change_right.astype(np.int64) + 2 * change_bottom
+    first = np.cumsum(counts).reshape(band_width, height) - counts
+
+    if vectors is None:
+        vectors = np.zeros((int(counts.sum()), 3, 3), dtype=np.float32)
+
+    # scaled coordinates, see Pixel.coord_transform
+    shape = (band_width, height)
+    x = np.arange(x_start, x_stop)[:, None]
+    y = np.arange(height)[None, :]
+    left = np.broadcast_to(x * dx, shape)
+    right = np.broadcast_to((x + 1) * dx, shape)
+    upper = np.broadcast_to((height - 1 - y) * dy, shape)
+    lower = np.broadcast_to((height - 1 - (y + 1)) * dy, shape)
+
+    z_right = np.zeros(shape)
+    z_right[:len(z) - 1, :] = z[1:, :]
+    z_bottom = np.zeros(shape)
+    z_bottom[:, :-1] = z[:band_width, 1:]
+
+    z, z_right, z_bottom = z[:band_width] * dz, z_right * dz, z_bottom * dz
+
+    upper_left = (left, upper, z)
+    upper_right = (right, upper, z)
+    lower_left = (left, lower, z)
+    lower_right = (right, lower, z)
+    right_neighbor_upper_left = (right, upper, z_right)
+    right_neighbor_lower_left = (right, lower, z_right)
+    bottom_neighbor_upper_left = (left, lower, z_bottom)
+    bottom_neighbor_upper_right = (right, lower, z_bottom)
+
+    if tops:
+        everywhere = np.ones(shape, dtype=bool)
+        if oriented:
+            _put_triangles(vectors, first.ravel(), everywhere, (upper_left, lower_left, upper_right))
+        else:
+            _put_triangles(vectors, first.ravel(), everywhere, (upper_left, upper_right, lower_left))
+        _put_triangles(vectors, first.ravel() + 1, everywhere, (upper_right, lower_left, lower_right))
+
+    rows = first[change_right] + 2 * tops
+    if oriented:
+        _put_triangles(vectors, rows, change_right, (upper_right, lower_right, right_neighbor_upper_left))
+    else:
+        _put_triangles(vectors, rows, change_right, (upper_right, right_neighbor_upper_left, lower_right))
+    _put_triangles(vectors, rows + 1, change_right,
+                   (right_neighbor_upper_left, lower_right, right_neighbor_lower_left))
+
+    # bottom walls come after the right walls of the same pixel
+    rows = first[change_bottom] + 2 * tops + 2 * change_right[change_bottom]
+    if oriented:
+        _put_triangles(vectors, rows, change_bottom, (lower_left, bottom_neighbor_upper_left, lower_right))
+    else:
+        _put_triangles(vectors, rows, change_bottom, (lower_left, lower_right, bottom_neighbor_upper_left))
+    _put_triangles(vectors, rows + 1, change_bottom,
+                   (lower_right, bottom_neighbor_upper_left, bottom_neighbor_upper_right))
+
+    return vectors
+
+
+def nw_se_diagonal(z_nw, z_ne, z_se, z_sw):
+    """
+    True where a quad is split along its NW-SE diagonal, the one with the smaller z step
+    (the rule of stl_tools_2.SuperPixel.triangles, applied to whole arrays of quads)
+
+    the generators pass unscaled heights, so rounding in z * dz never flips a tie and the split
+    does not depend on dz (see PixelGroup.rescale)
+    """
+    return np.abs(z_nw - z_se) < np.abs(z_ne - z_sw)
+
+
+def heightfield_vectors(img_arr, dx, dy, dz, y_top, cell_mask=None, x_start=0, x_stop=None, vectors=None,
+                        oriented=False, column_offset=0, band_width=64):
+    """
+    two triangles per cell of a height field with one vertex per pixel, for the cells within the
+    columns [x_start, x_stop) that are set in cell_mask [y, x - x_start], mesh y is (y_top - y) * dy;
+    img_arr may be a tile holding the image columns from column_offset on
+
+    cells are ordered x-major and split like stl_tools_2.SuperPixel.triangles, so the result is
+    identical to the per-object implementation; oriented=True rewinds the triangles to face up.
+    The float32 output is filled band_width cell columns at a time, which keeps the float64
+    temporaries small
+    """
+    height, width = img_arr.shape
+    if x_stop is None:
+        x_stop = column_offset + width - 1
+
+    # index [x, y], cell (x, y) spans the pixels x..x+1, y..y+1
+    heights = img_arr[:, x_start - column_offset:x_stop + 1 - column_offset].T
+    if cell_mask is None:
+        cells = np.ones((x_stop - x_start, height - 1), dtype=bool)
+    else:
+        cells = cell_mask.T
+
+    if vectors is None:
+        vectors = np.zeros((2 * int(np.count_nonzero(cells)), 3, 3), dtype=np.float32)
+
+    first = 0
+    for band_start in range(0, len(cells), band_width):
+        band_stop = min(band_start + band_width, len(cells))
+        band_heights = heights[band_start:band_stop + 1].astype(np.float64)
+        z = band_heights * dz
+
+        x, y = np.nonzero(cells[band_start:band_stop])
+        corner_x = (x, x + 1, x + 1, x)
+        corner_y = (y, y, y + 1, y + 1)
+        # NW, NE, SE, SW
+        corners = np.stack([np.stack([(cx + band_start + x_start) * dx, (y_top - cy) * dy, z[cx, cy]], axis=1)
+                            for cx, cy in zip(corner_x, corner_y)], axis=1)
+
+        nw_se = nw_se_diagonal(*(band_heights[cx, cy] for cx, cy in zip(corner_x, corner_y)))
+        pattern = np.where(nw_se[:, None, None], [[0, 1, 2], [2, 3, 0]], [[3, 0, 1], [1, 2, 3]])
+        if oriented:
+            pattern = pattern[..., [0, 2, 1]]
+
+        count = 2 * len(corners)
+        vectors[first:first + count] = corners[np.arange(len(corners))[:, None, None], pattern].reshape(-1, 3, 3)
+        first += count
+
+    return vectors
+
+
+def iter_step_relief_bands(img_arr, dx, dy, dz, band_width=256, oriented=False):
+    """generate step-relief triangles band by band of pixel columns, without a pre-count"""
+    width = img_arr.shape[1]
+    for x_start in range(0, width, band_width):
+        yield step_relief_vectors(img_arr, dx, dy, dz, x_start=x_start, x_stop=min(x_start + band_width, width),
+                                  oriented=oriented)
+
+
+def wall_fans(start_counts, end_counts):
+    """
+    triangulation of vertical walls whose two vertical sides carry start_counts and end_counts
+    vertices (at least two each: the bottom, any levels where other walls meet it, the top)
+
+    returns the wall of every triangle (t,) and its corners as side (t, 3), 0 start and 1 end,
+    and level (t, 3), counted from the bottom of that side. The end side is fanned from the
+    start's bottom, the start side from the end's top; seen from the side the normals point to,
+    start is on the left. Two levels per side give the quad split of closing_vectors
+    """
+    start_counts, end_counts = np.asarray(start_counts), np.asarray(end_counts)
+    end_triangles, start_triangles = end_counts - 1, start_counts - 1
+    per_wall = end_triangles + start_triangles
+
+    wall = np.repeat(np.arange(len(per_wall)), per_wall)
+    t = np.arange(len(wall)) - np.repeat(np.cumsum(per_wall) - per_wall, per_wall)
+    on_end = t < end_triangles[wall]
+    i = t - end_triangles[wall]
+
+    side = np.where(on_end[:, None], [0, 1, 1], [0, 1, 0])
+    level = np.stack([np.where(on_end, 0, i), np.where(on_end, t, end_counts[wall] - 1), np.where(on_end, t + 1, i + 1)],
+                     axis=1)
+    return wall, side, level
+
+
+def _side_levels(base_z, top_z, levels):
+    """sorted distinct levels (n, k + 2) of wall sides from base_z to top_z, NaN padded, and their counts"""
+    top_z = np.asarray(top_z, dtype=np.float64)
+    columns = [np.full(len(top_z), float(base_z)), top_z]
+    if levels is not None:
+        levels = np.asarray(levels, dtype=np.float64)
+        # only the levels strictly within a side split it
+        inner = (levels > base_z) & (levels < top_z[:, None])
+        columns.extend(np.where(inner, levels, np.nan).T)
+
+    side = np.sort(np.stack(columns, axis=1), axis=1)
+    repeated = np.zeros(side.shape, dtype=bool)
+    repeated[:, 1:] = side[:, 1:] == side[:, :-1]
+    side[repeated] = np.nan
+    side = np.sort(side, axis=1)
+    return side, np.count_nonzero(~np.isnan(side), axis=1)
+
+
+def closing_vectors(starts, ends, base_z, start_levels=None, end_levels=None):
+    """
+    side walls and base plate that close a relief surface into a solid
+
+    starts / ends are the (n, 3) top points of the consecutive edges of the surface's boundary
+    ring, each wall runs from an edge straight down to base_z and the base is a fan over the ring.
+    Where other walls of the relief meet a wall's vertical sides, start_levels / end_levels (n, k)
+    give their heights (NaN for none), the sides are split there so all walls share their vertices.
+    An empty ring gives no triangles
+    """
+    starts, ends = np.asarray(starts, dtype=np.float64), np.asarray(ends, dtype=np.float64)
+    if len(starts) == 0:
+        # nothing to close (a round relief of a tiny image has no rim)
+        return np.empty((0, 3, 3), dtype=np.float32)
+
+    # make the ring counter-clockwise seen from above, so every normal points outwards
+    signed_area = np.sum(starts[:, 0] * ends[:, 1] - ends[:, 0] * starts[:, 1])
+    if signed_area < 0:
+        starts, ends = ends[::-1], starts[::-1]
+        start_levels, end_levels = (None if end_levels is None else end_levels[::-1],
+                                    None if start_levels is None else start_levels[::-1])
+
+    starts_base, ends_base = starts.copy(), ends.copy()
+    starts_base[:, 2] = ends_base[:, 2] = base_z
+
+    start_side, start_counts = _side_levels(base_z, starts[:, 2], start_levels)
+    end_side, end_counts = _side_levels(base_z, ends[:, 2], end_levels)
+    wall, side, level = wall_fans(start_counts, end_counts)
+
+    walls = np.empty((len(wall), 3, 3))
+    xy = np.where(side[..., None] == 0, starts[wall][:, None, :2], ends[wall][:, None, :2])
+    walls[..., :2] = xy
+    walls[..., 2] = np.where(side == 0, start_side[wall[:, None], level], end_side[wall[:, None], level])
+
+    # the base fans out from the ring's centroid, wound clockwise so it faces down
+    center = np.append(starts_base[:, :2].mean(axis=0), base_z)
+    base = np.stack([np.broadcast_to(center, starts_base.shape), ends_base, starts_base], axis=1)
+
+    return np.concatenate([walls, base]).astype(np.float32)
+
+
+class TriangleBuffer:
+    """growable mesh.Mesh.dtype buffer, doubles its capacity when full"""
+
+    def __init__(self, capacity=1024):
+        self._data = np.zeros(capacity, dtype=mesh.Mesh.dtype)
+        self.triangle_count = 0
+
+    def extend(self, vectors):
+        """append an array of triangles with shape (n, 3, 3)"""
+        vectors = np.asarray(vectors)
+        new_count = self.triangle_count + len(vectors)
+
+        if new_count > len(self._data):
+            capacity = max(new_count, 2 * len(self._data))
+            grown = np.zeros(capacity, dtype=mesh.Mesh.dtype)
+            grown[:self.triangle_count] = self._data[:self.triangle_count]
+            self._data = grown
+
+        self._data['vectors'][self.triangle_count:new_count] = vectors
+        self.triangle_count = new_count
+
+    @property
+    def data(self):
+        """filled part of the buffer"""
+        return self._data[:self.triangle_count]
+
+
+def step_relief_data(img_arr, dx, dy, dz, oriented=False):
+    """step-relief triangles written straight into a mesh.Mesh.dtype buffer"""
+    data = np.zeros(step_relief_triangle_count(img_arr), dtype=mesh.Mesh.dtype)
+    step_relief_vectors(img_arr, dx, dy, dz, vectors=data['vectors'], oriented=oriented)
+    return data
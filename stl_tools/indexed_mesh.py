@@ -0,0 +1,486 @@
+"""shared-vertex (indexed) meshes, expanded to stl facets only when written"""
+from stl import mesh
+import numpy as np
+from stl_tools import fast_mesh, stl_io
+
+# x and y of generated vertices are whole multiples of 1 / GRID_STEPS pixel, see IndexedMesh.rescale
+GRID_STEPS = 8
+
+
+def _sortable_bits(values):
+    """float32 values as uint32 in the same order, -0.0 and 0.0 alike"""
+    bits = (values + np.float32(0.0)).view(np.uint32)
+    return np.where(bits >> 31 == 1, ~bits, bits | np.uint32(1 << 31))
+
+
+def unique_rows(points):
+    """
+    np.unique(points, axis=0, return_inverse=True) for (n, 3) float32 coordinates, same result,
+    but sorted with two integer argsorts instead of a much slower sort of whole rows: one by
+    (x, y), then one by (rank of (x, y), z)
+    """
+    points = np.ascontiguousarray(points, dtype=np.float32)
+    x, y, z = (_sortable_bits(points[:, axis]) for axis in range(3))
+
+    xy = (x.astype(np.uint64) << np.uint64(32)) | y
+    order = np.argsort(xy)
+    sorted_xy = xy[order]
+    new_xy = np.ones(len(points), dtype=bool)
+    new_xy[1:] = sorted_xy[1:] != sorted_xy[:-1]
+
+    keys = ((np.cumsum(new_xy) - 1).astype(np.uint64) << np.uint64(32)) | z[order]
+    by_key = np.argsort(keys)
+    order, keys = order[by_key], keys[by_key]
+    first = np.ones(len(points), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+
+    inverse = np.empty(len(points), dtype=np.intp)
+    inverse[order] = np.cumsum(first) - 1
+    return points[order[first]], inverse
+
+
+class IndexedMesh:
+    """triangle mesh stored as shared vertices (V, 3) float32 and faces (F, 3) uint32"""
+
+    def __init__(self, vertices, faces, heights=None, scale=None):
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+        self.faces = np.ascontiguousarray(faces, dtype=np.uint32)
+
+        # generated meshes keep the raw pixel height of every vertex (in the pixel array's dtype) and
+        # the scale (dx, dy, dz) they were made with, see rescale
+        self.heights = heights
+        self.scale = scale
+
+    @classmethod
+    def from_vectors(cls, vectors):
+        """index an array of triangles (n, 3, 3), merging vertices with identical coordinates"""
+        points = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, 3)
+        vertices, faces = unique_rows(points)
+        return cls(vertices, faces.reshape(-1, 3))
+
+    @classmethod
+    def concatenate(cls, meshes):
+        """one mesh out of several, vertices with identical coordinates are merged"""
+        offsets = np.cumsum([0] + [len(part.vertices) for part in meshes])
+        vertices = np.concatenate([part.vertices for part in meshes])
+        faces = np.concatenate([part.faces.astype(np.int64) + offset for part, offset in zip(meshes, offsets)])
+
+        vertices, new_index = unique_rows(vertices)
+        return cls(vertices, new_index[faces])
+
+    @property
+    def triangle_count(self):
+        return len(self.faces)
+
+    @property
+    def nbytes(self):
+        heights_bytes = 0 if self.heights is None else self.heights.nbytes
+        return self.vertices.nbytes + self.faces.nbytes + heights_bytes
+
+    def rescale(self, scale):
+        """
+        recompute the vertices in place for a new scale (dx, dy, dz), bit for bit what a new
+        generation at that scale would give; the faces stay as they are and stl normals are
+        computed from the vertices when facets are written, so they follow. Returns self
+
+        the generators compute every coordinate as float32(float64(grid units) * scale): x and y
+        lie on a 1 / GRID_STEPS pixel grid and are rounded back to it from the old scale, z comes
+        from the kept heights
+        """
+        if self.heights is None or self.scale is None:
+            raise ValueError('only generated meshes, which keep their heights and scale, can be rescaled')
+        if not all(self.scale[:2]):
+            raise ValueError('pixel positions cannot be recovered from a zero dx or dy')
+
+        for axis in range(2):
+            units = np.rint(self.vertices[:, axis].astype(np.float64) * (GRID_STEPS / self.scale[axis])) / GRID_STEPS
+            self.vertices[:, axis] = units * float(scale[axis])
+        self.vertices[:, 2] = self.heights.astype(np.float64) * float(scale[2])
+        self.scale = tuple(float(value) for value in scale)
+        return self
+
+    def vectors(self, start=0, stop=None):
+        """expand the faces [start, stop) to triangles (n, 3, 3)"""
+        return self.vertices[self.faces[start:stop]]
+
+    def iter_vectors(self, chunk_size=1 << 20):
+        """expand the faces chunk by chunk"""
+        for start in range(0, self.triangle_count, chunk_size):
+            yield self.vectors(start, start + chunk_size)
+
+    def to_mesh(self):
+        """fully expanded numpy-stl mesh"""
+        data = np.zeros(self.triangle_count, dtype=mesh.Mesh.dtype)
+        data['vectors'] = self.vectors()
+        return mesh.Mesh(data)
+
+    def save_stl(self, path, chunk_size=1 << 20):
+        """write a binary stl, expanding only one chunk of facets at a time; the header is written first and final"""
+        with stl_io.StlStreamWriter(path, expected_count=self.triangle_count) as writer:
+            for vectors in self.iter_vectors(chunk_size):
+                writer.write(vectors)
+        return writer.bytes_written
+
+
+class _LevelTable:
+    """
+    vertices at points that carry up to k distinct heights, levels and valid are k arrays of one
+    shape, the points (any shape, indexed like the arrays); x and y are the points' positions in
+    pixels, arrays of that shape or broadcastable to it
+
+    the vertices are numbered from first_id on by point (in row-major order), then by ascending
+    height, so the levels from lo to hi at a point are the consecutive ids from ids(lo) to ids(hi);
+    they are counted and ranked straight from the levels, without sorting anything
+    """
+
+    def __init__(self, levels, valid, x, y, first_id=0):
+        self.levels, self.x, self.y = levels, x, y
+
+        # first of every distinct height at a point
+        self.distinct = []
+        for j in range(len(levels)):
+            first = valid[j].copy()
+            for k in range(j):
+                first &= ~(valid[k] & (levels[k] == levels[j]))
+            self.distinct.append(first)
+
+        counts = np.zeros(levels[0].shape, dtype=np.uint32)
+        for first in self.distinct:
+            counts += first
+        self.first = (np.cumsum(counts, dtype=np.uint32).reshape(counts.shape) - counts) + np.uint32(first_id)
+        self.count = int(counts.sum())
+
+    def ids(self, points, z):
+        """vertex ids of the heights z at points (an index into the arrays), z is one of their levels"""
+        ids = self.first[points].copy()
+        for levels, first in zip(self.levels, self.distinct):
+            ids += first[points] & (levels[points] < z)
+        return ids
+
+    def scatter(self, grid_x, grid_y, heights):
+        """write the position (in pixels) and height of every vertex"""
+        for levels, first in zip(self.levels, self.distinct):
+            points = np.nonzero(first)
+            ids = self.ids(points, levels[points])
+            grid_x[ids] = np.broadcast_to(self.x, first.shape)[points]
+            grid_y[ids] = np.broadcast_to(self.y, first.shape)[points]
+            heights[ids] = levels[points]
+
+
+def _around_corners(img_arr):
+    """
+    the heights of the up to four pixels around every corner of the (height + 1, width + 1) corner
+    grid and whether they exist: around[j][cy, cx] is the pixel whose LR, LL, UR, UL corner it is
+    for j = 0, 1, 2, 3, with the (ox, oy) offsets of that pixel from (cx - 1, cy - 1)
+    """
+    height, width = img_arr.shape
+    padded = np.zeros((height + 2, width + 2), dtype=img_arr.dtype)
+    padded[1:-1, 1:-1] = img_arr
+    inside = np.zeros((height + 2, width + 2), dtype=bool)
+    inside[1:-1, 1:-1] = True
+    offsets = ((0, 0), (1, 0), (0, 1), (1, 1))
+    around = [padded[oy:oy + height + 1, ox:ox + width + 1] for ox, oy in offsets]
+    around_inside = [inside[oy:oy + height + 1, ox:ox + width + 1] for ox, oy in offsets]
+    return around, around_inside, offsets
+
+
+def _corner_table(around, around_inside, first_id=0):
+    """_LevelTable of the top corners, the distinct heights around every corner"""
+    corner_y, corner_x = np.ogrid[:around[0].shape[0], :around[0].shape[1]]
+    return _LevelTable(around, around_inside, corner_x, corner_y, first_id)
+
+
+def _corner_vertex_ids(img_arr):
+    """
+    vertex ids of the UL, UR, LL, LR top corners of every pixel, arrays [y, x], and the vertex count
+
+    the vertices are the distinct (corner, height) pairs, numbered by corner (row-major on the
+    (height + 1, width + 1) corner grid), then by ascending height, see _LevelTable
+    """
+    height, width = img_arr.shape
+    around, around_inside, offsets = _around_corners(img_arr)
+    corners = _corner_table(around, around_inside)
+
+    # a pixel's vertex at a corner is the corner's first vertex plus the number of lower distinct heights
+    ids = []
+    for ox, oy in offsets:
+        ids.append(corners.ids((slice(1 - oy, height + 1 - oy), slice(1 - ox, width + 1 - ox)), img_arr))
+    lower_right, lower_left, upper_right, upper_left = ids
+    return (upper_left, upper_right, lower_left, lower_right), corners.count
+
+
+def step_relief_indexed(img_arr, dx, dy, dz, oriented=False):
+    """
+    indexed version of fast_mesh.step_relief_vectors, with the same faces in the same order
+
+    every vertex of the step relief is a top corner of some pixel, see _corner_vertex_ids; all
+    per-pixel arrays are 32-bit and the output is written in place
+    """
+    height, width = img_arr.shape
+    corner_ids, vertex_count = _corner_vertex_ids(img_arr)
+
+    # scatter the corners' coordinates and heights, scaled like fast_mesh.step_relief_vectors
+    vertices = np.empty((vertex_count, 3), dtype=np.float32)
+    heights = np.empty(vertex_count, dtype=img_arr.dtype)
+    z = img_arr.astype(np.float64) * dz
+    for ids, (offset_x, offset_y) in zip(corner_ids, ((0, 0), (1, 0), (0, 1), (1, 1))):
+        vertices[ids, 0] = (np.arange(offset_x, width + offset_x) * dx)[None, :]
+        vertices[ids, 1] = (np.arange(height - 1 - offset_y, -1 - offset_y, -1) * dy)[:, None]
+        vertices[ids, 2] = z
+        heights[ids] = img_arr
+    del z
+
+    # faces in generator order (x-major), see fast_mesh.step_relief_vectors
+    upper_left, upper_right, lower_left, lower_right = corner_ids
+    change_right, change_bottom = fast_mesh.step_relief_changes(img_arr)
+    counts = 2 + 2 * change_right.T.astype(np.uint8) + 2 * change_bottom.T
+    first = (np.cumsum(counts, dtype=np.int64) - counts.ravel()).reshape(counts.shape)
+    faces = np.empty((int(first[-1, -1] + counts[-1, -1]), 3), dtype=np.uint32)
+    del counts
+
+    def put(rows, x, y, corners):
+        # corners are (ids, offset_x, offset_y), the corner of the pixel (x + offset_x, y + offset_y)
+        for j, (ids, offset_x, offset_y) in enumerate(corners):
+            faces[rows, j] = ids[y + offset_y, x + offset_x]
+
+    rows = first.ravel()
+    tops = (upper_left, lower_left, upper_right) if oriented else (upper_left, upper_right, lower_left)
+    for j, ids in enumerate(tops):
+        faces[rows, j] = ids.T.ravel()
+    for j, ids in enumerate((upper_right, lower_left, lower_right)):
+        faces[rows + 1, j] = ids.T.ravel()
+    del rows
+
+    # walls to the right neighbor's UL / LL and the bottom neighbor's UL / UR corners
+    x, y = np.nonzero(change_right.T)
+    rows = first[x, y] + 2
+    put(rows, x, y, ((upper_right, 0, 0), (lower_right, 0, 0), (upper_left, 1, 0)) if oriented else
+        ((upper_right, 0, 0), (upper_left, 1, 0), (lower_right, 0, 0)))
+    put(rows + 1, x, y, ((upper_left, 1, 0), (lower_right, 0, 0), (lower_left, 1, 0)))
+
+    x, y = np.nonzero(change_bottom.T)
+    rows = first[x, y] + 2 + 2 * change_right[y, x]
+    put(rows, x, y, ((lower_left, 0, 0), (upper_left, 0, 1), (lower_right, 0, 0)) if oriented else
+        ((lower_left, 0, 0), (lower_right, 0, 0), (upper_left, 0, 1)))
+    put(rows + 1, x, y, ((lower_right, 0, 0), (upper_left, 0, 1), (upper_right, 0, 1)))
+
+    return IndexedMesh(vertices, faces, heights, (dx, dy, dz))
+
+
+# depth (in pixels) of the triangles cut from a corner of a pixel at saddle corners, see step_relief_solid_indexed
+SADDLE_DENT = 1.0 / GRID_STEPS
+
+
+def saddle_corners(img_arr):
+    """
+    interior corners where two diagonally opposite pixels are both higher than the other two, as
+    boolean arrays [cy, cx] on the (height + 1, width + 1) corner grid: type_a where the UL and LR
+    pixels are the high ones, type_b where UR and LL are; and the dent level there, the higher
+    of the two low pixels
+    """
+    height, width = img_arr.shape
+    upper_left, upper_right = img_arr[:-1, :-1], img_arr[:-1, 1:]
+    lower_left, lower_right = img_arr[1:, :-1], img_arr[1:, 1:]
+
+    type_a = np.zeros((height + 1, width + 1), dtype=bool)
+    type_b = np.zeros((height + 1, width + 1), dtype=bool)
+    dent_level = np.zeros((height + 1, width + 1), dtype=img_arr.dtype)
+    type_a[1:-1, 1:-1] = np.minimum(upper_left, lower_right) > np.maximum(upper_right, lower_left)
+    type_b[1:-1, 1:-1] = np.minimum(upper_right, lower_left) > np.maximum(upper_left, lower_right)
+    dent_level[1:-1, 1:-1] = np.where(type_a[1:-1, 1:-1], np.maximum(upper_right, lower_left),
+                                      np.maximum(upper_left, lower_right))
+    return type_a, type_b, dent_level
+
+
+def saddle_pixels(type_a, type_b):
+    """pixels [y, x] with a saddle cut on their sides, see step_relief_solid_indexed"""
+    saddle = type_a | type_b
+    return saddle[:-1, :-1] | saddle[:-1, 1:] | type_b[1:, 1:] | type_a[1:, :-1]
+
+
+def step_relief_solid_indexed(img_arr, dx, dy, dz, plain_tops=True):
+    """
+    step relief of a solid, faces pointing out of it and made watertight: the vertical sides of
+    the walls are split at the heights of all walls meeting there, so neighboring walls share
+    their edges; fast_mesh.closing_vectors adds side walls and base
+
+    where four walls meet in one vertical edge (a saddle corner, two diagonally opposite pixels
+    higher than the other two), the pixels' tops would only touch along that edge. One high pixel
+    gets a triangle SADDLE_DENT pixels wide cut from that corner, lowered to the higher of the low
+    pixels, so one high pixel connects to the other around it. Pixels with a cut on their sides
+    are fanned from their center, the others get two triangles, unless plain_tops is False (see
+    stl_tools.PixelGroup.make_stl_adaptive)
+    """
+    height, width = img_arr.shape
+    type_a, type_b, dent_level = saddle_corners(img_arr)
+    special = saddle_pixels(type_a, type_b)
+
+    # saddles in row-major order: the dent is cut from the LR pixel (type a) or the LL pixel (type b)
+    # of the corner P, between P, V below it and H to the right (type a) or left (type b) of it
+    saddle_y, saddle_x = np.nonzero(type_a | type_b)
+    saddle_a = type_a[saddle_y, saddle_x]
+    level = dent_level[saddle_y, saddle_x]
+    saddle_index = np.full((height + 1, width + 1), -1, dtype=np.intp)
+    saddle_index[saddle_y, saddle_x] = np.arange(len(saddle_y))
+    dent_x = np.where(saddle_a, saddle_x, saddle_x - 1)
+    dent_z = img_arr[saddle_y, dent_x]
+
+    # vertex tables, heights in the pixel array's dtype; every point carries the heights of the
+    # tops and walls meeting there: the corners that of their pixels, the dent's instead of the dent
+    # pixel's, V the pixels left and right and the dent, H the pixels above and below and the dent
+    around, around_inside, offsets = _around_corners(img_arr)
+    around[3] = np.where(type_a, dent_level, around[3])
+    around[2] = np.where(type_b, dent_level, around[2])
+    corners = _corner_table(around, around_inside)
+    valid = [np.ones(len(saddle_y), dtype=bool)] * 3
+    v_points = _LevelTable([img_arr[saddle_y, saddle_x - 1], img_arr[saddle_y, saddle_x], level], valid,
+                           saddle_x, saddle_y + SADDLE_DENT, corners.count)
+    h_points = _LevelTable([img_arr[saddle_y - 1, dent_x], dent_z, level], valid,
+                           np.where(saddle_a, saddle_x + SADDLE_DENT, saddle_x - SADDLE_DENT), saddle_y,
+                           corners.count + v_points.count)
+    special_y, special_x = np.nonzero(special)
+    special_z = img_arr[special_y, special_x]
+    centers = _LevelTable([special_z], [np.ones(len(special_y), dtype=bool)], special_x + 0.5, special_y + 0.5,
+                          corners.count + v_points.count + h_points.count)
+    tables = (corners, v_points, h_points, centers)
+
+    grid_x = np.empty(sum(table.count for table in tables))
+    grid_y = np.empty(len(grid_x))
+    heights = np.empty(len(grid_x), dtype=img_arr.dtype)
+    for table in tables:
+        table.scatter(grid_x, grid_y, heights)
+    vertices = np.stack([grid_x * dx, (height - 1 - grid_y) * dy, heights.astype(np.float64) * dz], axis=1)
+    del grid_x, grid_y
+
+    faces = []
+    if plain_tops:
+        y, x = np.nonzero(~special)
+        z = img_arr[y, x]
+        upper_left, upper_right = corners.ids((y, x), z), corners.ids((y, x + 1), z)
+        lower_left, lower_right = corners.ids((y + 1, x), z), corners.ids((y + 1, x + 1), z)
+        faces.append(np.stack([upper_left, lower_left, upper_right, upper_right, lower_left, lower_right],
+                              axis=1).reshape(-1, 3))
+
+    # the others are fanned from their center over up to ten points around it, clockwise from UL
+    y, x = special_y, special_x
+    around_center = (
+        (~type_a[y, x], corners, (y, x)),
+        (type_a[y, x], h_points, saddle_index[y, x]),
+        (type_b[y, x + 1], h_points, saddle_index[y, x + 1]),
+        (~type_b[y, x + 1], corners, (y, x + 1)),
+        (saddle_index[y, x + 1] >= 0, v_points, saddle_index[y, x + 1]),
+        (np.ones(len(y), dtype=bool), corners, (y + 1, x + 1)),
+        (type_b[y + 1, x + 1], h_points, saddle_index[y + 1, x + 1]),
+        (type_a[y + 1, x], h_points, saddle_index[y + 1, x]),
+        (np.ones(len(y), dtype=bool), corners, (y + 1, x)),
+        (saddle_index[y, x] >= 0, v_points, saddle_index[y, x]),
+    )
+    fan = np.zeros((len(y), len(around_center)), dtype=np.int64)
+    present = np.stack([mask for mask, table, points in around_center], axis=1)
+    for j, (mask, table, points) in enumerate(around_center):
+        points = tuple(p[mask] for p in points) if isinstance(points, tuple) else points[mask]
+        fan[mask, j] = table.ids(points, special_z[mask])
+    row, slot = np.nonzero(present)
+    ring = fan[row, slot]
+    count = present.sum(axis=1)
+    next_in_ring = np.roll(ring, -1)
+    last = np.cumsum(count) - 1
+    next_in_ring[last] = ring[last - count + 1]
+    faces.append(np.stack([centers.ids(row, special_z[row]), next_in_ring, ring], axis=1))
+
+    # dent tops
+    saddles = np.arange(len(saddle_y))
+    corner_p, v_p, h_p = (corners.ids((saddle_y, saddle_x), level), v_points.ids(saddles, level),
+                          h_points.ids(saddles, level))
+    faces.append(np.stack([corner_p, np.where(saddle_a, v_p, h_p), np.where(saddle_a, h_p, v_p)], axis=1))
+
+    # walls as segments from a start to an end point with the tops right and left of start -> end
+    # (in mesh coordinates, seen from above); their faces point right, or left if the right top is higher
+    segments = []
+
+    def segment(start, end, right_z, left_z, on):
+        # start / end are functions of (which segments, heights) that give the vertex ids there
+        step = on & (right_z != left_z)
+        low, high = np.minimum(right_z, left_z)[step], np.maximum(right_z, left_z)[step]
+        segments.append((start(step, low), start(step, high), end(step, low), end(step, high),
+                         (right_z > left_z)[step]))
+
+    def at_corner(cy, cx):
+        return lambda step, z: corners.ids((cy[step], cx[step]), z)
+
+    def at_saddle(table, cy, cx):
+        return lambda step, z: table.ids(saddle_index[cy[step], cx[step]], z)
+
+    def at_either(saddle_mask, table, cy, cx):
+        def ids(step, z):
+            out = corners.ids((cy[step], cx[step]), z)
+            use = saddle_mask[step]
+            out[use] = table.ids(saddle_index[cy[step][use], cx[step][use]], z[use])
+            return out
+        return ids
+
+    # horizontal lines between pixels (y - 1, x) and (y, x), going +x: the pixel below is on the
+    # right; split at H where a type a saddle at (x, y) or a type b saddle at (x + 1, y) cuts a dent
+    y, x = (a.ravel() for a in np.mgrid[1:height, :width])
+    above, below = img_arr[y - 1, x], img_arr[y, x]
+    cut_start, cut_end = type_a[y, x], type_b[y, x + 1]
+    segment(at_corner(y, x), at_saddle(h_points, y, x), dent_level[y, x], above, cut_start)
+    segment(at_either(cut_start, h_points, y, x), at_either(cut_end, h_points, y, x + 1), below, above,
+            np.ones(len(y), dtype=bool))
+    segment(at_saddle(h_points, y, x + 1), at_corner(y, x + 1), dent_level[y, x + 1], above, cut_end)
+
+    # vertical lines between pixels (y, x - 1) and (y, x), going down the image: the left pixel is
+    # on the right; split at V below a saddle at (x, y), the dent is on the right (type a) or left
+    y, x = (a.ravel() for a in np.mgrid[:height, 1:width])
+    left, right = img_arr[y, x - 1], img_arr[y, x]
+    cut = saddle_index[y, x] >= 0
+    cut_a = type_a[y, x]
+    segment(at_corner(y, x), at_saddle(v_points, y, x), np.where(cut_a, left, dent_level[y, x]),
+            np.where(cut_a, dent_level[y, x], right), cut)
+    segment(at_either(cut, v_points, y, x), at_corner(y + 1, x), left, right, np.ones(len(y), dtype=bool))
+
+    # the dent's diagonal side from V to H, the dent is on the right of type b saddles
+    segment(lambda step, z: v_points.ids(saddles[step], z), lambda step, z: h_points.ids(saddles[step], z),
+            np.where(saddle_a, dent_z, level), np.where(saddle_a, level, dent_z), np.ones(len(saddles), dtype=bool))
+
+    for start_low, start_high, end_low, end_high, flip in segments:
+        wall, side, step = fast_mesh.wall_fans(start_high - start_low + 1, end_high - end_low + 1)
+        wall_faces = np.where(side == 0, start_low[wall, None], end_low[wall, None]) + step
+        wall_faces[flip[wall]] = wall_faces[flip[wall]][:, [0, 2, 1]]
+        faces.append(wall_faces)
+
+    return IndexedMesh(vertices, np.concatenate(faces), heights, (dx, dy, dz))
+
+
+def heightfield_indexed(img_arr, dx, dy, dz, y_top, cell_mask=None, oriented=False):
+    """
+    indexed version of fast_mesh.heightfield_vectors over the whole image, with the same faces in
+    the same order; a vertex is simply (x, y, img_arr[y, x])
+    """
+    height, width = img_arr.shape
+    if cell_mask is None:
+        cell_mask = np.ones((height - 1, width - 1), dtype=bool)
+
+    # keep only the pixels that are a corner of some cell
+    used = np.zeros((height, width), dtype=bool)
+    for offset_x, offset_y in ((0, 0), (1, 0), (0, 1), (1, 1)):
+        used[offset_y:offset_y + height - 1, offset_x:offset_x + width - 1] |= cell_mask
+    vertex_index = np.cumsum(used.ravel()).reshape(height, width) - 1
+
+    y, x = np.nonzero(used)
+    heights = img_arr[y, x]
+    vertices = np.stack([x * dx, (y_top - y) * dy, heights.astype(np.float64) * dz], axis=1)
+
+    # cells in generator order (x-major), corners NW, NE, SE, SW
+    x, y = np.nonzero(cell_mask.T)
+    corners = np.stack([vertex_index[y, x], vertex_index[y, x + 1], vertex_index[y + 1, x + 1], vertex_index[y + 1, x]],
+                       axis=1)
+    z = img_arr.astype(np.float64)
+    nw_se = fast_mesh.nw_se_diagonal(z[y, x], z[y, x + 1], z[y + 1, x + 1], z[y + 1, x])
+
+    pattern = np.where(nw_se[:, None, None], [[0, 1, 2], [2, 3, 0]], [[3, 0, 1], [1, 2, 3]])
+    if oriented:
+        pattern = pattern[..., [0, 2, 1]]
+
+    faces = corners[np.arange(len(corners))[:, None, None], pattern].reshape(-1, 3)
+    return IndexedMesh(vertices, faces, heights, (dx, dy, dz))
@@ -0,0 +1,192 @@
+"""
+image and height grid decoding into one compact height array, memory mapped where the file
+layout allows it: 8/16-bit images, float dems (32-bit tiff), .npy arrays and raw binary grids
+"""
+import os
+import tempfile
+
+from PIL import Image
+import numpy as np
+
+# numpy dtype of uncompressed pixel data, per PIL raw mode
+RAW_MODE_DTYPES = {
+    'L': '|u1',
+    'I;16': '<u2',
+    'I;16L': '<u2',
+    'I;16B': '>u2',
+    'I;32': '<i4',
+    'I;32B': '>i4',
+    'F;32F': '<f4',
+    'F;32BF': '>f4',
+}
+
+# images in these modes keep their precision (16-bit, 32-bit integer or float heights),
+# all others are converted to 8-bit grayscale
+HIGH_DEPTH_MODES = {
+    'I;16': np.uint16,
+    'I;16L': np.uint16,
+    'I;16B': np.uint16,
+    'I': np.int32,
+    'F': np.float32,
+}
+
+# raw binary grids without a header, the shape has to be given or the grid has to be square
+RAW_GRID_EXTENSIONS = ('.raw', '.bin')
+
+DEFAULT_BAND_ROWS = 256
+
+
+def raw_memmap(img):
+    """
+    copy-on-write memmap of the pixels of an opened (not yet loaded) image, or None
+
+    this works when the file stores the pixels uncompressed, row after row, in one of the
+    RAW_MODE_DTYPES (binary pgm, uncompressed tiff strips, ...); copy-on-write keeps the file
+    untouched when the height array is edited (see stl_tools_2.PixelGroup)
+    """
+    width, height = img.size
+    if img.mode not in ('L',) + tuple(HIGH_DEPTH_MODES) or not img.tile or not getattr(img, 'filename', None):
+        return None
+
+    tiles = sorted(img.tile, key=lambda tile: tile[1][1])
+    first_offset, raw_mode, next_row = tiles[0][2], None, 0
+    for codec, (x0, y0, x1, y1), offset, args in tiles:
+        args = (args,) if isinstance(args, str) else tuple(args)
+        stride = args[1] if len(args) > 1 else 0
+        orientation = args[2] if len(args) > 2 else 1
+        if codec != 'raw' or args[0] not in RAW_MODE_DTYPES or (raw_mode not in (None, args[0])):
+            return None
+        raw_mode = args[0]
+
+        row_bytes = width * np.dtype(RAW_MODE_DTYPES[raw_mode]).itemsize
+        if (x0, x1) != (0, width) or y0 != next_row or stride not in (0, row_bytes) or orientation != 1:
+            return None
+        if offset != first_offset + y0 * row_bytes:
+            return None
+        next_row = y1
+
+    if next_row != height:
+        return None
+    return np.memmap(img.filename, dtype=RAW_MODE_DTYPES[raw_mode], mode='c', offset=first_offset,
+                     shape=(height, width))
+
+
+def spill_array(shape, dtype, spill_dir):
+    """writable array backed by a temporary .npy file in spill_dir instead of memory"""
+    fd, path = tempfile.mkstemp(dir=spill_dir, suffix='.npy')
+    os.close(fd)
+    arr = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+    try:
+        # the mapping keeps the data alive, the file itself is not needed any more (not possible on windows)
+        os.remove(path)
+    except OSError:
+        pass
+    return arr
+
+
+def grid_memmap(path, shape=None, dtype='<f4'):
+    """copy-on-write memmap of a raw binary grid, a grid without shape has to be square"""
+    itemsize = np.dtype(dtype).itemsize
+    if shape is None:
+        side = int(round((os.path.getsize(path) // itemsize) ** 0.5))
+        if side * side * itemsize != os.path.getsize(path):
+            raise ValueError('{} is not a square grid of {}, give its shape'.format(path, np.dtype(dtype)))
+        shape = (side, side)
+    return np.memmap(path, dtype=dtype, mode='c', shape=tuple(shape))
+
+
+def load_height_array(img_path, spill_dir=None, band_rows=DEFAULT_BAND_ROWS, grid_shape=None, grid_dtype='<f4'):
+    """
+    height array [y, x] of an image or grid, in its own precision for .npy arrays, raw grids
+    (grid_shape, grid_dtype) and HIGH_DEPTH_MODES images, 8-bit grayscale (uint8) otherwise
+
+    arrays, grids and uncompressed images are memory mapped (see raw_memmap). Other images are
+    decoded once and converted band by band into the result, which lives in a temporary file in
+    spill_dir when one is given, so there is never a second full-size copy of the image in memory
+    """
+    ext = os.path.splitext(img_path)[1].lower()
+    if ext == '.npy':
+        arr = np.load(img_path, mmap_mode='c')
+        if arr.ndim != 2:
+            raise ValueError('{} holds a {}-d array, expected a 2-d height grid'.format(img_path, arr.ndim))
+        return arr
+    if ext in RAW_GRID_EXTENSIONS:
+        return grid_memmap(img_path, grid_shape, grid_dtype)
+
+    img = Image.open(img_path)
+    arr = raw_memmap(img)
+    if arr is not None:
+        return arr
+
+    high_depth = img.mode in HIGH_DEPTH_MODES
+    dtype = HIGH_DEPTH_MODES[img.mode] if high_depth else np.uint8
+    width, height = img.size
+    if spill_dir is None:
+        arr = np.empty((height, width), dtype=dtype)
+    else:
+        arr = spill_array((height, width), dtype, spill_dir)
+
+    img.load()
+    for y_start in range(0, height, band_rows):
+        band = img.crop((0, y_start, width, min(y_start + band_rows, height)))
+        arr[y_start:y_start + band.height] = np.asarray(band if high_depth else band.convert('L'), dtype=dtype)
+    img.close()
+    return arr
+
+
+def preview_image(img_path):
+    """PIL image to look at, height grids are scaled to 8-bit grayscale"""
+    ext = os.path.splitext(img_path)[1].lower()
+    if ext != '.npy' and ext not in RAW_GRID_EXTENSIONS:
+        return Image.open(img_path)
+
+    arr = load_height_array(img_path)
+    z_min, z_max = np.nanmin(arr), np.nanmax(arr)
+    scaled = (np.nan_to_num(arr[::max(1, arr.shape[0] // 1024), ::max(1, arr.shape[1] // 1024)], nan=z_min) - z_min)
+    return Image.fromarray((255 * scaled / max(z_max - z_min, 1e-12)).astype(np.uint8))
+
+
+def default_z_min(arr):
+    """images start at zero height, height grids (float or signed) at their lowest value"""
+    if arr.dtype.kind == 'u':
+        return 0
+    return float(np.nanmin(arr)) if arr.dtype.kind == 'f' else int(arr.min())
+
+
+def relative_heights(arr, z_min, spill_dir=None, band_rows=DEFAULT_BAND_ROWS):
+    """
+    heights above z_min (lower values and nan / no-data become 0) in the most compact dtype that
+    keeps their precision: arr itself for unsigned data with z_min 0, float grids in their own
+    precision (at least float32), unsigned integers wide enough for the highest height above
+    z_min otherwise (z_min may lie below the data, e.g. a negative z_min for an image), and
+    floats (as for a float grid of that integer type) when a fractional z_min makes fractional heights
+
+    the subtraction runs band by band into one new array (in spill_dir when given)
+    """
+    if arr.dtype.kind == 'u' and z_min == 0:
+        return arr
+    if arr.dtype.kind == 'f' or not float(z_min).is_integer():
+        dtype = np.promote_types(arr.dtype, np.float32)
+    else:
+        z_min = int(z_min)
+        top = max(int(arr.max()) - z_min, 0)
+        if top >= 1 << 64:
+            raise ValueError('heights up to {} above z_min {} do not fit in 64 bits'.format(top, z_min))
+        dtype = np.promote_types(np.dtype('u{}'.format(arr.dtype.itemsize)), np.min_scalar_type(top))
+
+    height, width = arr.shape
+    out = np.empty((height, width), dtype=dtype) if spill_dir is None else spill_array((height, width), dtype, spill_dir)
+    for y_start in range(0, height, band_rows):
+        band = arr[y_start:y_start + band_rows].astype(np.float64 if dtype.kind == 'f' else np.int64) - z_min
+        if arr.dtype.kind == 'f':
+            band = np.nan_to_num(band, nan=0.0)
+        out[y_start:y_start + band_rows] = np.maximum(band, 0)
+    return out
+
+
+def load_heights(img_path, z_min=None, spill_dir=None, grid_shape=None, grid_dtype='<f4'):
+    """height array ready for meshing: load_height_array, then relative_heights above z_min (default: default_z_min)"""
+    arr = load_height_array(img_path, spill_dir=spill_dir, grid_shape=grid_shape, grid_dtype=grid_dtype)
+    if z_min is None:
+        z_min = default_z_min(arr)
+    return relative_heights(arr, z_min, spill_dir)
@@ -0,0 +1,88 @@
+"""per-stage timing, counters and memory high-water marks of a conversion"""
+from contextlib import contextmanager
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # not available on windows, process high-water marks are not recorded there
+    resource = None
+
+
+def peak_rss_bytes():
+    """peak resident set size of this process so far, None where it is not available"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+class NullInstrumentation:
+    """no-op instrumentation, the default of PixelGroup: no timing, no counters, no progress bars"""
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def count(self, name, n=1):
+        pass
+
+    def progress(self, iterable, total=None, desc=None):
+        return iterable
+
+    def report(self):
+        return {'stages': [], 'counters': {}}
+
+
+class Instrumentation(NullInstrumentation):
+    """
+    records timed stage spans, counters and memory high-water marks
+
+    every finished stage is passed to callback (if given) as a dict with name, seconds and
+    peak_rss_bytes, plus peak_traced_bytes (the stage's own peak of traced allocations, numpy
+    arrays included) with trace_memory=True. progress=True shows tqdm bars on the slow
+    reference loops
+    """
+
+    def __init__(self, callback=None, trace_memory=False, progress=False):
+        self.callback = callback
+        self.trace_memory = trace_memory
+        self.show_progress = progress
+        self.stages = []
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name):
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            span = {'name': name, 'seconds': time.perf_counter() - start, 'peak_rss_bytes': peak_rss_bytes()}
+            if self.trace_memory:
+                span['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1] - traced_before
+            self.stages.append(span)
+            if self.callback is not None:
+                self.callback(span)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def progress(self, iterable, total=None, desc=None):
+        if not self.show_progress:
+            return iterable
+        import tqdm
+        return tqdm.tqdm(iterable, total=total, desc=desc)
+
+    def report(self):
+        """everything recorded so far, as a plain dict"""
+        return {'stages': [dict(span) for span in self.stages], 'counters': dict(self.counters)}
+
+
+NULL = NullInstrumentation()
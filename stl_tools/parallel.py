@@ -0,0 +1,73 @@
+"""multi-core mesh generation: the image is split into column tiles that worker processes triangulate"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+from stl import mesh
+import numpy as np
+
+
+def column_tiles(width, workers, tiles_per_worker=4):
+    """split the columns [0, width) into (x_start, x_stop) tiles, a few per worker for load balancing"""
+    tile_count = max(1, min(width, workers * tiles_per_worker))
+    edges = np.linspace(0, width, tile_count + 1).round().astype(int)
+    return [(int(x_start), int(x_stop)) for x_start, x_stop in zip(edges[:-1], edges[1:]) if x_stop > x_start]
+
+
+def _triangulate_tile(band_function, band, out_name, x_start, x_stop, count, params):
+    """worker: triangulate one tile of columns into the tile's shared output buffer"""
+    out_shm = shared_memory.SharedMemory(name=out_name)
+    try:
+        data = np.ndarray(count, dtype=mesh.Mesh.dtype, buffer=out_shm.buf)
+        band_function(band, x_start=x_start, x_stop=x_stop, column_offset=x_start, vectors=data['vectors'], **params)
+        del data
+    finally:
+        out_shm.close()
+
+
+def make_mesh_data(band_function, img_arr, tiles, tile_counts, triangle_count, workers, **params):
+    """
+    run band_function over all tiles on a process pool
+
+    tile_counts gives the number of triangles of every tile, so each tile is copied to its own
+    precomputed offset and the result is byte-identical to a serial run over the same tiles
+
+    a worker only gets the columns of its tile plus the column x_stop, the one-pixel overlap the
+    right / bottom neighbor lookups need at the seams. Every tile is written to its own shared
+    buffer, which is copied into the result and unlinked as soon as the tile is done; at most one
+    tile per worker plus one is in flight, so the peak stays close to the size of the result
+    """
+    offsets = np.concatenate([[0], np.cumsum(tile_counts)[:-1]]).astype(int)
+    data = np.zeros(triangle_count, dtype=mesh.Mesh.dtype)
+
+    pending = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for (x_start, x_stop), offset, count in zip(tiles, offsets, tile_counts):
+                if len(pending) > workers:
+                    _collect(pending, data, wait(pending, return_when=FIRST_COMPLETED).done)
+
+                out_shm = shared_memory.SharedMemory(create=True, size=max(int(count) * mesh.Mesh.dtype.itemsize, 1))
+                band = img_arr[:, x_start:x_stop + 1]
+                future = executor.submit(_triangulate_tile, band_function, band, out_shm.name,
+                                         x_start, x_stop, int(count), params)
+                pending[future] = (out_shm, int(offset), int(count))
+
+            _collect(pending, data, list(pending))
+    finally:
+        for out_shm, offset, count in pending.values():
+            out_shm.close()
+            out_shm.unlink()
+
+    return data
+
+
+def _collect(pending, data, futures):
+    """copy finished tiles into data and release their shared buffers"""
+    for future in futures:
+        future.result()
+        out_shm, offset, count = pending.pop(future)
+        try:
+            data[offset:offset + count] = np.ndarray(count, dtype=mesh.Mesh.dtype, buffer=out_shm.buf)
+        finally:
+            out_shm.close()
+            out_shm.unlink()
@@ -0,0 +1,212 @@
+"""what the square (stl_tools) and round (stl_tools_2) pixel groups share: loading, scaling and output"""
+import os
+
+from stl_tools import export, indexed_mesh, ingest, instrument, preview, resample
+
+
+class PixelGroupBase:
+    """
+    pixel data of one image, the part of stl_tools.PixelGroup and stl_tools_2.PixelGroup that does
+    not depend on how the relief is triangulated
+
+    subclasses provide
+      relief_triangle_count(img_arr): relief triangles of a pixel array, for the max_triangles budget
+      make_relief_indexed(): the relief surface as an indexed_mesh.IndexedMesh
+      closing_vectors(): (n, 3, 3) side wall and base plate facets that close the relief into a solid,
+        see fast_mesh.closing_vectors
+    and may extend prepare (masking of a freshly loaded pixel array), scale_factors (see depth_scale)
+    and preview_mask
+    """
+
+    # relief triangles of a pixel array, see resample.factor_for_triangle_budget
+    relief_triangle_count = None
+
+    def __init__(self, img_path, emboss_width_mm, emboss_depth_mm, solid=False, base_mm=1.0, output_format='stl',
+                 preview=False, instrumentation=None, spill_dir=None,
+                 z_min=None, grid_shape=None, grid_dtype='<f4', cell_mm=None, max_triangles=None, pooling='mean'):
+        # path of source image
+        self.img_path = img_path
+
+        # stage timings and counters, see instrument.Instrumentation (no-op by default)
+        self.instrumentation = instrumentation or instrument.NULL
+
+        # close the relief with side walls and a base plate base_mm below zero height
+        self.solid = solid
+        self.base_mm = base_mm
+
+        # extension of output_path: stl, ply or 3mf
+        self.output_format = output_format
+
+        # opt-in preview in an external image viewer
+        if preview:
+            ingest.preview_image(self.img_path).show()
+
+        # kept to load the pixel array again when a rescale changes the resampling, see load
+        self.load_params = {'z_min': z_min, 'spill_dir': spill_dir, 'grid_shape': grid_shape, 'grid_dtype': grid_dtype}
+        self.cell_mm, self.max_triangles, self.pooling = cell_mm, max_triangles, pooling
+        # pooling factor that meets max_triangles, it only depends on the source array
+        self.budget_factor = None
+
+        self.emboss_width_mm, self.emboss_depth_mm = emboss_width_mm, emboss_depth_mm
+        self.load()
+
+    def load(self):
+        """load the pixel array from img_path, resample it for the emboss width and set the scale"""
+        with self.instrumentation.stage('load'):
+            # one compact array of darkness values (or heights above z_min of a height grid), memory
+            # mapped (copy-on-write, prepare may edit it) or spilled to spill_dir where possible, see
+            # ingest.load_heights
+            img_arr = ingest.load_heights(self.img_path, **self.load_params)
+
+        # optional downsampling to cells of at least cell_mm and / or at most max_triangles relief triangles
+        source_shape, pixel_mm = img_arr.shape, float(self.emboss_width_mm) / img_arr.shape[1]
+        with self.instrumentation.stage('resample'):
+            if self.max_triangles is not None and self.budget_factor is None:
+                self.budget_factor = resample.factor_for_triangle_budget(img_arr, self.max_triangles,
+                                                                         self.relief_triangle_count, self.pooling)
+            factor = self.resample_factor(pixel_mm)
+            self.img_arr = resample.pool(img_arr, factor, self.pooling)
+
+        # pixel dimensions
+        self.height, self.width = self.img_arr.shape
+        self.instrumentation.count('pixels', self.height * self.width)
+        self.prepare()
+
+        # scaling values, see rescale
+        self.img_max = float(self.img_arr.max())
+        self.dx, self.dy, self.dz = self.scale_factors(self.emboss_width_mm, self.emboss_depth_mm)
+
+        # effective resolution, see resample.resolution_report
+        self.resolution = resample.resolution_report(source_shape, self.img_arr.shape, factor, pixel_mm, self.dx)
+
+    def resample_factor(self, pixel_mm):
+        """pooling factor for source pixels pixel_mm wide"""
+        factor = 1
+        if self.cell_mm is not None:
+            factor = resample.factor_for_cell_size(pixel_mm, self.cell_mm)
+        if self.budget_factor is not None:
+            factor = max(factor, self.budget_factor)
+        return factor
+
+    def prepare(self):
+        """called once the pixel array is loaded and resampled, before its scale is set"""
+
+    def scale_factors(self, emboss_width_mm, emboss_depth_mm):
+        """(dx, dy, dz): mm per pixel along x and y, mm per unit of darkness (or height)"""
+        dx = float(emboss_width_mm) / self.width
+        return dx, dx, self.depth_scale(emboss_depth_mm)
+
+    def depth_scale(self, emboss_depth_mm):
+        """dz that makes the highest pixel emboss_depth_mm high, 0 (a flat relief) when all pixels are at zero"""
+        if self.img_max == 0:
+            return 0.0
+        return float(emboss_depth_mm) / self.img_max
+
+    def rescale(self, emboss_width_mm=None, emboss_depth_mm=None, relief=None):
+        """
+        change the emboss size without meshing again: only dx, dy and dz change, the pixel array
+        and the faces do not depend on them
+
+        a relief from make_relief_indexed is rescaled in place (see indexed_mesh.IndexedMesh.rescale)
+        and returned, bit for bit the relief of a new PixelGroup of that size; pass it on to
+        make_indexed_mesh, which only rebuilds the cheap walls and base of a solid. With cell_mm the
+        resampling depends on the emboss width: if the new width needs another pooling factor, the
+        pixel array is loaded and resampled again and None is returned, the relief has to be made anew
+        """
+        if emboss_width_mm is not None:
+            self.emboss_width_mm = emboss_width_mm
+        if emboss_depth_mm is not None:
+            self.emboss_depth_mm = emboss_depth_mm
+
+        pixel_mm = float(self.emboss_width_mm) / self.resolution['source_shape'][1]
+        if self.resample_factor(pixel_mm) != self.resolution['factor']:
+            self.load()
+            return None
+
+        self.dx, self.dy, self.dz = self.scale_factors(self.emboss_width_mm, self.emboss_depth_mm)
+        self.resolution = dict(self.resolution, cell_mm=self.dx, source_cell_mm=pixel_mm)
+
+        if relief is not None:
+            relief.rescale((self.dx, self.dy, self.dz))
+        return relief
+
+    @property
+    def output_path(self):
+        """generate output file path, its extension selects the mesh format (see export.WRITERS)"""
+        head, tail = os.path.split(self.img_path)
+        filename, ext = os.path.splitext(tail)
+        new_tail = '{}.{}'.format(filename, self.output_format)
+        new_path = os.path.join(head, new_tail)
+        return new_path
+
+    @property
+    def output_preview_path(self):
+        """png thumbnail path next to the image, see make_preview"""
+        head, tail = os.path.split(self.img_path)
+        filename, ext = os.path.splitext(tail)
+        return os.path.join(head, '{}_preview.png'.format(filename))
+
+    @property
+    def output_stl_path(self):
+        """generate output file path for stl file"""
+        head, tail = os.path.split(self.img_path)
+        filename, ext = os.path.splitext(tail)
+        new_tail = '{}.stl'.format(filename)
+        new_path = os.path.join(head, new_tail)
+        return new_path
+
+    def make_indexed_mesh(self, relief=None):
+        """same mesh as make_stl as shared vertices and faces, optionally reusing a relief from make_relief_indexed"""
+        if relief is None:
+            relief = self.make_relief_indexed()
+        if self.solid:
+            closing = indexed_mesh.IndexedMesh.from_vectors(self.closing_vectors())
+            return indexed_mesh.IndexedMesh.concatenate([relief, closing])
+        return relief
+
+    def make_stl_indexed(self):
+        """make and save stl file from the indexed mesh, facets are only expanded chunk by chunk while writing"""
+        indexed = self.make_indexed_mesh()
+        with self.instrumentation.stage('save'):
+            bytes_written = indexed.save_stl(self.output_stl_path)
+        self.instrumentation.count('triangles', indexed.triangle_count)
+        self.instrumentation.count('bytes_written', bytes_written)
+
+    def make_output(self, cache=None):
+        """
+        make the indexed mesh and save it to output_path, returns the number of bytes written
+
+        with a cache.ResultCache an identical earlier result is copied instead of rebuilt
+        """
+        if cache is not None:
+            summary = cache.save_output(self, self.output_path)
+        else:
+            indexed = self.make_indexed_mesh()
+            with self.instrumentation.stage('save'):
+                summary = {'triangles': indexed.triangle_count, 'bytes': export.save(indexed, self.output_path)}
+
+        self.instrumentation.count('triangles', summary['triangles'])
+        self.instrumentation.count('bytes_written', summary['bytes'])
+        return summary['bytes']
+
+    def preview_mask(self):
+        """pixels shown by make_preview, None for all"""
+        return None
+
+    def make_preview(self, path=None, max_size=1024):
+        """
+        save a hill-shaded png of the relief to path (default: output_preview_path) without
+        building the mesh, see preview.height_preview; returns the path
+        """
+        path = path or self.output_preview_path
+        with self.instrumentation.stage('preview'):
+            image = preview.height_preview(self.img_arr, self.dx, self.dz, mask=self.preview_mask(), max_size=max_size)
+            image.save(path)
+        return path
+
+    def save_mesh(self, stl):
+        """save a numpy-stl mesh to output_stl_path, counting its triangles and bytes"""
+        with self.instrumentation.stage('save'):
+            stl.save(self.output_stl_path)
+        self.instrumentation.count('triangles', len(stl.data))
+        self.instrumentation.count('bytes_written', os.path.getsize(self.output_stl_path))
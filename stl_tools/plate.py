@@ -0,0 +1,110 @@
+"""build plate layout: many copies of a few parts in one preallocated mesh, without per-copy objects"""
+from stl import mesh
+import numpy as np
+
+
+def bounding_box(vectors):
+    """(mins, maxs) over all vertices of triangles (n, 3, 3), each an (x, y, z) array"""
+    points = np.asarray(vectors).reshape(-1, 3)
+    return points.min(axis=0), points.max(axis=0)
+
+
+def rotation_z(angles):
+    """rotation matrices (n, 3, 3) about the z-axis, angles in radians"""
+    angles = np.atleast_1d(np.asarray(angles, dtype=np.float64))
+    cos, sin = np.cos(angles), np.sin(angles)
+    rotations = np.zeros((len(angles), 3, 3))
+    rotations[:, 0, 0], rotations[:, 0, 1] = cos, -sin
+    rotations[:, 1, 0], rotations[:, 1, 1] = sin, cos
+    rotations[:, 2, 2] = 1.0
+    return rotations
+
+
+def transform_into(vectors, translations, out, rotations=None):
+    """
+    write one transformed copy of the triangles (n, 3, 3) per translation (k, 3) into out,
+    mesh.Mesh.dtype records of length k * n, copy after copy
+
+    rotations (k, 3, 3) are applied before translating; vertices and normals of all copies are
+    computed in one broadcast, no copy becomes an object of its own
+    """
+    vectors = np.asarray(vectors, dtype=np.float64)
+    translations = np.asarray(translations, dtype=np.float64)
+    copies, count = len(translations), len(vectors)
+    out_vectors = out['vectors'].reshape(copies, count, 3, 3)
+    out_normals = out['normals'].reshape(copies, count, 3)
+
+    edges = np.cross(vectors[:, 1] - vectors[:, 0], vectors[:, 2] - vectors[:, 0])
+    if rotations is None:
+        out_vectors[:] = vectors[None] + translations[:, None, None, :]
+        out_normals[:] = edges[None]
+    else:
+        out_vectors[:] = np.einsum('kij,tvj->ktvi', rotations, vectors) + translations[:, None, None, :]
+        out_normals[:] = np.einsum('kij,tj->kti', rotations, edges)
+
+
+def shelf_pack(footprints, plate_size, spacing=0.0):
+    """
+    place rectangles (n, 2) of (width, depth) on plates of plate_size with shelf packing
+
+    rectangles are sorted by depth and placed left to right on shelves, a new shelf starts when
+    the plate width is used up, a new plate when the plate depth is; returns the lower left
+    offsets (n, 2) and the plate index (n,) of every rectangle in the input order
+    """
+    footprints = np.asarray(footprints, dtype=np.float64).reshape(-1, 2)
+    plate_width, plate_depth = plate_size
+    too_big = (footprints[:, 0] > plate_width) | (footprints[:, 1] > plate_depth)
+    if too_big.any():
+        raise ValueError('{} footprints do not fit on a {} x {} plate'.format(int(too_big.sum()), plate_width,
+                                                                            plate_depth))
+
+    offsets = np.zeros_like(footprints)
+    plates = np.zeros(len(footprints), dtype=int)
+    plate, x, y, shelf_depth = 0, 0.0, 0.0, 0.0
+    for index in np.argsort(-footprints[:, 1], kind='stable'):
+        width, depth = footprints[index]
+        if x + width > plate_width:
+            x, y, shelf_depth = 0.0, y + shelf_depth + spacing, 0.0
+        if y + depth > plate_depth:
+            plate, x, y, shelf_depth = plate + 1, 0.0, 0.0, 0.0
+        offsets[index] = x, y
+        plates[index] = plate
+        x += width + spacing
+        shelf_depth = max(shelf_depth, depth)
+    return offsets, plates
+
+
+def layout(parts, copies, plate_size, spacing=2.0):
+    """
+    lay out copies[i] copies of every part (triangles (n_i, 3, 3)) flat on build plates
+
+    returns the mesh.Mesh.dtype records of all copies in one buffer and a dict of per-copy
+    arrays: part, plate, offset (x, y, z translation) and first_triangle. Plates after the first
+    are placed next to each other along x, spacing apart
+    """
+    parts = [np.asarray(part, dtype=np.float64) for part in parts]
+    boxes = [bounding_box(part) for part in parts]
+
+    part_of_copy = np.repeat(np.arange(len(parts)), copies)
+    sizes = np.array([maxs - mins for mins, maxs in boxes]).reshape(-1, 3)
+    offsets, plates = shelf_pack(sizes[part_of_copy, :2], plate_size, spacing)
+
+    # move every copy's bounding box corner to its place on its plate
+    mins = np.array([mins for mins, maxs in boxes]).reshape(-1, 3)
+    translations = -mins[part_of_copy]
+    translations[:, :2] += offsets
+    translations[:, 0] += plates * (plate_size[0] + spacing)
+
+    triangle_counts = np.array([len(part) for part in parts])[part_of_copy]
+    first_triangle = np.concatenate([[0], np.cumsum(triangle_counts)[:-1]]).astype(int)
+    data = np.zeros(int(triangle_counts.sum()), dtype=mesh.Mesh.dtype)
+
+    # copies are stored part by part, so the copies of one part fill one contiguous block
+    for part_index, part in enumerate(parts):
+        selected = np.nonzero(part_of_copy == part_index)[0]
+        if len(selected) == 0:
+            continue
+        start = first_triangle[selected[0]]
+        transform_into(part, translations[selected], data[start:start + len(selected) * len(part)])
+
+    return data, {'part': part_of_copy, 'plate': plates, 'offset': translations, 'first_triangle': first_triangle}
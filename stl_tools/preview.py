@@ -0,0 +1,175 @@
+"""headless previews: hill-shaded png thumbnails of height arrays and meshes, no display needed"""
+import math
+
+from PIL import Image
+import numpy as np
+from stl_tools import resample, stl_io
+
+BACKGROUND = 255
+
+# bounding box pixels of the triangles scan converted at once
+CHUNK_SAMPLES = 1 << 22
+
+# above this many triangles per preview pixel only one corner per triangle is splatted
+LOD_TRIANGLES_PER_PIXEL = 4
+
+
+def shade(z, pixel_mm, azimuth_deg=315.0, altitude_deg=45.0):
+    """
+    hill shading in [0, 1] of a height grid z [row, col] (rows running south), lit from
+    azimuth_deg (clockwise from north) and altitude_deg above the horizon
+
+    the surface normals are the vertex normals of the height field, from its central differences
+    """
+    # np.gradient needs two samples along an axis, a single row or column is flat along it
+    z = z.astype(np.float64)
+    gradient_south, gradient_east = (np.gradient(z, pixel_mm, axis=axis) if z.shape[axis] > 1 else np.zeros(z.shape)
+                                     for axis in (0, 1))
+    azimuth, altitude = math.radians(azimuth_deg), math.radians(altitude_deg)
+    light = (math.cos(altitude) * math.sin(azimuth), math.cos(altitude) * math.cos(azimuth), math.sin(altitude))
+
+    # normal (-dz/dx_east, -dz/dy_north, 1) with dz/dy_north = -dz/dy_south
+    lit = (-gradient_east * light[0] + gradient_south * light[1] + light[2])
+    return np.clip(lit / np.sqrt(gradient_east ** 2 + gradient_south ** 2 + 1.0), 0.0, 1.0)
+
+
+def shaded_image(z, pixel_mm, background=None, **light):
+    """8-bit grayscale image of shade(z), background pixels (mask) left white"""
+    gray = (255 * shade(z, pixel_mm, **light)).astype(np.uint8)
+    if background is not None:
+        gray[background] = BACKGROUND
+    return Image.fromarray(gray)
+
+
+def height_preview(heights, dx, dz, mask=None, max_size=1024, **light):
+    """
+    preview of a height array (pixel values times dz, pixels dx wide), the level of detail is
+    reduced with max pooling until it fits into max_size x max_size pixels; cells outside mask
+    (a boolean array of the same shape, optional) are background
+    """
+    factor = max(1, int(math.ceil(max(heights.shape) / float(max_size))))
+    z = resample.pool(heights, factor, 'max').astype(np.float64) * dz
+    background = None
+    if mask is not None:
+        background = resample.pool(np.asarray(mask, dtype=np.uint8), factor, 'max') == 0
+        z[background] = z[~background].min() if (~background).any() else 0.0
+    return shaded_image(z, dx * factor, background, **light)
+
+
+def _corner_min(a):
+    """minimum over the three corners of (n, 3) per-triangle values, faster than min(axis=1)"""
+    return np.minimum(np.minimum(a[:, 0], a[:, 1]), a[:, 2])
+
+
+def _corner_max(a):
+    """maximum over the three corners of (n, 3) per-triangle values"""
+    return np.maximum(np.maximum(a[:, 0], a[:, 1]), a[:, 2])
+
+
+def _ranges(starts, counts):
+    """(group, value) pairs of the integer ranges [starts[i], starts[i] + counts[i]), all at once"""
+    counts = np.maximum(counts, 0)
+    group = np.repeat(np.arange(len(counts)), counts)
+    first = np.cumsum(counts) - counts
+    return group, starts[group] + np.arange(len(group)) - first[group]
+
+
+def _scanline_pixels(x, y):
+    """
+    pixels whose centers lie in triangles (n, 3) of pixel coordinates x, y, as triangle, col, row
+
+    every triangle is cut into pixel rows and every row into a span of pixels, so the work is
+    proportional to the area covered and not to the bounding boxes (long slivers stay cheap)
+    """
+    row_start = np.ceil(_corner_min(y) - 0.5).astype(int)
+    row_stop = np.floor(_corner_max(y) - 0.5).astype(int) + 1
+    triangle, row = _ranges(row_start, row_stop - row_start)
+    center_y = row + 0.5
+
+    # crossings of the row centers with the three edges
+    left, right = np.full(len(row), np.inf), np.full(len(row), -np.inf)
+    for a, b in ((0, 1), (1, 2), (2, 0)):
+        xa, ya, xb, yb = x[triangle, a], y[triangle, a], x[triangle, b], y[triangle, b]
+        crosses = (np.minimum(ya, yb) <= center_y) & (center_y <= np.maximum(ya, yb)) & (ya != yb)
+        crossing_x = xa + (center_y - ya) * (xb - xa) / np.where(ya != yb, yb - ya, 1.0)
+        left = np.where(crosses, np.minimum(left, crossing_x), left)
+        right = np.where(crosses, np.maximum(right, crossing_x), right)
+
+    col_start = np.ceil(np.where(np.isfinite(left), left, 0.0) - 0.5).astype(int)
+    col_stop = np.floor(np.where(np.isfinite(right), right, -1.0) - 0.5).astype(int) + 1
+    span, col = _ranges(col_start, col_stop - col_start)
+    return triangle[span], col, row[span]
+
+
+def zbuffer(vectors, max_size=512, chunk_size=1 << 20):
+    """
+    top view z-buffer of triangles (n, 3, 3), at most max_size pixels wide or high; returns
+    the highest z per pixel (rows running south, -inf where nothing was drawn) and the pixel size
+
+    level of detail is automatic: vertices are splatted into their pixels, which alone covers
+    triangles of up to a pixel, and only larger triangles are scan converted. With more than
+    LOD_TRIANGLES_PER_PIXEL triangles per pixel only the first corner of every triangle is
+    splatted. Triangles are read chunk by chunk, so memory mapped meshes (see stl_io) are never
+    loaded as a whole
+    """
+    mins, maxs = np.full(3, np.inf), np.full(3, -np.inf)
+    for start in range(0, len(vectors), chunk_size):
+        points = np.asarray(vectors[start:start + chunk_size], dtype=np.float32).reshape(-1, 3)
+        for axis in range(3):
+            mins[axis] = min(mins[axis], points[:, axis].min())
+            maxs[axis] = max(maxs[axis], points[:, axis].max())
+
+    pixel_mm = max(maxs[0] - mins[0], maxs[1] - mins[1]) / max_size or 1.0
+    width = int(min(max_size, math.floor((maxs[0] - mins[0]) / pixel_mm) + 1))
+    height = int(min(max_size, math.floor((maxs[1] - mins[1]) / pixel_mm) + 1))
+    z_buffer = np.full((height, width), -np.inf)
+    corners = 1 if len(vectors) > LOD_TRIANGLES_PER_PIXEL * width * height else 3
+
+    def draw(col, row, z):
+        inside = (col >= 0) & (col < width) & (row >= 0) & (row < height)
+        np.maximum.at(z_buffer, (row[inside], col[inside]), z[inside])
+
+    for start in range(0, len(vectors), chunk_size):
+        chunk = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+        # pixel coordinates, x east and y south (float32 is plenty for a few thousand pixels)
+        x = (chunk[..., 0] - np.float32(mins[0])) * np.float32(1.0 / pixel_mm)
+        y = (np.float32(maxs[1]) - chunk[..., 1]) * np.float32(1.0 / pixel_mm)
+        z = chunk[..., 2]
+        draw(x[:, :corners].astype(int).ravel(), y[:, :corners].astype(int).ravel(), z[:, :corners].ravel())
+
+        # triangles larger than a pixel (and not vertical walls) are scan converted
+        area = (x[:, 1] - x[:, 0]) * (y[:, 2] - y[:, 0]) - (x[:, 2] - x[:, 0]) * (y[:, 1] - y[:, 0])
+        extent = np.maximum(_corner_max(x) - _corner_min(x), _corner_max(y) - _corner_min(y))
+        large = np.nonzero((extent > 1) & (np.abs(area) > 1e-6))[0]
+        if len(large) == 0:
+            continue
+
+        x, y, z, area = (a[large].astype(np.float64) for a in (x, y, z, area))
+        # batches of about CHUNK_SAMPLES bounding box pixels
+        box_pixels = np.cumsum((_corner_max(x) - _corner_min(x) + 2) * (_corner_max(y) - _corner_min(y) + 2))
+        bounds = np.searchsorted(box_pixels // CHUNK_SAMPLES, np.arange(box_pixels[-1] // CHUNK_SAMPLES + 2))
+        for first, stop in zip(bounds[:-1], bounds[1:]):
+            triangle, col, row = _scanline_pixels(x[first:stop], y[first:stop])
+            t = triangle + first
+
+            # z of the plane through the triangle at the pixel centers, barycentric interpolation
+            px, py = col + 0.5, row + 0.5
+            l1 = ((px - x[t, 0]) * (y[t, 2] - y[t, 0]) - (x[t, 2] - x[t, 0]) * (py - y[t, 0])) / area[t]
+            l2 = ((x[t, 1] - x[t, 0]) * (py - y[t, 0]) - (px - x[t, 0]) * (y[t, 1] - y[t, 0])) / area[t]
+            draw(col, row, (1.0 - l1 - l2) * z[t, 0] + l1 * z[t, 1] + l2 * z[t, 2])
+
+    return z_buffer, pixel_mm
+
+
+def mesh_preview(vectors, max_size=512, **light):
+    """hill-shaded top view of triangles (n, 3, 3), see zbuffer"""
+    z_buffer, pixel_mm = zbuffer(vectors, max_size)
+    background = np.isinf(z_buffer)
+    z_buffer[background] = z_buffer[~background].min() if (~background).any() else 0.0
+    return shaded_image(z_buffer, pixel_mm, background, **light)
+
+
+def save_stl_preview(stl_path, png_path, max_size=512, **light):
+    """png thumbnail of an stl file, read through a memory map (see stl_io.read_facets)"""
+    mesh_preview(stl_io.read_facets(stl_path)['vectors'], max_size, **light).save(png_path)
+    return png_path
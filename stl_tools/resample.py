@@ -0,0 +1,77 @@
+"""downsampling of height arrays to a target cell size or triangle budget before meshing"""
+import math
+
+import numpy as np
+
+POOLING = ('mean', 'max')
+
+
+def pool(arr, factor, method='mean', band_blocks=64):
+    """
+    reduce blocks of factor x factor pixels to one pixel by their mean or max
+
+    blocks at the right and bottom border may be smaller than factor x factor, nothing is cut
+    off; integer heights stay integers (means are rounded) so flat areas stay flat, float heights
+    keep their precision (at least float32, see ingest.relative_heights). The input is
+    read band by band, so a memory mapped array is never loaded as a whole
+    """
+    if method not in POOLING:
+        raise ValueError('unknown pooling {!r}, expected one of {}'.format(method, ', '.join(POOLING)))
+    if factor <= 1:
+        return arr
+
+    height, width = arr.shape
+    starts_y, starts_x = np.arange(0, height, factor), np.arange(0, width, factor)
+    floating = arr.dtype.kind == 'f'
+    dtype = np.promote_types(arr.dtype, np.float32) if floating else arr.dtype
+    out = np.empty((len(starts_y), len(starts_x)), dtype=dtype)
+
+    # block sizes, smaller at the border
+    counts = np.outer(np.diff(np.append(starts_y, height)), np.diff(np.append(starts_x, width)))
+
+    band_rows = factor * band_blocks
+    for band_start in range(0, height, band_rows):
+        band = np.asarray(arr[band_start:band_start + band_rows])
+        rows = slice(band_start // factor, band_start // factor + len(range(0, len(band), factor)))
+        if method == 'max':
+            out[rows] = np.maximum.reduceat(np.maximum.reduceat(band, np.arange(0, len(band), factor), axis=0),
+                                            starts_x, axis=1)
+        else:
+            sums = np.add.reduceat(np.add.reduceat(band, np.arange(0, len(band), factor), axis=0, dtype=np.float64),
+                                   starts_x, axis=1)
+            means = sums / counts[rows]
+            out[rows] = means if floating else np.rint(means)
+    return out
+
+
+def factor_for_cell_size(pixel_mm, cell_mm):
+    """smallest pooling factor that makes cells at least cell_mm wide"""
+    return max(1, int(math.ceil(cell_mm / pixel_mm - 1e-9)))
+
+
+def factor_for_triangle_budget(arr, max_triangles, triangle_count, method='mean'):
+    """
+    smallest pooling factor whose pooled array gets at most max_triangles from triangle_count(pooled),
+    starting the search from the square-root estimate
+    """
+    full = triangle_count(arr)
+    if full <= max_triangles:
+        return 1
+
+    factor = max(2, int(math.sqrt(full / float(max_triangles))))
+    while factor > 2 and triangle_count(pool(arr, factor - 1, method)) <= max_triangles:
+        factor -= 1
+    while triangle_count(pool(arr, factor, method)) > max_triangles and factor < max(arr.shape):
+        factor += 1
+    return factor
+
+
+def resolution_report(source_shape, shape, factor, pixel_mm, cell_mm):
+    """what the resampling did, cell sizes in mm"""
+    return {
+        'factor': int(factor),
+        'source_shape': tuple(int(n) for n in source_shape),
+        'shape': tuple(int(n) for n in shape),
+        'source_cell_mm': float(pixel_mm),
+        'cell_mm': float(cell_mm),
+    }
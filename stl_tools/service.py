@@ -0,0 +1,425 @@
+"""
+conversion service: python -m stl_tools.service [--port 8765 | --unix-socket PATH]
+
+a small asyncio http server in front of a pool of worker processes that have imported the whole
+pipeline once, at start-up. POST /convert?name=logo.png&width=100&depth=5&... with the image as
+the request body returns the mesh, streamed while the worker writes it; GET /metrics returns queue
+depth, job counts and latencies, GET /health the pool size. Jobs wait in a bounded queue (a full
+queue answers 503) and a semaphore limits how many run at once, so memory use stays bounded
+"""
+import argparse
+import asyncio
+import collections
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+import importlib
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+from stl_tools import cache, cli, resample
+
+CONTENT_TYPES = {
+    'stl': 'model/stl',
+    'ply': 'application/octet-stream',
+    '3mf': 'model/3mf',
+}
+
+# formats written front to back, so a file can be sent while it grows (3mf archives are patched
+# when they are closed, they are only sent when complete)
+STREAMABLE_FORMATS = ('stl', 'ply')
+
+# query parameters of /convert: (type, default), defaults as in the command line tool
+PARAMETERS = {
+    'shape': (str, 'square'),
+    'format': (str, 'stl'),
+    'width': (float, 100.0),
+    'depth': (float, 5.0),
+    'solid': (bool, False),
+    'base': (float, 1.0),
+    'cell_mm': (float, None),
+    'max_triangles': (int, None),
+    'pooling': (str, 'mean'),
+    'z_min': (float, None),
+    'grid_shape': (cli.grid_shape, None),
+    'grid_dtype': (str, '<f4'),
+}
+
+CHUNK_SIZE = 1 << 20
+POLL_SECONDS = 0.02
+HEADER_LIMIT = 1 << 16
+
+# completed jobs kept for the latency metrics
+LATENCY_WINDOW = 1000
+
+
+class RequestError(Exception):
+    """a request that is answered with an error status and message"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def warm_up():
+    """worker initializer: import the pipeline once per process instead of once per job"""
+    for module in ('stl_tools.stl_tools', 'stl_tools.stl_tools_2'):
+        importlib.import_module(module)
+
+
+def worker_pid():
+    return os.getpid()
+
+
+def parse_params(query):
+    """conversion parameters (see cli.convert) from a query dict, raises RequestError on bad values"""
+    unknown = set(query) - set(PARAMETERS) - {'name'}
+    if unknown:
+        raise RequestError(HTTPStatus.BAD_REQUEST, 'unknown parameters: {}'.format(', '.join(sorted(unknown))))
+
+    params = {}
+    for name, (kind, default) in PARAMETERS.items():
+        if name not in query or query[name] == '':
+            params[name] = default
+        elif kind is bool:
+            params[name] = query[name].lower() in ('1', 'true', 'yes', 'on')
+        else:
+            try:
+                params[name] = kind(query[name])
+            except ValueError:
+                raise RequestError(HTTPStatus.BAD_REQUEST, '{}: expected {}, got {!r}'.format(
+                    name, kind.__name__, query[name]))
+
+    choices = {'shape': ('square', 'round'), 'format': tuple(CONTENT_TYPES), 'pooling': resample.POOLING}
+    for name, allowed in choices.items():
+        if params[name] not in allowed:
+            raise RequestError(HTTPStatus.BAD_REQUEST, '{}: expected one of {}'.format(name, ', '.join(allowed)))
+    return params
+
+
+def percentiles(values):
+    """count, mean, p50, p95 and max of a list of seconds"""
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {'count': len(ordered), 'mean': sum(ordered) / len(ordered), 'p50': at(0.5), 'p95': at(0.95),
+            'max': ordered[-1]}
+
+
+class Job:
+    """one uploaded image on its way through the queue and the pool"""
+
+    def __init__(self, workdir, img_path, out_path, params):
+        self.workdir = workdir
+        self.img_path = img_path
+        self.out_path = out_path
+        self.params = params
+        self.enqueued = time.perf_counter()
+        self.started = None
+        self.first_byte = None
+        # set by the dispatcher: the worker's result, an asyncio future
+        self.result = None
+        self.running = asyncio.Event()
+
+
+class ConversionService:
+    """
+    bounded job queue, a semaphore of max_jobs running jobs and a pre-warmed process pool
+
+    cache_dir and spill_dir are passed on to every job (see cli.convert): a result cache shared by
+    all workers, and a directory for height arrays too large to keep in memory
+    """
+
+    def __init__(self, workers=None, max_jobs=None, queue_size=64, max_upload_bytes=256 << 20, cache_dir=None,
+                 cache_size=cache.DEFAULT_MAX_BYTES, spill_dir=None):
+        self.workers = workers or os.cpu_count()
+        self.max_jobs = max_jobs or self.workers
+        self.max_upload_bytes = max_upload_bytes
+        self.job_params = {'cache_dir': cache_dir, 'cache_size': cache_size, 'spill_dir': spill_dir,
+                           'preview': False, 'preview_size': None}
+
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.slots = asyncio.Semaphore(self.max_jobs)
+        self.pool = None
+        self.dispatcher = None
+
+        self.counters = collections.Counter()
+        self.running = 0
+        self.latencies = {name: collections.deque(maxlen=LATENCY_WINDOW)
+                          for name in ('queue_seconds', 'first_byte_seconds', 'total_seconds')}
+        self.started = time.perf_counter()
+
+    def make_pool(self):
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'), initializer=warm_up)
+
+    async def start(self):
+        """start the worker processes and wait until all of them have imported the pipeline"""
+        self.pool = self.make_pool()
+        loop = asyncio.get_running_loop()
+        # one call per worker at once, so every process is started now and not by the first jobs
+        pids = await asyncio.gather(*(loop.run_in_executor(self.pool, worker_pid) for _ in range(self.workers)))
+        self.dispatcher = asyncio.create_task(self.dispatch())
+        return sorted(set(pids))
+
+    async def close(self):
+        if self.dispatcher is not None:
+            self.dispatcher.cancel()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+
+    async def dispatch(self):
+        """move queued jobs into the pool whenever a slot is free"""
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            await self.slots.acquire()
+            self.running += 1
+            job.started = time.perf_counter()
+            try:
+                job.result = self.submit(loop, job)
+            except BrokenProcessPool:
+                # a worker died (out of memory, killed), the pool is unusable: start a new one
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = self.make_pool()
+                job.result = self.submit(loop, job)
+            job.result.add_done_callback(self.job_done)
+            job.running.set()
+
+    def submit(self, loop, job):
+        return loop.run_in_executor(self.pool, cli.convert, job.img_path, job.out_path,
+                                    dict(job.params, **self.job_params))
+
+    def job_done(self, result):
+        self.running -= 1
+        self.slots.release()
+        self.counters['failed' if result.cancelled() or result.exception() else 'completed'] += 1
+
+    def metrics(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'queue_size': self.queue.maxsize,
+            'running': self.running,
+            'max_jobs': self.max_jobs,
+            'workers': self.workers,
+            'jobs': {name: self.counters[name] for name in ('accepted', 'rejected', 'completed', 'failed')},
+            'latency': {name: percentiles(list(values)) for name, values in self.latencies.items()},
+            'uptime_seconds': time.perf_counter() - self.started,
+        }
+
+    async def handle(self, reader, writer):
+        """one http request per connection"""
+        try:
+            method, target, headers = await read_request_head(reader)
+            url = urlsplit(target)
+            query = dict(parse_qsl(url.query, keep_blank_values=True))
+            if url.path == '/convert' and method == 'POST':
+                await self.convert(reader, writer, headers, query)
+            elif url.path == '/metrics' and method == 'GET':
+                await send_json(writer, HTTPStatus.OK, self.metrics())
+            elif url.path == '/health' and method == 'GET':
+                await send_json(writer, HTTPStatus.OK, {'status': 'ok', 'workers': self.workers})
+            else:
+                raise RequestError(HTTPStatus.NOT_FOUND, 'no {} {}'.format(method, url.path))
+        except RequestError as error:
+            await send_json(writer, error.status, {'error': str(error)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def convert(self, reader, writer, headers, query):
+        params = parse_params(query)
+        ext = os.path.splitext(query.get('name', 'upload.png'))[1].lower()
+        if ext not in cli.IMAGE_EXTENSIONS:
+            raise RequestError(HTTPStatus.BAD_REQUEST, 'name: expected one of {}'.format(
+                ', '.join(cli.IMAGE_EXTENSIONS)))
+        if 'content-length' not in headers:
+            raise RequestError(HTTPStatus.LENGTH_REQUIRED, 'the upload needs a Content-Length')
+        value = headers['content-length']
+        # digits only: int() would also take signs, spaces and underscores
+        if not (value.isascii() and value.isdigit()):
+            raise RequestError(HTTPStatus.BAD_REQUEST, 'Content-Length: expected a number of bytes, got {!r}'.format(
+                value))
+        length = int(value)
+        if length > self.max_upload_bytes:
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'uploads are limited to {} bytes'.format(
+                self.max_upload_bytes))
+
+        # backpressure: refuse at once instead of buffering uploads without bound
+        if self.queue.full():
+            self.counters['rejected'] += 1
+            raise RequestError(HTTPStatus.SERVICE_UNAVAILABLE, 'queue full, retry later')
+
+        workdir = tempfile.mkdtemp(prefix='stl_tools_job_')
+        try:
+            job = Job(workdir, os.path.join(workdir, 'input' + ext),
+                      os.path.join(workdir, 'output.' + params['format']), params)
+            await read_body(reader, job.img_path, length)
+            try:
+                self.queue.put_nowait(job)
+            except asyncio.QueueFull:
+                self.counters['rejected'] += 1
+                raise RequestError(HTTPStatus.SERVICE_UNAVAILABLE, 'queue full, retry later')
+            self.counters['accepted'] += 1
+
+            await job.running.wait()
+            try:
+                await self.stream_output(writer, job)
+            finally:
+                # the job owns its workdir until the worker is done, even if the client has gone
+                await asyncio.wait([job.result])
+                self.record(job)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    async def stream_output(self, writer, job):
+        """send the output file while the worker writes it, chunked; errors before the first byte become a 500"""
+        streamable = job.params['format'] in STREAMABLE_FORMATS
+        sent = 0
+        fh = None
+        try:
+            while True:
+                finished = job.result.done()
+                if finished and job.result.exception() is not None and sent == 0:
+                    raise RequestError(HTTPStatus.INTERNAL_SERVER_ERROR, 'conversion failed: {}'.format(
+                        job.result.exception()))
+
+                if fh is None and (finished or streamable) and os.path.exists(job.out_path):
+                    fh = open(job.out_path, 'rb')
+                    writer.write(response_head(HTTPStatus.OK, {'Content-Type': CONTENT_TYPES[job.params['format']],
+                                                               'Transfer-Encoding': 'chunked'}))
+                if fh is not None:
+                    while True:
+                        block = fh.read(CHUNK_SIZE)
+                        if not block:
+                            break
+                        if sent == 0:
+                            job.first_byte = time.perf_counter()
+                        writer.write(b'%x\r\n%s\r\n' % (len(block), block))
+                        sent += len(block)
+                        await writer.drain()
+
+                if finished:
+                    break
+                await asyncio.sleep(POLL_SECONDS)
+
+            if job.result.exception() is not None:
+                # too late for an error status, an unterminated chunked body tells the client
+                return
+            writer.write(b'0\r\n\r\n')
+            await writer.drain()
+        finally:
+            if fh is not None:
+                fh.close()
+
+    def record(self, job):
+        end = time.perf_counter()
+        self.latencies['queue_seconds'].append(job.started - job.enqueued)
+        if job.first_byte is not None:
+            self.latencies['first_byte_seconds'].append(job.first_byte - job.enqueued)
+        self.latencies['total_seconds'].append(end - job.enqueued)
+
+
+async def read_request_head(reader):
+    """method, target and lower-case headers of an http/1.1 request"""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.LimitOverrunError:
+        raise RequestError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, 'request head too large')
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ')
+    except ValueError:
+        raise RequestError(HTTPStatus.BAD_REQUEST, 'malformed request line')
+
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    return method, target, headers
+
+
+async def read_body(reader, path, length):
+    """copy length bytes of request body to path, one chunk at a time"""
+    with open(path, 'wb') as fh:
+        remaining = length
+        while remaining:
+            block = await reader.read(min(CHUNK_SIZE, remaining))
+            if not block:
+                raise RequestError(HTTPStatus.BAD_REQUEST, 'upload ended early')
+            fh.write(block)
+            remaining -= len(block)
+
+
+def response_head(status, headers):
+    lines = ['HTTP/1.1 {} {}'.format(status.value, status.phrase)]
+    lines += ['{}: {}'.format(name, value) for name, value in dict(headers, Connection='close').items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+async def send_json(writer, status, obj):
+    body = json.dumps(obj, indent=1).encode('utf-8')
+    writer.write(response_head(status, {'Content-Type': 'application/json', 'Content-Length': len(body)}) + body)
+    try:
+        await writer.drain()
+    except ConnectionError:
+        pass
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m stl_tools.service', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on (default: %(default)s)')
+    parser.add_argument('--unix-socket', help='listen on this unix socket instead of a tcp port')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes (default: %(default)s)')
+    parser.add_argument('--max-jobs', type=int,
+                        help='jobs running at once, lower it when jobs do not fit in memory together (default: workers)')
+    parser.add_argument('--queue-size', type=int, default=64,
+                        help='jobs waiting for a slot before requests are refused with 503 (default: %(default)s)')
+    parser.add_argument('--max-upload-mb', type=float, default=256, help='upload size limit (default: %(default)s)')
+    parser.add_argument('--cache-dir', help='result cache shared by all jobs, see python -m stl_tools --cache-dir')
+    parser.add_argument('--cache-size', type=float, default=cache.DEFAULT_MAX_BYTES / 2 ** 30,
+                        help='result cache size limit in GiB (default: %(default)s)')
+    parser.add_argument('--spill-dir', help='keep large height arrays in temporary files here instead of memory')
+    return parser.parse_args(argv)
+
+
+async def serve(args):
+    service = ConversionService(args.workers, args.max_jobs, args.queue_size, int(args.max_upload_mb * 2 ** 20),
+                                args.cache_dir, int(args.cache_size * 2 ** 30), args.spill_dir)
+    pids = await service.start()
+    if args.unix_socket:
+        server = await asyncio.start_unix_server(service.handle, args.unix_socket, limit=HEADER_LIMIT)
+        where = args.unix_socket
+    else:
+        server = await asyncio.start_server(service.handle, args.host, args.port, limit=HEADER_LIMIT)
+        where = 'http://{}:{}'.format(args.host, args.port)
+    print('{} workers warm, listening on {}'.format(len(pids), where), flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    try:
+        asyncio.run(serve(parse_args(argv)))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,119 @@
+"""binary stl reading and writing without holding whole meshes in memory"""
+import os
+import struct
+
+from stl import mesh
+import numpy as np
+
+HEADER_SIZE = 80
+COUNT_SIZE = 4
+FACET_SIZE = mesh.Mesh.dtype.itemsize
+
+
+def facet_records(vectors):
+    """mesh.Mesh.dtype records for an array of triangles, normals computed like numpy-stl does"""
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, 3, 3)
+
+    records = np.zeros(len(vectors), dtype=mesh.Mesh.dtype)
+    records['vectors'] = vectors
+    records['normals'] = np.cross(vectors[:, 1] - vectors[:, 0], vectors[:, 2] - vectors[:, 0])
+    return records
+
+
+class StlStreamWriter:
+    """
+    writes a binary stl file one chunk of facets at a time
+
+    the triangle count in the header is often unknown up front, so a placeholder is written first
+    and patched when the writer is closed; with expected_count the header is right from the start
+    and the file can be read (or streamed) while it is being written
+    """
+
+    def __init__(self, path, name='stl_tools', expected_count=0):
+        self.path = path
+        self.triangle_count = 0
+
+        self._file = open(self.path, 'wb')
+        # binary stl headers must not start with 'solid'
+        header = 'binary stl {}'.format(name).encode('ascii', 'replace')[:HEADER_SIZE]
+        self._file.write(header.ljust(HEADER_SIZE, b' '))
+        self._file.write(struct.pack('<I', expected_count))
+
+    def write(self, vectors):
+        """append triangles with shape (n, 3, 3)"""
+        self.write_records(facet_records(vectors))
+
+    def write_records(self, records):
+        """append facets that already are mesh.Mesh.dtype records (memory mapped ones included, see read_facets)"""
+        # the buffer itself is written, no bytes copy of it is made
+        self._file.write(np.ascontiguousarray(records, dtype=mesh.Mesh.dtype).data)
+        self.triangle_count += len(records)
+
+    @property
+    def bytes_written(self):
+        return HEADER_SIZE + COUNT_SIZE + self.triangle_count * mesh.Mesh.dtype.itemsize
+
+    def close(self):
+        """patch the triangle count into the header and close the file"""
+        if self._file.closed:
+            return
+        self._file.seek(HEADER_SIZE)
+        self._file.write(struct.pack('<I', self.triangle_count))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def facet_count(path):
+    """
+    number of facets of a binary stl, None for an ascii stl
+
+    the count in the header is trusted when the file is long enough for it (a few trailing bytes
+    are fine), otherwise a file that holds a whole number of facets gets the count of its size
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as fh:
+        header = fh.read(HEADER_SIZE + COUNT_SIZE)
+    if len(header) < HEADER_SIZE + COUNT_SIZE:
+        return None
+
+    count = struct.unpack('<I', header[HEADER_SIZE:])[0]
+    expected = HEADER_SIZE + COUNT_SIZE + count * FACET_SIZE
+    if expected <= size < expected + FACET_SIZE:
+        return count
+    if not header.startswith(b'solid') and (size - HEADER_SIZE - COUNT_SIZE) % FACET_SIZE == 0:
+        return (size - HEADER_SIZE - COUNT_SIZE) // FACET_SIZE
+    return None
+
+
+def read_facets(path, mode='r'):
+    """
+    the facets of an stl file as mesh.Mesh.dtype records, memory mapped for binary files: nothing
+    is read until it is used, and mode='c' (copy-on-write) allows edits that leave the file alone
+
+    ascii files cannot be mapped, they are parsed into memory by numpy-stl
+    """
+    count = facet_count(path)
+    if count is None:
+        return mesh.Mesh.from_file(path, calculate_normals=False).data
+    if count == 0:
+        return np.zeros(0, dtype=mesh.Mesh.dtype)
+    return np.memmap(path, dtype=mesh.Mesh.dtype, mode=mode, offset=HEADER_SIZE + COUNT_SIZE, shape=(count,))
+
+
+def merge_stl(paths, out_path, name='merged', chunk_size=1 << 20):
+    """
+    concatenate stl files into one binary stl, streaming the facets of every input through a
+    memory map into the output; the header count is set from the facets actually written.
+    Returns the number of bytes written
+    """
+    with StlStreamWriter(out_path, name) as writer:
+        for path in paths:
+            facets = read_facets(path)
+            for start in range(0, len(facets), chunk_size):
+                writer.write_records(facets[start:start + chunk_size])
+    return writer.bytes_written
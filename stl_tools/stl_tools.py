@@ -1,15 +1,21 @@
 from stl import mesh
-from mpl_toolkits import mplot3d
-from matplotlib import pyplot as plt
 # import imageio
-from PIL import Image
 import numpy as np
-import tqdm
 # import matplotlib.tri as mtri
 import os
+if __name__ == '__main__' and not __package__:
+    # run as a script: swap this directory (where this module shadows the package) for the repo root
+    import sys
+    sys.path[0] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+from stl_tools import boundary, decimate, fast_mesh, indexed_mesh, parallel, pixel_group, stl_io
 
 
 def show_render(stl_file_path):
+    # interactive 3d view, plotting is optional, keep it out of the import of this module
+    # (preview.save_stl_preview makes a png without matplotlib or a display)
+    from mpl_toolkits import mplot3d
+    from matplotlib import pyplot as plt
+
     # Create a new plot
     figure = plt.figure()
     axes = mplot3d.Axes3D(figure)
@@ -26,71 +32,199 @@ def show_render(stl_file_path):
     plt.show()
 
 
-class PixelGroup:
-
-    def __init__(self, img_path):
-
-        self.img_path = img_path
+class PixelGroup(pixel_group.PixelGroupBase):
+    """step relief over the whole rectangle of an image, a flat top per pixel and walls between pixels"""
 
-        self.img = Image.open(self.img_path).convert('LA')
-        self.img.show()
+    relief_triangle_count = staticmethod(fast_mesh.step_relief_triangle_count)
 
-        self.img_arr = np.asarray(self.img)[:, :, 0]
+    def __init__(self, img_path, solid=False, base_mm=1.0, output_format='stl', emboss_width_mm=1000,
+                 emboss_depth_mm=10, preview=False, instrumentation=None, spill_dir=None,
+                 z_min=None, grid_shape=None, grid_dtype='<f4', cell_mm=None, max_triangles=None, pooling='mean'):
+        super().__init__(img_path, emboss_width_mm, emboss_depth_mm, solid=solid, base_mm=base_mm,
+                         output_format=output_format, preview=preview, instrumentation=instrumentation,
+                         spill_dir=spill_dir, z_min=z_min, grid_shape=grid_shape, grid_dtype=grid_dtype,
+                         cell_mm=cell_mm, max_triangles=max_triangles, pooling=pooling)
 
-        self.height, self.width = self.img_arr.shape
+    def prepare(self):
         self.num_of_pixels = self.height * self.width
 
-        # add extra row & column
-        fixed_img_arr = np.append(self.img_arr, np.zeros(shape=(1, self.width)), axis=0)
-        fixed_img_arr = np.append(fixed_img_arr, np.zeros(shape=(self.height + 1, 1)), axis=1)
-
-        self.fixed_img_arr = fixed_img_arr
-
-        emboss_depth_mm = 10
-        emboss_width_mm = 1000
-
-        self.dx = float(emboss_width_mm) / self.width
-        self.dy = self.dx * self.height / self.width
-        self.dz = float(emboss_depth_mm) / (self.img_arr.max())
-
-    @property
-    def output_stl_path(self):
-        head, tail = os.path.split(self.img_path)
-        filename, ext = os.path.splitext(tail)
-        new_tail = '{}.stl'.format(filename)
-        new_path = os.path.join(head, new_tail)
-        return new_path
+    def scale_factors(self, emboss_width_mm, emboss_depth_mm):
+        """(dx, dy, dz): mm per pixel along x and y, mm per unit of darkness (or height)"""
+        dx = float(emboss_width_mm) / self.width
+        return dx, dx * self.height / self.width, self.depth_scale(emboss_depth_mm)
 
     def get_pixel_gen(self):
         # reverse y-axis to fix image
-        return (Pixel(img_arr=self.fixed_img_arr, img_height=self.height, img_width=self.width, x=x, y=y, dx=self.dx, dy=self.dy, dz=self.dz)
+        return (Pixel(img_arr=self.img_arr, img_height=self.height, img_width=self.width, x=x, y=y, dx=self.dx, dy=self.dy, dz=self.dz)
         for x in range(self.width) for y in range(self.height))
 
     @property
     def triangle_count(self):
-        print("getting triangle count...")
-        tri_count = 0
-        for pixel in tqdm.tqdm(self.get_pixel_gen(), total=self.num_of_pixels):
-            tri_count += len(pixel.triangles.values())
-
-        return tri_count
-
-    def make_stl(self):
-
+        """number of triangles, counted from the height changes without building any triangle"""
+        return fast_mesh.step_relief_triangle_count(self.img_arr)
+
+    def closing_vectors(self):
+        """side walls around the image border and base plate, see fast_mesh.closing_vectors"""
+        ring = boundary.boundary_ring(np.ones((self.height, self.width), dtype=bool))
+        cell_x, cell_y = boundary.ring_edge_cells(ring).T
+
+        # walls take the height of the border pixel they belong to, scaled like Pixel.coord_transform;
+        # their sides are split at the heights of the (up to four) pixels around each ring vertex,
+        # where the relief's walls meet them, see indexed_mesh.step_relief_solid_indexed
+        z = self.img_arr[cell_y, cell_x].astype(np.float64) * self.dz
+        x, y = ring[:, 0] * self.dx, (self.height - 1 - ring[:, 1]) * self.dy
+        starts = np.column_stack([x, y, z])
+        ends = np.column_stack([np.roll(x, -1), np.roll(y, -1), z])
+
+        levels = np.full((len(ring), 4), np.nan)
+        for j, (offset_x, offset_y) in enumerate(((0, 0), (1, 0), (0, 1), (1, 1))):
+            # the pixel (x - 1 + offset_x, y - 1 + offset_y) of ring vertex (x, y), NaN outside the image
+            pixel_x, pixel_y = ring[:, 0] - 1 + offset_x, ring[:, 1] - 1 + offset_y
+            inside = (pixel_x >= 0) & (pixel_x < self.width) & (pixel_y >= 0) & (pixel_y < self.height)
+            levels[inside, j] = self.img_arr[pixel_y[inside], pixel_x[inside]].astype(np.float64) * self.dz
+
+        with self.instrumentation.stage('closing'):
+            closing = fast_mesh.closing_vectors(starts, ends, -self.base_mm, levels, np.roll(levels, -1, axis=0))
+        self.instrumentation.count('wall_facets', len(closing))
+        return closing
+
+    def make_stl(self, precount=True, workers=None):
+        """
+        make and save stl file, built with whole-array operations
+
+        with precount=False the triangles are generated band by band into a growable buffer
+        instead of a buffer sized from triangle_count, with workers > 1 column tiles are
+        triangulated on a process pool (same bytes as the serial run). A solid is built from
+        make_indexed_mesh, its walls have to be split where they meet
+        """
+        if self.solid:
+            self.save_mesh(self.make_indexed_mesh().to_mesh())
+            return
+
+        with self.instrumentation.stage('triangulate'):
+            if workers is not None and workers > 1:
+                tiles = parallel.column_tiles(self.width, workers)
+                column_counts = fast_mesh.step_relief_column_triangle_counts(self.img_arr)
+                tile_counts = [int(column_counts[x_start:x_stop].sum()) for x_start, x_stop in tiles]
+                data = parallel.make_mesh_data(fast_mesh.step_relief_vectors, self.img_arr, tiles, tile_counts,
+                                               sum(tile_counts), workers, dx=self.dx, dy=self.dy, dz=self.dz)
+            elif precount:
+                data = fast_mesh.step_relief_data(self.img_arr, self.dx, self.dy, self.dz)
+            else:
+                buffer = fast_mesh.TriangleBuffer()
+                for vectors in fast_mesh.iter_step_relief_bands(self.img_arr, self.dx, self.dy, self.dz):
+                    buffer.extend(vectors)
+                data = buffer.data
+
+        self.save_mesh(mesh.Mesh(data))
+
+    def make_stl_streaming(self, band_width=256):
+        """
+        make and save stl file, appending one band of pixel columns at a time; a solid is written
+        from make_indexed_mesh, see make_stl_indexed
+        """
+        if self.solid:
+            self.make_stl_indexed()
+            return
+
+        with self.instrumentation.stage('triangulate_and_save'), stl_io.StlStreamWriter(self.output_stl_path) as writer:
+            for vectors in fast_mesh.iter_step_relief_bands(self.img_arr, self.dx, self.dy, self.dz, band_width):
+                writer.write(vectors)
+
+        self.instrumentation.count('triangles', writer.triangle_count)
+        self.instrumentation.count('bytes_written', writer.bytes_written)
+
+    def make_stl_smooth(self):
+        """
+        make and save stl file of a smooth surface through the pixel heights (one vertex per pixel),
+        every cell is split along the diagonal with the smaller z step like in stl_tools_2
+        """
+        with self.instrumentation.stage('triangulate'):
+            data = np.zeros(2 * (self.height - 1) * (self.width - 1), dtype=mesh.Mesh.dtype)
+            fast_mesh.heightfield_vectors(self.img_arr, self.dx, self.dy, self.dz, y_top=self.height - 1,
+                                          vectors=data['vectors'], oriented=True)
+
+        if self.solid:
+            with self.instrumentation.stage('closing'):
+                x, y = boundary.boundary_ring(np.ones((self.height - 1, self.width - 1), dtype=bool)).T
+                starts = np.column_stack([x * self.dx, (self.height - 1 - y) * self.dy, self.img_arr[y, x].astype(np.float64) * self.dz])
+                closing = fast_mesh.closing_vectors(starts, np.roll(starts, -1, axis=0), -self.base_mm)
+            self.instrumentation.count('wall_facets', len(closing))
+            data = np.concatenate([data, stl_io.facet_records(closing)])
+
+        self.save_mesh(mesh.Mesh(data))
+
+    def make_relief_indexed(self):
+        """relief surface of make_stl as shared vertices and faces, see indexed_mesh.IndexedMesh"""
+        with self.instrumentation.stage('triangulate'):
+            if self.solid:
+                return indexed_mesh.step_relief_solid_indexed(self.img_arr, self.dx, self.dy, self.dz)
+            return indexed_mesh.step_relief_indexed(self.img_arr, self.dx, self.dy, self.dz)
+
+    def make_stl_adaptive(self):
+        """
+        make and save stl file with blocks of equal-height pixels merged into large top faces,
+        returns a report of the triangle reduction
+        """
+        with self.instrumentation.stage('triangulate'):
+            change_right, change_bottom = fast_mesh.step_relief_changes(self.img_arr)
+
+            # wall ends (and the border of a solid) have to stay vertices of the merged top faces
+            extra_used = np.zeros((self.height + 1, self.width + 1), dtype=bool)
+            y, x = np.nonzero(change_right)
+            extra_used[y, x + 1] = extra_used[y + 1, x + 1] = True
+            y, x = np.nonzero(change_bottom)
+            extra_used[y + 1, x] = extra_used[y + 1, x + 1] = True
+            # a solid's pixels with saddle cuts keep their own tops, see indexed_mesh.step_relief_solid_indexed
+            cell_mask = None
+            if self.solid:
+                extra_used[[0, -1], :] = extra_used[:, [0, -1]] = True
+                cell_mask = ~indexed_mesh.saddle_pixels(*indexed_mesh.saddle_corners(self.img_arr)[:2])
+                y, x = np.nonzero(~cell_mask)
+                for offset_x, offset_y in ((0, 0), (1, 0), (0, 1), (1, 1)):
+                    extra_used[y + offset_y, x + offset_x] = True
+
+            # scale like Pixel.coord_transform
+            tops = decimate.step_relief_top_triangles(self.img_arr, extra_used, cell_mask)
+            tops[..., 0] *= self.dx
+            tops[..., 1] = (self.height - 1 - tops[..., 1]) * self.dy
+            tops[..., 2] *= self.dz
+
+            if self.solid:
+                walls = indexed_mesh.step_relief_solid_indexed(self.img_arr, self.dx, self.dy, self.dz,
+                                                               plain_tops=False).vectors()
+            else:
+                walls = fast_mesh.step_relief_vectors(self.img_arr, self.dx, self.dy, self.dz, oriented=True,
+                                                      tops=False)
+            parts = [tops, walls]
+        full_triangle_count = self.triangle_count
+        if self.solid:
+            # the solid relief has two triangles on every plain pixel, see step_relief_solid_indexed
+            parts.append(self.closing_vectors())
+            full_triangle_count = len(walls) + 2 * int(np.count_nonzero(cell_mask)) + len(parts[-1])
+
+        stl = mesh.Mesh(stl_io.facet_records(np.concatenate(parts)))
+        self.save_mesh(stl)
+
+        return decimate.reduction_report(full_triangle_count, len(stl.data))
+
+    def make_stl_reference(self):
+        """make and save stl file one Pixel at a time (slow, reference implementation, relief surface only)"""
         stl = mesh.Mesh(np.zeros(self.triangle_count, dtype=mesh.Mesh.dtype))
 
         i = -1
-        for pixel in tqdm.tqdm(self.get_pixel_gen(), total=self.num_of_pixels):
-            for triangle in pixel.triangles.values():
-                i += 1
-                for j in range(3):
-                    stl.vectors[i][j] = triangle[j]
+        with self.instrumentation.stage('triangulate'):
+            for pixel in self.instrumentation.progress(self.get_pixel_gen(), total=self.num_of_pixels):
+                for triangle in pixel.triangles.values():
+                    i += 1
+                    for j in range(3):
+                        stl.vectors[i][j] = triangle[j]
 
         # Write the mesh to file "cube.stl"
-        stl.save(self.output_stl_path)
-
+        self.save_mesh(stl)
 
 class Pixel:
+    """reference implementation of one pixel's triangles, see fast_mesh.step_relief_vectors"""
 
     def __init__(self, img_arr, img_height, img_width, x, y, dx, dy, dz):
         self.img_arr = img_arr
@@ -106,17 +240,18 @@ class Pixel:
         x, y, z = coordinate_tuple
         new_x = x * self.dx
         new_y = (self.img_height - 1 - y) * self.dy
-        new_z = z * self.dz
+        new_z = float(z) * self.dz
 
         return new_x, new_y, new_z
 
     @property
     def right_neighbor_z(self):
-        return self.img_arr[self.y, self.x + 1]
+        # zero height beyond the image border
+        return self.img_arr[self.y, self.x + 1] if self.not_right_edge else 0
 
     @property
     def bottom_neighbor_z(self):
-        return self.img_arr[self.y + 1, self.x]
+        return self.img_arr[self.y + 1, self.x] if self.not_bottom_edge else 0
 
     @property
     def has_elevation_change_right(self):
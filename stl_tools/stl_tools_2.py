@@ -1,17 +1,21 @@
 from stl import mesh
-from mpl_toolkits import mplot3d
-from matplotlib import pyplot as plt
 # import imageio
-from PIL import Image
 import numpy as np
-import tqdm
-import cmath
 # import matplotlib.tri as mtri
 import os
-import pandas as pd
+if __name__ == '__main__' and not __package__:
+    # run as a script: swap this directory (where this module shadows the package) for the repo root
+    import sys
+    sys.path[0] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+from stl_tools import boundary, decimate, fast_mesh, indexed_mesh, parallel, pixel_group, stl_io
 
 
 def show_render(stl_file_path):
+    # interactive 3d view, plotting is optional, keep it out of the import of this module
+    # (preview.save_stl_preview makes a png without matplotlib or a display)
+    from mpl_toolkits import mplot3d
+    from matplotlib import pyplot as plt
+
     # Create a new plot
     figure = plt.figure()
     axes = mplot3d.Axes3D(figure)
@@ -28,32 +32,71 @@ def show_render(stl_file_path):
     plt.show()
 
 
-def get_rel_polar(centroid, point):
-    centroid_x, centroid_y = centroid
-    x, y = point
-    rel_rad, rel_phi = cmath.polar(complex(centroid_x - x, centroid_y - y))
-    return rel_rad, rel_phi
+class PolarGrid:
+    """polar coordinates relative to a centroid for every point of a grid"""
 
+    def __init__(self, centroid, x_start, x_stop, y_start, y_stop):
+        self.x_start, self.x_stop = x_start, x_stop
+        self.y_start, self.y_stop = y_start, y_stop
+
+        # radius and angle of (centroid_x - x, centroid_y - y), for all points at once
+        centroid_x, centroid_y = centroid
+        rel_x = centroid_x - np.arange(x_start, x_stop)[None, :]
+        rel_y = centroid_y - np.arange(y_start, y_stop)[:, None]
+        self.rad = np.hypot(rel_x, rel_y)
+        self.phi = np.arctan2(rel_y, rel_x)
+
+    def polar(self, x, y):
+        """rel_rad, rel_phi of one point"""
+        row, col = y - self.y_start, x - self.x_start
+        return self.rad[row, col], self.phi[row, col]
+
+    def region(self, x_start, x_stop, y_start, y_stop):
+        """rel_rad, rel_phi arrays [y, x] for the points in a sub-rectangle"""
+        rows = slice(y_start - self.y_start, y_stop - self.y_start)
+        cols = slice(x_start - self.x_start, x_stop - self.x_start)
+        return self.rad[rows, cols], self.phi[rows, cols]
+
+
+def super_pixel_band_vectors(img_arr, super_centroid, super_radius, dx, dy, dz, x_start, x_stop, vectors=None,
+                             oriented=False, column_offset=0):
+    """
+    triangles of the super-pixels within radius in the columns [x_start, x_stop), shape (n, 3, 3),
+    identical to SuperPixel.triangles of every super-pixel but built for the whole band at once;
+    img_arr may be a tile holding the image columns from column_offset on
+
+    SuperPixel triangles face down (the y-axis is flipped), oriented=True rewinds them to face up
+    """
+    img_height, img_width = img_arr.shape
+    band_rad = PolarGrid(super_centroid, x_start, x_stop, 0, img_height - 1).rad
+
+    return fast_mesh.heightfield_vectors(img_arr, dx, dy, dz, y_top=img_height, cell_mask=band_rad <= super_radius,
+                                         x_start=x_start, x_stop=x_stop, vectors=vectors, oriented=oriented,
+                                         column_offset=column_offset)
 
-class PixelGroup:
-    """holds pixel-data for one image"""
 
-    def __init__(self, img_path, emboss_width_mm, emboss_depth_mm):
-        # path of source image
-        self.img_path = img_path
+def super_pixel_triangle_count(img_arr):
+    """number of triangles of PixelGroup.make_stl for an image of this shape, two per super-pixel within radius"""
+    height, width = img_arr.shape
+    super_centroid = ((width - 1) / 2.0, (height - 1) / 2.0)
+    rad = PolarGrid(super_centroid, 0, width - 1, 0, height - 1).rad
+    return 2 * int((rad <= max(super_centroid)).sum())
 
-        # image data
-        self.img = Image.open(self.img_path).convert('LA')
-        self.img.show()
 
-        # array of darkness values
-        # self.img_arr = np.asarray(self.img)[:, :, 0]
-        self.img_arr = np.array(self.img)[:, :, 0]
+class PixelGroup(pixel_group.PixelGroupBase):
+    """holds pixel-data for one image"""
 
+    relief_triangle_count = staticmethod(super_pixel_triangle_count)
 
-        # pixel dimensions
-        self.height, self.width = self.img_arr.shape
+    def __init__(self, img_path, emboss_width_mm, emboss_depth_mm, solid=False, base_mm=1.0, output_format='stl',
+                 preview=False, instrumentation=None, spill_dir=None,
+                 z_min=None, grid_shape=None, grid_dtype='<f4', cell_mm=None, max_triangles=None, pooling='mean'):
+        super().__init__(img_path, emboss_width_mm, emboss_depth_mm, solid=solid, base_mm=base_mm,
+                         output_format=output_format, preview=preview, instrumentation=instrumentation,
+                         spill_dir=spill_dir, z_min=z_min, grid_shape=grid_shape, grid_dtype=grid_dtype,
+                         cell_mm=cell_mm, max_triangles=max_triangles, pooling=pooling)
 
+    def prepare(self):
         # super-pixel dimensions
         self.super_pixel_height, self.super_pixel_width = self.height - 1, self.width - 1
         self.num_of_super_pixels = self.super_pixel_height * self.super_pixel_width
@@ -62,30 +105,17 @@ class PixelGroup:
         self.super_centroid = (self.super_pixel_width/2.0, self.super_pixel_height/2.0)
         self.super_radius = max(self.super_centroid)
 
-        # remove all data outside exclusion-radius
-        for x in range(self.super_pixel_width):
-            for y in range(self.super_pixel_height):
-                rel_rad, rel_phi = get_rel_polar(centroid=self.super_centroid, point=(x, y))
-                # add two-pixel buffer to outer edge
-                if rel_rad > self.super_radius - 2:
-                    self.img_arr[y, x] = 0
+        with self.instrumentation.stage('mask'):
+            # polar coordinates of every super-pixel
+            self.polar_grid = PolarGrid(self.super_centroid, 0, self.super_pixel_width, 0, self.super_pixel_height)
+            super_rad, super_phi = self.polar_grid.region(0, self.super_pixel_width, 0, self.super_pixel_height)
+            self.within_radius_mask = super_rad <= self.super_radius
 
-        # scaling values
-        self.dx = float(emboss_width_mm) / self.width
-        self.dy = self.dx
-        self.dz = float(emboss_depth_mm) / (self.img_arr.max())
+            # remove all data outside exclusion-radius, add two-pixel buffer to outer edge
+            self.img_arr[:self.super_pixel_height, :self.super_pixel_width][super_rad > self.super_radius - 2] = 0
 
-    @property
-    def output_stl_path(self):
-        """generate output file path for stl file"""
-        head, tail = os.path.split(self.img_path)
-        filename, ext = os.path.splitext(tail)
-        new_tail = '{}.stl'.format(filename)
-        new_path = os.path.join(head, new_tail)
-        return new_path
-
-    def super_pixel_gen(self):
-        """generating function super-pixels"""
+    def super_pixel_gen(self, x_start=0, x_stop=None):
+        """generating function super-pixels, optionally limited to the super-pixel columns [x_start, x_stop)"""
         # convert from pixel-coordinate-system to super-pixel-coordinate-system
         # each super-pixel represents two triangles (4 original pixels)
 
@@ -93,56 +123,148 @@ class PixelGroup:
         # .   .   .     ->      .   .
         # .   .   .             .   .
 
-        for x in range(self.super_pixel_width):
+        if x_stop is None:
+            x_stop = self.super_pixel_width
+
+        for x in range(x_start, x_stop):
             for y in range(self.super_pixel_height):
                 yield SuperPixel(img_arr=self.img_arr, img_height=self.height, img_width=self.width,
                                  super_centroid=self.super_centroid, super_radius=self.super_radius,
-                                 x=x, y=y, dx=self.dx, dy=self.dy, dz=self.dz)
+                                 polar_grid=self.polar_grid, x=x, y=y, dx=self.dx, dy=self.dy, dz=self.dz)
+
+    def super_pixel_within_radius_gen(self, x_start=0, x_stop=None):
+        return (super_pixel for super_pixel in self.super_pixel_gen(x_start, x_stop) if super_pixel.is_within_super_radius)
 
-    def super_pixel_within_radius_gen(self):
-        return (super_pixel for super_pixel in self.super_pixel_gen() if super_pixel.is_within_super_radius)
+    def band_vectors(self, x_start, x_stop):
+        """triangles of the super-pixel columns [x_start, x_stop) as an array of shape (n, 3, 3)"""
+        return super_pixel_band_vectors(self.img_arr, self.super_centroid, self.super_radius,
+                                        self.dx, self.dy, self.dz, x_start, x_stop, oriented=self.solid)
 
     @property
     def triangle_count(self):
         """number of trianlges in this pixel-group"""
-        return 2 * self.num_of_super_pixels
+        return 2 * int(self.within_radius_mask.sum())
 
     @property
-    def all_open_points(self):
-        open_points = []
-        for super_pixel in tqdm.tqdm(self.super_pixel_within_radius_gen(), total=self.num_of_super_pixels):
-            open_points.extend(super_pixel.open_points)
-
-        open_points_df = pd.DataFrame(open_points)
-        open_points_df.rename(columns={0: 'x', 1: 'y', 2: 'z'}, inplace=True)
-        open_points_df[['rad', 'phi']] = open_points_df.apply(lambda row: get_rel_polar(centroid=self.super_centroid, point=(row['x'], row['y'])), axis=1, result_type='expand')
-
-        # remove duplicates and sort
-        open_points_df.drop_duplicates(subset=['x', 'y', 'z'], inplace=True)
-        open_points_df.sort_values(['phi', 'rad'], inplace=True)
+    def boundary_ring(self):
+        """ordered (n, 2) array of the unscaled (x, y) pixel coordinates on the rim of the triangulated area"""
+        return boundary.boundary_ring(self.within_radius_mask)
 
+    @property
+    def all_open_points(self):
+        """ordered (n, 3) array of the scaled vertices on the rim of the triangulated area"""
+        x, y = self.boundary_ring.T
+        # same scaling as SuperPixel.coord_transform
+        return np.stack([x * self.dx, (self.height - y) * self.dy, self.img_arr[y, x].astype(np.float64) * self.dz], axis=1)
+
+    def closing_vectors(self):
+        """side walls along the rim and base plate, see fast_mesh.closing_vectors"""
+        with self.instrumentation.stage('closing'):
+            starts = self.all_open_points
+            closing = fast_mesh.closing_vectors(starts, np.roll(starts, -1, axis=0), -self.base_mm)
+        self.instrumentation.count('wall_facets', len(closing))
+        return closing
+
+    def make_stl(self, workers=None):
+        """make and save stl file, with workers > 1 column tiles are triangulated on a process pool"""
+        with self.instrumentation.stage('triangulate'):
+            if workers is not None and workers > 1:
+                tiles = parallel.column_tiles(self.super_pixel_width, workers)
+                column_counts = 2 * self.within_radius_mask.sum(axis=0)
+                tile_counts = [int(column_counts[x_start:x_stop].sum()) for x_start, x_stop in tiles]
+                stl = mesh.Mesh(parallel.make_mesh_data(
+                    super_pixel_band_vectors, self.img_arr, tiles, tile_counts, self.triangle_count, workers,
+                    super_centroid=self.super_centroid, super_radius=self.super_radius,
+                    dx=self.dx, dy=self.dy, dz=self.dz, oriented=self.solid))
+            else:
+                stl = mesh.Mesh(np.zeros(self.triangle_count, dtype=mesh.Mesh.dtype))
+                fast_mesh.heightfield_vectors(self.img_arr, self.dx, self.dy, self.dz, y_top=self.height,
+                                              cell_mask=self.within_radius_mask, vectors=stl.vectors,
+                                              oriented=self.solid)
+
+        if self.solid:
+            stl = mesh.Mesh(np.concatenate([stl.data, stl_io.facet_records(self.closing_vectors())]))
 
-        for row in open_points_df.itertuples():
-            yield row.x, row.y, row.z
+        # Write the mesh to file "cube.stl"
+        self.save_mesh(stl)
 
-    def make_stl(self):
-        """make and save stl file"""
+    def make_stl_reference(self):
+        """make and save stl file one SuperPixel at a time (slow, reference implementation, relief surface only)"""
         stl = mesh.Mesh(np.zeros(self.triangle_count, dtype=mesh.Mesh.dtype))
 
         i = -1
-        for pixel in tqdm.tqdm(self.super_pixel_within_radius_gen(), total=self.num_of_super_pixels):
-            for triangle in pixel.triangles:
-                i += 1
-                for j in range(3):
-                    stl.vectors[i][j] = triangle[j]
+        with self.instrumentation.stage('triangulate'):
+            for pixel in self.instrumentation.progress(self.super_pixel_within_radius_gen(),
+                                                       total=self.num_of_super_pixels):
+                for triangle in pixel.triangles:
+                    i += 1
+                    for j in range(3):
+                        stl.vectors[i][j] = triangle[j]
 
         # Write the mesh to file "cube.stl"
-        stl.save(self.output_stl_path)
+        self.save_mesh(stl)
+
+    def make_relief_indexed(self):
+        """relief surface of make_stl as shared vertices and faces, see indexed_mesh.IndexedMesh"""
+        with self.instrumentation.stage('triangulate'):
+            return indexed_mesh.heightfield_indexed(self.img_arr, self.dx, self.dy, self.dz, y_top=self.height,
+                                                    cell_mask=self.within_radius_mask, oriented=self.solid)
+
+    def preview_mask(self):
+        if self.within_radius_mask.size == 0:
+            # a single row or column has no super pixels, all of it is background
+            return np.zeros((self.height, self.width), dtype=bool)
+        # super pixels span two pixels, the last row and column belong to the ones before them
+        return np.pad(self.within_radius_mask, ((0, 1), (0, 1)), mode='edge')
+
+    def make_stl_adaptive(self, max_deviation_mm=0.0):
+        """
+        make and save stl file with flat blocks merged into large quads, returns a report of the
+        triangle reduction
+
+        blocks whose heights differ by up to max_deviation_mm are merged as well, the surface then
+        stays within max_deviation_mm of the full one. Triangles always face up (out of the solid)
+        """
+        with self.instrumentation.stage('triangulate'):
+            extra_used = None
+            if self.solid:
+                # the walls hang off every rim vertex
+                extra_used = np.zeros(self.img_arr.shape, dtype=bool)
+                x, y = self.boundary_ring.T
+                extra_used[y, x] = True
+
+            # scale like SuperPixel.coord_transform
+            triangles = decimate.heightfield_triangles(self.img_arr.astype(np.float64) * self.dz, self.within_radius_mask,
+                                                       max_deviation_mm, extra_used)
+            triangles[..., 0] *= self.dx
+            triangles[..., 1] = (self.height - triangles[..., 1]) * self.dy
+
+        parts = [triangles]
+        full_triangle_count = self.triangle_count
+        if self.solid:
+            parts.append(self.closing_vectors())
+            full_triangle_count += len(parts[-1])
+
+        stl = mesh.Mesh(stl_io.facet_records(np.concatenate(parts)))
+        self.save_mesh(stl)
+
+        return decimate.reduction_report(full_triangle_count, len(stl.data))
+
+    def make_stl_streaming(self, band_width=64):
+        """make and save stl file, appending one band of super-pixel columns at a time"""
+        with self.instrumentation.stage('triangulate_and_save'), stl_io.StlStreamWriter(self.output_stl_path) as writer:
+            for x_start in range(0, self.super_pixel_width, band_width):
+                writer.write(self.band_vectors(x_start, min(x_start + band_width, self.super_pixel_width)))
+            if self.solid:
+                writer.write(self.closing_vectors())
+
+        self.instrumentation.count('triangles', writer.triangle_count)
+        self.instrumentation.count('bytes_written', writer.bytes_written)
 
 
 class SuperPixel:
     """A Super-Pixel is a collection of four pixels. Each Super-Pixel represents two triangles in the output STL"""
-    def __init__(self, img_arr, img_height, img_width, super_centroid, super_radius, x, y, dx, dy, dz):
+    def __init__(self, img_arr, img_height, img_width, super_centroid, super_radius, polar_grid, x, y, dx, dy, dz):
         self.img_arr = img_arr
         self.img_height, self.img_width = img_height, img_width
 
@@ -151,9 +273,10 @@ class SuperPixel:
         self.dx, self.dy, self.dz = dx, dy, dz
 
         self.super_centroid, self.super_radius = super_centroid, super_radius
+        self.polar_grid = polar_grid
 
         # coordinates relative to picture centroid
-        self.rel_rad, self.rel_phi = get_rel_polar(centroid=self.super_centroid, point=(self.x, self.y))
+        self.rel_rad, self.rel_phi = self.polar_grid.polar(self.x, self.y)
 
         self.is_within_super_radius = self.rel_rad <= self.super_radius
 
@@ -163,7 +286,7 @@ class SuperPixel:
         new_x = x * self.dx
         # need to flip y-axis
         new_y = (self.img_height - y) * self.dy
-        new_z = z * self.dz
+        new_z = float(z) * self.dz
 
         return new_x, new_y, new_z
 
@@ -172,18 +295,22 @@ class SuperPixel:
         return self.img_arr[y, x]
 
     @property
-    def vertices(self):
-        """return dictionary of the scaled vertices for the current super-pixel"""
-
+    def corners(self):
+        """return dictionary of the unscaled (x, y) pixel coordinates of the four corners"""
         corners = {
             'NW': (self.x, self.y),
             'NE': (self.x + 1, self.y),
             'SW': (self.x, self.y + 1),
             'SE': (self.x + 1, self.y + 1)
         }
+        return corners
+
+    @property
+    def vertices(self):
+        """return dictionary of the scaled vertices for the current super-pixel"""
 
         # do transformations here
-        vertices = {corner: self.coord_transform((x, y, self.z_coord(x=x, y=y))) for corner, (x, y) in corners.items()}
+        vertices = {corner: self.coord_transform((x, y, self.z_coord(x=x, y=y))) for corner, (x, y) in self.corners.items()}
 
         return vertices
 
@@ -194,9 +321,10 @@ class SuperPixel:
         # gather vertices for the four corners
         v = self.vertices
 
-        # find z elevation change for opposite corners
-        diagonal_z_step_nw_se = abs(v['NW'][-1] - v['SE'][-1])
-        diagonal_z_step_ne_sw = abs(v['NE'][-1] - v['SW'][-1])
+        # find z elevation change for opposite corners, unscaled so that dz cannot flip a tie
+        z = {corner: float(self.z_coord(x=x, y=y)) for corner, (x, y) in self.corners.items()}
+        diagonal_z_step_nw_se = abs(z['NW'] - z['SE'])
+        diagonal_z_step_ne_sw = abs(z['NE'] - z['SW'])
 
         # shortest z-distance determines which diagonal is drawn
         if diagonal_z_step_nw_se < diagonal_z_step_ne_sw:
@@ -212,32 +340,6 @@ class SuperPixel:
 
         return triangles
 
-    @property
-    def neighbors(self):
-        """dictionary of super-pixel neighbors"""
-        neighbors = {
-            'N': (self.x, self.y + 1),
-            'E': (self.x + 1, self.y),
-            'S': (self.x, self.y - 1),
-            'W': (self.x - 1, self.y)
-        }
-        return neighbors
-
-    # TODO: for each missing neighbor, add the corresponding missing vertices
-    @property
-    def missing_neighbors(self):
-        missing_neighbors = []
-        for direction, neighbor in self.neighbors.items():
-            rel_rad, rel_phi = get_rel_polar(centroid=self.super_centroid, point=neighbor)
-            if rel_rad > self.super_radius:
-                missing_neighbors.append(direction)
-
-        return missing_neighbors
-
-    @property
-    def open_points(self):
-        return (point for direction in self.missing_neighbors for corner, point in self.vertices.items() if direction in corner)
-
 
 if __name__ == '__main__':
     print("starting script...")
@@ -0,0 +1,77 @@
+"""vectorized checks of stl meshes: bounding box, degenerate facets and edges that are not shared by exactly two facets"""
+import numpy as np
+from stl_tools import indexed_mesh, stl_io
+
+
+def facet_areas(vectors):
+    """areas of triangles (n, 3, 3), in float64"""
+    vectors = np.asarray(vectors, dtype=np.float64)
+    return 0.5 * np.linalg.norm(np.cross(vectors[:, 1] - vectors[:, 0], vectors[:, 2] - vectors[:, 0]), axis=1)
+
+
+def edge_use_counts(faces):
+    """
+    how many faces use each undirected edge of faces (n, 3) vertex ids, as a sorted array of
+    edge keys (low id * vertex count + high id) and the number of uses of each key
+
+    edges that collapse to a single vertex are left out
+    """
+    faces = np.asarray(faces, dtype=np.int64)
+    vertex_count = int(faces.max()) + 1 if len(faces) else 0
+    starts, ends = faces.ravel(), faces[:, [1, 2, 0]].ravel()
+    keep = starts != ends
+
+    keys = np.minimum(starts, ends)[keep] * vertex_count + np.maximum(starts, ends)[keep]
+    keys.sort()
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    starts_of_runs = np.flatnonzero(first)
+    return keys[starts_of_runs], np.diff(np.append(starts_of_runs, len(keys)))
+
+
+def check_facets(vectors, min_area=0.0, chunk_size=1 << 20):
+    """
+    report of the triangles (n, 3, 3): triangle count, bounding box, degenerate facets (area up
+    to min_area square mm, or non-finite coordinates), boundary edges (used by one facet) and non-manifold
+    edges (used by more than two); closed is True when every edge is shared by exactly two facets
+
+    vertices are identified by their exact coordinates; memory mapped facets (see stl_io.read_facets)
+    are read chunk by chunk into one float32 copy of all corners (36 bytes per facet, plus the
+    sort keys of indexed_mesh.unique_rows), which is dropped once the distinct vertices and the
+    vertex ids of the facets are known
+    """
+    count = len(vectors)
+    degenerate = non_finite = 0
+    points = np.empty((count * 3, 3), dtype=np.float32)
+    for start in range(0, count, chunk_size):
+        chunk = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+        points[3 * start:3 * (start + len(chunk))] = chunk.reshape(-1, 3)
+
+        # non-finite coordinates give a non-finite area
+        areas = facet_areas(chunk)
+        non_finite += int(np.count_nonzero(~np.isfinite(areas)))
+        degenerate += int(np.count_nonzero(areas <= min_area))
+
+    vertices, faces = indexed_mesh.unique_rows(points)
+    del points
+    keys, uses = edge_use_counts(faces.reshape(-1, 3))
+    boundary_edges, non_manifold_edges = int(np.count_nonzero(uses == 1)), int(np.count_nonzero(uses > 2))
+    finite_vertices = vertices[np.isfinite(vertices).all(axis=1)]
+
+    return {
+        'triangles': int(count),
+        'vertices': int(len(vertices)),
+        'bbox_min': finite_vertices.min(axis=0).tolist() if len(finite_vertices) else None,
+        'bbox_max': finite_vertices.max(axis=0).tolist() if len(finite_vertices) else None,
+        'degenerate_facets': degenerate + non_finite,
+        'non_finite_facets': non_finite,
+        'edges': int(len(keys)),
+        'boundary_edges': boundary_edges,
+        'non_manifold_edges': non_manifold_edges,
+        'closed': bool(count) and boundary_edges == 0 and non_manifold_edges == 0,
+    }
+
+
+def check_stl(path, min_area=0.0):
+    """check_facets of an stl file, read through a memory map"""
+    return check_facets(stl_io.read_facets(path)['vectors'], min_area)
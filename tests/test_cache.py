@@ -0,0 +1,51 @@
+"""cache entries evicted by another process between lookup and read are misses"""
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from stl_tools import cache, stl_tools
+
+
+@pytest.fixture
+def group(tmp_path):
+    path = tmp_path / 'relief.png'
+    Image.fromarray(np.random.default_rng(0).integers(0, 4, (8, 6)).astype(np.uint8) * 60).save(path)
+    return stl_tools.PixelGroup(str(path), solid=True, emboss_width_mm=20, emboss_depth_mm=3)
+
+
+def evicting(result_cache, monkeypatch, suffixes):
+    """make lookups of the given suffixes hit, then lose the entry right after, as with a concurrent eviction"""
+    lookup = result_cache.lookup
+
+    def lookup_then_evict(key, suffix):
+        path = lookup(key, suffix)
+        if path is not None and suffix in suffixes:
+            os.remove(path)
+        return path
+    monkeypatch.setattr(result_cache, 'lookup', lookup_then_evict)
+
+
+@pytest.mark.parametrize('suffixes', [('.stl',), ('.json',), ('.stl', '.json', '.npz')])
+def test_output_evicted_after_lookup_is_rebuilt(group, tmp_path, monkeypatch, suffixes):
+    result_cache = cache.ResultCache(str(tmp_path / 'cache'))
+    out_path = str(tmp_path / 'out.stl')
+    first = result_cache.save_output(group, out_path)
+    with open(out_path, 'rb') as fh:
+        expected = fh.read()
+
+    evicting(result_cache, monkeypatch, suffixes)
+    summary = result_cache.save_output(group, out_path)
+    assert not summary['cache_hit']
+    assert summary['triangles'] == first['triangles']
+    with open(out_path, 'rb') as fh:
+        assert fh.read() == expected
+
+
+def test_relief_evicted_after_lookup_is_a_miss(group, tmp_path, monkeypatch):
+    result_cache = cache.ResultCache(str(tmp_path / 'cache'))
+    result_cache.store_indexed('relief', group.make_relief_indexed())
+
+    evicting(result_cache, monkeypatch, ('.npz',))
+    assert result_cache.load_indexed('relief') is None
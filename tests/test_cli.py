@@ -0,0 +1,51 @@
+"""batch conversion: raw grids of any shape and images that would share an output file"""
+import numpy as np
+import pytest
+from PIL import Image
+
+from stl_tools import cli, stl_io
+
+
+def save_raw_grid(tmp_path, rows, columns):
+    path = tmp_path / 'dem.raw'
+    np.arange(rows * columns, dtype='<f4').reshape(rows, columns).tofile(path)
+    return path
+
+
+def test_non_square_raw_grid_with_its_shape(tmp_path, capsys):
+    path = save_raw_grid(tmp_path, 3, 5)
+    assert cli.main([str(path), '--grid-shape', '3x5', '--workers', '1']) == 0
+    # a step relief of 3 x 5 pixels: two triangles per pixel top, and the steps between them
+    assert stl_io.facet_count(str(tmp_path / 'dem.stl')) > 2 * 3 * 5
+
+
+def test_non_square_raw_grid_without_its_shape_fails(tmp_path, capsys):
+    path = save_raw_grid(tmp_path, 3, 5)
+    assert cli.main([str(path), '--workers', '1']) == 1
+    assert 'not a square grid' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('text, shape', [('3x5', (3, 5)), ('480X640', (480, 640))])
+def test_grid_shape(text, shape):
+    assert cli.grid_shape(text) == shape
+
+
+@pytest.mark.parametrize('text', ['3', '3x5x2', 'ax5', '0x5'])
+def test_bad_grid_shape(text):
+    with pytest.raises(ValueError):
+        cli.grid_shape(text)
+
+
+def test_images_sharing_an_output_are_rejected(tmp_path, capsys):
+    pixels = np.zeros((4, 4), dtype=np.uint8)
+    for name in ('a.png', 'a.jpg', 'b.png'):
+        Image.fromarray(pixels).save(tmp_path / name)
+
+    assert cli.main([str(tmp_path), '--workers', '1']) == 1
+    out = capsys.readouterr().out
+    assert 'a.jpg' in out and 'a.png' in out and 'b.png' not in out
+    assert not list(tmp_path.glob('*.stl'))
+
+    clashes = cli.clashing_outputs([str(tmp_path / name) for name in ('a.png', 'b.png')], str(tmp_path / 'out'),
+                                   'stl')
+    assert clashes == {}
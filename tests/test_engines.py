@@ -0,0 +1,63 @@
+"""every fast engine writes the same facets as the per-pixel reference implementation"""
+import numpy as np
+import pytest
+from PIL import Image
+
+from stl_tools import stl_tools, stl_tools_2
+
+SHAPES = [(1, 6), (2, 2), (7, 5), (13, 21), (32, 9)]
+
+
+@pytest.fixture(params=SHAPES, ids=lambda shape: '{}x{}'.format(*shape))
+def img_path(request, tmp_path):
+    # few levels, so neighbors are often equal and both diagonals get chosen
+    pixels = np.random.default_rng(sum(request.param)).integers(0, 4, request.param) * 60
+    path = tmp_path / 'relief.png'
+    Image.fromarray(pixels.astype(np.uint8)).save(path)
+    return str(path)
+
+
+def facet_bytes(path):
+    """everything after the 80 byte header: facet count and facets"""
+    with open(path, 'rb') as fh:
+        return fh.read()[80:]
+
+
+def run(group, method, **kwargs):
+    getattr(group, method)(**kwargs)
+    return facet_bytes(group.output_stl_path)
+
+
+def square_group(img_path, **kwargs):
+    return stl_tools.PixelGroup(img_path, emboss_width_mm=23.0, emboss_depth_mm=3.0, **kwargs)
+
+
+@pytest.mark.parametrize('method, kwargs', [
+    ('make_stl', {}),
+    ('make_stl', {'precount': False}),
+    ('make_stl_streaming', {'band_width': 2}),
+])
+def test_square_engines_match_the_reference(img_path, method, kwargs):
+    expected = run(square_group(img_path), 'make_stl_reference')
+    assert run(square_group(img_path), method, **kwargs) == expected
+
+
+def round_group(img_path, **kwargs):
+    return stl_tools_2.PixelGroup(img_path, 23.0, 3.0, **kwargs)
+
+
+@pytest.mark.parametrize('method, kwargs', [
+    ('make_stl', {}),
+    ('make_stl_streaming', {'band_width': 2}),
+])
+def test_round_engines_match_the_reference(img_path, method, kwargs):
+    expected = run(round_group(img_path), 'make_stl_reference')
+    assert run(round_group(img_path), method, **kwargs) == expected
+
+
+@pytest.mark.parametrize('make_group', [square_group, round_group], ids=['square', 'round'])
+@pytest.mark.parametrize('solid', [False, True])
+@pytest.mark.parametrize('workers', [2, 3])
+def test_parallel_output_is_byte_identical(img_path, make_group, solid, workers):
+    expected = run(make_group(img_path, solid=solid), 'make_stl')
+    assert run(make_group(img_path, solid=solid), 'make_stl', workers=workers) == expected
@@ -0,0 +1,60 @@
+"""ply and 3mf files hold exactly the vertices and faces of the indexed mesh"""
+import zipfile
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+import pytest
+
+from stl_tools import export, indexed_mesh
+
+MODEL_NAMESPACE = '{http://schemas.microsoft.com/3dmanufacturing/core/2015/02}'
+
+
+@pytest.fixture
+def indexed():
+    img_arr = np.random.default_rng(0).integers(0, 4, (9, 7)).astype(np.uint8) * 50
+    return indexed_mesh.step_relief_indexed(img_arr, 0.5, 0.5, 0.02)
+
+
+def test_ply_counts_match_the_body(indexed, tmp_path):
+    path = tmp_path / 'out.ply'
+    assert export.save(indexed, str(path)) == path.stat().st_size
+
+    data = path.read_bytes()
+    head, body = data.split(b'end_header\n', 1)
+    lines = head.decode('ascii').splitlines()
+    assert lines[:2] == ['ply', 'format binary_little_endian 1.0']
+    counts = {line.split()[1]: int(line.split()[2]) for line in lines if line.startswith('element')}
+    assert counts == {'vertex': len(indexed.vertices), 'face': indexed.triangle_count}
+
+    vertex_bytes = counts['vertex'] * 12
+    assert len(body) == vertex_bytes + counts['face'] * export.PLY_FACE_DTYPE.itemsize
+    np.testing.assert_array_equal(np.frombuffer(body[:vertex_bytes], '<f4').reshape(-1, 3), indexed.vertices)
+    faces = np.frombuffer(body[vertex_bytes:], export.PLY_FACE_DTYPE)
+    assert (faces['count'] == 3).all()
+    np.testing.assert_array_equal(faces['vertex_indices'], indexed.faces)
+
+
+def test_3mf_model_parses(indexed, tmp_path):
+    path = tmp_path / 'out.3mf'
+    assert export.save(indexed, str(path)) == path.stat().st_size
+
+    with zipfile.ZipFile(path) as archive:
+        assert {'[Content_Types].xml', '_rels/.rels', '3D/3dmodel.model'} <= set(archive.namelist())
+        for name in ('[Content_Types].xml', '_rels/.rels'):
+            ElementTree.fromstring(archive.read(name))
+        model = ElementTree.fromstring(archive.read('3D/3dmodel.model'))
+
+    assert model.get('unit') == 'millimeter'
+    vertices = model.findall('.//{0}vertices/{0}vertex'.format(MODEL_NAMESPACE))
+    triangles = model.findall('.//{0}triangles/{0}triangle'.format(MODEL_NAMESPACE))
+    assert (len(vertices), len(triangles)) == (len(indexed.vertices), indexed.triangle_count)
+
+    xyz = np.array([[float(v.get(axis)) for axis in 'xyz'] for v in vertices], dtype=np.float32)
+    np.testing.assert_array_equal(xyz, indexed.vertices)
+    np.testing.assert_array_equal([[int(t.get(key)) for key in ('v1', 'v2', 'v3')] for t in triangles], indexed.faces)
+
+
+def test_unknown_extension(indexed, tmp_path):
+    with pytest.raises(ValueError):
+        export.save(indexed, str(tmp_path / 'out.obj'))
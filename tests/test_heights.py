@@ -0,0 +1,80 @@
+"""height map input: precision of float grids and images without any height"""
+import numpy as np
+import pytest
+from PIL import Image
+
+from stl_tools import ingest, resample, stl_tools, stl_tools_2
+
+
+def test_float64_grid_keeps_its_precision(tmp_path):
+    path = tmp_path / 'dem.npy'
+    grid = 1000.0 + np.arange(12, dtype=np.float64).reshape(3, 4) * 1e-6
+    np.save(path, grid)
+
+    heights = ingest.load_heights(str(path))
+    assert heights.dtype == np.float64
+    np.testing.assert_array_equal(heights, grid - grid.min())
+
+
+@pytest.mark.parametrize('dtype', [np.float16, np.float32])
+def test_small_float_grids_become_float32(tmp_path, dtype):
+    path = tmp_path / 'dem.npy'
+    np.save(path, np.arange(6, dtype=dtype).reshape(2, 3))
+    assert ingest.load_heights(str(path)).dtype == np.float32
+
+
+@pytest.mark.parametrize('solid', [False, True])
+def test_image_without_height_gives_a_flat_relief(tmp_path, solid):
+    path = tmp_path / 'blank.png'
+    Image.fromarray(np.zeros((6, 5), dtype=np.uint8)).save(path)
+
+    for group in (stl_tools.PixelGroup(str(path), solid=solid, emboss_width_mm=20, emboss_depth_mm=3),
+                  stl_tools_2.PixelGroup(str(path), 20, 3, solid=solid)):
+        assert group.dz == 0.0
+        indexed = group.make_indexed_mesh()
+        assert np.all(indexed.vertices[:, 2] <= 0.0)
+        assert np.isfinite(indexed.vertices).all()
+
+
+def load_with_z_min(tmp_path, arr, z_min):
+    path = tmp_path / 'grid.npy'
+    np.save(path, arr)
+    return ingest.load_heights(str(path), z_min=z_min)
+
+
+@pytest.mark.parametrize('z_min', [-10, -10.0])
+def test_z_min_below_an_image_widens_the_dtype(tmp_path, z_min):
+    arr = np.array([[0, 128, 255]], dtype=np.uint8)
+    heights = load_with_z_min(tmp_path, arr, z_min)
+    assert heights.dtype == np.uint16
+    np.testing.assert_array_equal(heights, [[10, 138, 265]])
+
+
+def test_z_min_below_an_int16_grid(tmp_path):
+    arr = np.array([[-32768, 0, 32767]], dtype=np.int16)
+    heights = load_with_z_min(tmp_path, arr, -40000)
+    assert heights.dtype == np.uint32
+    np.testing.assert_array_equal(heights, [[7232, 40000, 72767]])
+
+
+def test_integer_heights_keep_a_compact_dtype(tmp_path):
+    heights = load_with_z_min(tmp_path, np.array([[-5, 0, 300]], dtype=np.int16), None)
+    assert heights.dtype == np.uint16
+    np.testing.assert_array_equal(heights, [[0, 5, 305]])
+
+
+def test_fractional_z_min_gives_fractional_heights(tmp_path):
+    heights = load_with_z_min(tmp_path, np.array([[0, 1, 255]], dtype=np.uint8), 0.5)
+    assert heights.dtype == np.float32
+    np.testing.assert_array_equal(heights, [[0.0, 0.5, 254.5]])
+
+
+@pytest.mark.parametrize('method', ['mean', 'max'])
+def test_resampling_keeps_float64_precision(method):
+    grid = 1000.0 + np.arange(36, dtype=np.float64).reshape(6, 6) * 1e-6
+    pooled = resample.pool(grid, 2, method)
+    assert pooled.dtype == np.float64
+    blocks = grid.reshape(3, 2, 3, 2)
+    expected = blocks.max(axis=(1, 3)) if method == 'max' else blocks.mean(axis=(1, 3))
+    np.testing.assert_allclose(pooled, expected, rtol=0, atol=1e-12)
+    assert resample.pool(grid.astype(np.float16), 2, method).dtype == np.float32
@@ -0,0 +1,96 @@
+"""PixelGroup.rescale must give what a new PixelGroup of the new size gives"""
+import numpy as np
+import pytest
+from PIL import Image
+
+from stl_tools import cache, stl_tools, stl_tools_2
+
+
+def square_group(img_path, width_mm, depth_mm, **kwargs):
+    return stl_tools.PixelGroup(img_path, emboss_width_mm=width_mm, emboss_depth_mm=depth_mm, **kwargs)
+
+
+def round_group(img_path, width_mm, depth_mm, **kwargs):
+    return stl_tools_2.PixelGroup(img_path, width_mm, depth_mm, **kwargs)
+
+
+GROUPS = [square_group, round_group]
+
+
+@pytest.fixture
+def img_path(tmp_path):
+    rng = np.random.default_rng(0)
+    blocks = rng.integers(0, 5, (12, 10)).astype(np.uint8) * 50
+    path = tmp_path / 'relief.png'
+    Image.fromarray(np.kron(blocks, np.ones((4, 4), dtype=np.uint8))).save(path)
+    return str(path)
+
+
+@pytest.fixture
+def grid_path(tmp_path):
+    rng = np.random.default_rng(1)
+    path = tmp_path / 'grid.npy'
+    np.save(path, rng.normal(100.0, 30.0, (40, 33)).astype(np.float32))
+    return str(path)
+
+
+def assert_same_mesh(indexed, expected):
+    np.testing.assert_array_equal(indexed.faces, expected.faces)
+    np.testing.assert_array_equal(indexed.vertices, expected.vertices)
+
+
+@pytest.mark.parametrize('make_group', GROUPS)
+@pytest.mark.parametrize('solid', [False, True])
+@pytest.mark.parametrize('path_fixture', ['img_path', 'grid_path'])
+def test_rescaled_relief_matches_new_generation(make_group, solid, path_fixture, request):
+    path = request.getfixturevalue(path_fixture)
+    group = make_group(path, 50.0, 3.0, solid=solid)
+    relief = group.make_relief_indexed()
+
+    for width_mm, depth_mm in ((200.0, 3.0), (200.0, 0.7), (13.3, 11.0)):
+        relief = group.rescale(width_mm, depth_mm, relief=relief)
+        fresh = make_group(path, width_mm, depth_mm, solid=solid)
+        assert (group.dx, group.dy, group.dz) == (fresh.dx, fresh.dy, fresh.dz)
+        assert group.resolution == fresh.resolution
+        assert_same_mesh(relief, fresh.make_relief_indexed())
+        assert_same_mesh(group.make_indexed_mesh(relief), fresh.make_indexed_mesh())
+
+
+@pytest.mark.parametrize('make_group', GROUPS)
+def test_rescale_resamples_again_when_the_cell_size_needs_it(make_group, img_path):
+    group = make_group(img_path, 50.0, 3.0, cell_mm=2.0)
+    relief = group.make_relief_indexed()
+    assert group.resolution['factor'] > 1
+
+    assert group.rescale(200.0, relief=relief) is None
+    fresh = make_group(img_path, 200.0, 3.0, cell_mm=2.0)
+    assert group.resolution == fresh.resolution
+    assert_same_mesh(group.make_relief_indexed(), fresh.make_relief_indexed())
+
+
+@pytest.mark.parametrize('make_group', GROUPS)
+def test_rescale_keeps_the_triangle_budget(make_group, img_path):
+    group = make_group(img_path, 50.0, 3.0, max_triangles=2000)
+    relief = group.make_relief_indexed()
+
+    relief = group.rescale(200.0, relief=relief)
+    fresh = make_group(img_path, 200.0, 3.0, max_triangles=2000)
+    assert relief is not None
+    assert group.resolution == fresh.resolution
+    assert_same_mesh(relief, fresh.make_relief_indexed())
+
+
+@pytest.mark.parametrize('make_group', GROUPS)
+def test_cached_relief_is_rescaled_like_a_new_generation(make_group, img_path, tmp_path):
+    result_cache = cache.ResultCache(str(tmp_path / 'cache'))
+    make_group(img_path, 50.0, 3.0, solid=True).make_output(cache=result_cache)
+
+    out_path = str(tmp_path / 'out.stl')
+    group = make_group(img_path, 120.0, 4.0, solid=True)
+    summary = result_cache.save_output(group, out_path)
+    assert not summary['cache_hit']
+
+    expected = make_group(img_path, 120.0, 4.0, solid=True).make_indexed_mesh()
+    with open(out_path, 'rb') as fh:
+        facets = np.frombuffer(fh.read()[84:], dtype=stl_tools.mesh.Mesh.dtype)
+    np.testing.assert_array_equal(facets['vectors'], expected.vectors())
@@ -0,0 +1,60 @@
+"""request checks of the conversion service that are answered before any job reaches the pool"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from stl_tools import service
+
+
+async def request(head):
+    """send a request head to a service without workers, returns the status and the json body"""
+    conversion = service.ConversionService(workers=1, max_upload_bytes=1000)
+    server = await asyncio.start_server(conversion.handle, '127.0.0.1', 0)
+    try:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(head.encode('latin-1'))
+        await writer.drain()
+        # a request the service fails to answer would leave the connection open
+        response = await asyncio.wait_for(reader.read(), 10)
+        writer.close()
+    finally:
+        server.close()
+        await server.wait_closed()
+
+    status_line, body = response.split(b'\r\n', 1)[0], response.split(b'\r\n\r\n', 1)[1]
+    return int(status_line.split()[1]), json.loads(body)
+
+
+def convert_head(content_length):
+    return 'POST /convert?name=logo.png HTTP/1.1\r\nHost: localhost\r\nContent-Length: {}\r\n\r\n'.format(
+        content_length)
+
+
+@pytest.mark.parametrize('content_length', ['abc', '-5', '+5', '1_0', '', '2.5'])
+def test_malformed_content_length_is_a_bad_request(content_length):
+    status, body = asyncio.run(request(convert_head(content_length)))
+    assert status == 400
+    assert 'Content-Length' in body['error']
+
+
+def test_oversized_upload_is_refused():
+    status, body = asyncio.run(request(convert_head(1001)))
+    assert status == 413
+
+
+def test_missing_content_length():
+    status, body = asyncio.run(request('POST /convert?name=logo.png HTTP/1.1\r\nHost: localhost\r\n\r\n'))
+    assert status == 411
+
+
+def test_warm_up_imports_the_pipeline():
+    # in a fresh interpreter, the test session has imported everything already
+    script = ('import sys; from stl_tools import service; service.warm_up(); '
+              'print(all(name in sys.modules for name in ("stl_tools.stl_tools", "stl_tools.stl_tools_2")))')
+    result = subprocess.run([sys.executable, '-c', script], check=True, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.stdout.strip() == 'True'
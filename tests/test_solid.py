@@ -0,0 +1,103 @@
+"""solid meshes must be closed and consistently oriented, on images with many height levels too"""
+import os
+import shutil
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from stl_tools import indexed_mesh, stl_tools, stl_tools_2, validate
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MARIO = os.path.join(HERE, os.pardir, 'stl_tools', 'misc', 'mario.jpg')
+
+
+def save_png(tmp_path, name, pixels):
+    path = tmp_path / '{}.png'.format(name)
+    Image.fromarray(np.asarray(pixels, dtype=np.uint8)).save(path)
+    return str(path)
+
+
+IMAGES = {
+    'steps': [[10, 20], [30, 40]],
+    'saddle': [[10, 20], [20, 10]],
+    'saddle_b': [[20, 10], [10, 20]],
+    'single': [[7]],
+    'random': np.random.default_rng(0).integers(0, 5, (15, 11)) * 40,
+    'random_fine': np.random.default_rng(1).integers(1, 255, (9, 13)),
+}
+
+
+def square_engines():
+    def make_output(group):
+        group.make_output()
+        return group.output_path
+
+    def run(method, **kwargs):
+        def engine(group):
+            getattr(group, method)(**kwargs)
+            return group.output_stl_path
+        return engine
+
+    return {
+        'make_stl': run('make_stl'),
+        'streaming': run('make_stl_streaming', band_width=3),
+        'indexed': run('make_stl_indexed'),
+        'output': make_output,
+        'adaptive': run('make_stl_adaptive'),
+        'parallel': run('make_stl', workers=2),
+        'smooth': run('make_stl_smooth'),
+    }
+
+
+def assert_closed_and_outward(path):
+    report = validate.check_stl(path)
+    assert (report['boundary_edges'], report['non_manifold_edges']) == (0, 0)
+    assert report['closed']
+
+    # every directed edge once: neighboring faces agree on their orientation
+    indexed = indexed_mesh.IndexedMesh.from_vectors(stl_tools.mesh.Mesh.from_file(path).vectors)
+    faces = indexed.faces
+    edges = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+    assert len(np.unique(edges, axis=0)) == len(edges)
+
+    # and outwards: positive volume
+    vectors = indexed.vertices[faces].astype(np.float64)
+    assert np.einsum('ij,ij->i', vectors[:, 0], np.cross(vectors[:, 1], vectors[:, 2])).sum() > 0
+
+
+@pytest.mark.parametrize('engine', sorted(square_engines()))
+@pytest.mark.parametrize('name', sorted(IMAGES))
+def test_square_solid_is_closed(tmp_path, name, engine):
+    if engine == 'smooth' and min(np.shape(IMAGES[name])) < 2:
+        pytest.skip('the smooth surface runs through pixel centers, it needs at least 2 x 2 pixels')
+    group = stl_tools.PixelGroup(save_png(tmp_path, name, IMAGES[name]), solid=True, emboss_width_mm=20,
+                                 emboss_depth_mm=3)
+    assert_closed_and_outward(square_engines()[engine](group))
+
+
+@pytest.mark.parametrize('engine', ['make_stl', 'adaptive'])
+def test_square_solid_photo_is_closed(tmp_path, engine):
+    path = tmp_path / 'mario.jpg'
+    shutil.copyfile(MARIO, path)
+    group = stl_tools.PixelGroup(str(path), solid=True, emboss_width_mm=100, emboss_depth_mm=5)
+    assert_closed_and_outward(square_engines()[engine](group))
+
+
+@pytest.mark.parametrize('name', ['random', 'random_fine'])
+def test_round_solid_is_closed(tmp_path, name):
+    group = stl_tools_2.PixelGroup(save_png(tmp_path, name, np.kron(IMAGES[name], np.ones((3, 3)))), 20, 3,
+                                   solid=True)
+    group.make_stl()
+    assert_closed_and_outward(group.output_stl_path)
+
+
+def test_saddle_dent_volume():
+    # the dent lowers a SADDLE_DENT sized triangle of one high pixel to the higher low pixel
+    img_arr = np.array([[10, 20], [20, 10]], dtype=np.uint8)
+    relief = indexed_mesh.step_relief_solid_indexed(img_arr, 1.0, 1.0, 1.0)
+    vectors = relief.vectors().astype(np.float64)
+    top_area = 0.5 * np.cross(vectors[:, 1] - vectors[:, 0], vectors[:, 2] - vectors[:, 0])[:, 2]
+    heights = vectors[:, :, 2].mean(axis=1)
+    volume = np.sum(np.where(top_area > 0, top_area, 0.0) * heights)
+    assert volume == pytest.approx(60.0 - indexed_mesh.SADDLE_DENT ** 2 / 2 * (20 - 10))
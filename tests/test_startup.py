@@ -0,0 +1,20 @@
+"""the startup benchmark flags slower PixelGroup construction, not only slower imports"""
+from stl_tools.benchmarks import startup
+
+BASELINE = {'stl_tools.stl_tools': {'import_seconds': 0.2, 'startup_seconds': 0.1, 'process_seconds': 0.4}}
+
+
+def result(**timings):
+    return dict(BASELINE['stl_tools.stl_tools'], previews=0, forbidden=[], **timings)
+
+
+def test_startup_regression_is_found():
+    found = startup.problems('stl_tools.stl_tools', result(startup_seconds=0.2), BASELINE)
+    assert len(found) == 1 and 'startup_seconds' in found[0]
+
+
+def test_timings_within_tolerance_or_noise_pass():
+    assert startup.problems('stl_tools.stl_tools', result(startup_seconds=0.12), BASELINE) == []
+    tiny = {'stl_tools.cli': {'import_seconds': 0.2, 'startup_seconds': 1e-7, 'process_seconds': 0.4}}
+    assert startup.problems('stl_tools.cli', dict(tiny['stl_tools.cli'], startup_seconds=1e-6, previews=0,
+                                                  forbidden=[]), tiny) == []
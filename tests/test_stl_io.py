@@ -0,0 +1,54 @@
+"""the streaming stl writer patches its header count, merged files keep every facet"""
+import struct
+
+import numpy as np
+from stl import mesh
+
+from stl_tools import stl_io
+
+
+def triangles(count, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, 3, 3)).astype(np.float32)
+
+
+def header_count(path):
+    with open(path, 'rb') as fh:
+        return struct.unpack('<I', fh.read(stl_io.HEADER_SIZE + stl_io.COUNT_SIZE)[stl_io.HEADER_SIZE:])[0]
+
+
+def test_stream_writer_patches_the_count(tmp_path):
+    path = str(tmp_path / 'out.stl')
+    chunks = [triangles(5, 0), triangles(0, 1), triangles(17, 2)]
+    with stl_io.StlStreamWriter(path) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+
+    assert header_count(path) == writer.triangle_count == 22
+    assert (tmp_path / 'out.stl').stat().st_size == writer.bytes_written == 84 + 22 * 50
+    # a binary stl must not look like an ascii one
+    assert not (tmp_path / 'out.stl').read_bytes().startswith(b'solid')
+    np.testing.assert_array_equal(stl_io.read_facets(path)['vectors'], np.concatenate(chunks))
+    np.testing.assert_array_equal(mesh.Mesh.from_file(path).vectors, np.concatenate(chunks))
+
+
+def test_expected_count_is_in_the_header_while_writing(tmp_path):
+    path = str(tmp_path / 'out.stl')
+    with stl_io.StlStreamWriter(path, expected_count=4) as writer:
+        writer.write(triangles(4))
+        writer._file.flush()
+        assert header_count(path) == 4
+    assert header_count(path) == 4
+
+
+def test_merge_stl(tmp_path):
+    paths = []
+    for i, count in enumerate((3, 0, 8)):
+        paths.append(str(tmp_path / '{}.stl'.format(i)))
+        with stl_io.StlStreamWriter(paths[-1]) as writer:
+            writer.write(triangles(count, i))
+
+    out_path = str(tmp_path / 'merged.stl')
+    assert stl_io.merge_stl(paths, out_path, chunk_size=2) == (tmp_path / 'merged.stl').stat().st_size
+    assert header_count(out_path) == 11
+    np.testing.assert_array_equal(stl_io.read_facets(out_path)['vectors'],
+                                  np.concatenate([triangles(3, 0), triangles(8, 2)]))
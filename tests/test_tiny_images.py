@@ -0,0 +1,44 @@
+"""images too small to have a cell (or a second row or column) still go through every engine"""
+import numpy as np
+import pytest
+from PIL import Image
+
+from stl_tools import stl_tools, stl_tools_2
+
+SHAPES = [(1, 1), (2, 2), (1, 5), (5, 1)]
+
+
+@pytest.fixture(params=SHAPES, ids=lambda shape: '{}x{}'.format(*shape))
+def img_path(request, tmp_path):
+    height, width = request.param
+    path = tmp_path / 'tiny.png'
+    Image.fromarray((np.arange(height * width).reshape(height, width) * 20 + 10).astype(np.uint8)).save(path)
+    return str(path)
+
+
+@pytest.mark.parametrize('solid', [False, True])
+def test_round_adaptive(img_path, solid):
+    group = stl_tools_2.PixelGroup(img_path, 20, 3, solid=solid)
+    report = group.make_stl_adaptive()
+    assert report['triangles'] == len(stl_tools.mesh.Mesh.from_file(group.output_stl_path).data)
+
+
+@pytest.mark.filterwarnings('error')
+@pytest.mark.parametrize('method', ['make_stl', 'make_stl_streaming', 'make_output'])
+def test_round_solid_without_rim(img_path, method):
+    group = stl_tools_2.PixelGroup(img_path, 20, 3, solid=True)
+    assert len(group.closing_vectors()) == 0
+    getattr(group, method)()
+    vectors = stl_tools.mesh.Mesh.from_file(group.output_path).vectors
+    assert np.isfinite(vectors).all()
+
+
+@pytest.mark.parametrize('make_group', [
+    lambda path: stl_tools.PixelGroup(path, emboss_width_mm=20, emboss_depth_mm=3),
+    lambda path: stl_tools_2.PixelGroup(path, 20, 3),
+], ids=['square', 'round'])
+def test_preview(img_path, make_group, tmp_path):
+    group = make_group(img_path)
+    preview_path = group.make_preview(str(tmp_path / 'preview.png'))
+    with Image.open(preview_path) as image:
+        assert image.size == (group.width, group.height)